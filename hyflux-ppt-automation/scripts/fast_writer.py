@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+HyFlux Fast Slide Writer
+Builds slide parts from precompiled per-layout XML skeletons.
+
+python-pptx's `slides.add_slide` clones the layout placeholders into a new
+XML tree for every slide and the populate step then edits that tree node by
+node through proxy objects. For a given layout the result only differs in
+the paragraphs of the filled placeholders, so this module does the
+python-pptx work once per layout: it builds a slide the normal way, records
+its XML split around each placeholder's paragraphs, and afterwards renders a
+slide by joining those strings with escaped paragraph markup.
+
+The rendered slide parts, their layout relationship and the presentation's
+slide list entries are added to the package directly, producing the same
+part names, relationship ids and XML bytes as the python-pptx path.
+StreamingSlideWriter instead writes each slide to the output zip as soon as
+it is rendered (see package_writer.StreamingPackage).
+"""
+
+import copy
+import re
+from xml.sax.saxutils import escape
+
+from lxml import etree
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.package import Part
+from pptx.opc.packuri import PackURI
+from pptx.parts.slide import SlidePart
+from pptx.text.text import TextFrame
+
+from package_writer import StreamedPart
+
+SLIDE_PARTNAME = '/ppt/slides/slide%d.xml'
+
+# Comments placed around each placeholder's text body before serializing
+_MARK = 'hyflux:%d:%s'
+_MARK_RE = re.compile(r'<!--hyflux:(\d+):(open|paras|close|end)-->')
+
+# Control characters python-pptx writes as _xHHHH_ (tab and line feed excepted)
+_CTRL_RE = re.compile(r'[\x00-\x08\x0B-\x1F]')
+_BREAK_RE = re.compile('\n|\v')
+
+
+def _escape_text(text):
+    text = _CTRL_RE.sub(lambda match: '_x%04X_' % ord(match.group()), text)
+    return escape(text)
+
+
+def _runs(text):
+    """Runs and line breaks of one paragraph, as CT_TextParagraph.append_text writes them."""
+    out = []
+    for index, run in enumerate(_BREAK_RE.split(text)):
+        if index:
+            out.append('<a:br/>')
+        if run:
+            out.append(f'<a:r><a:t>{_escape_text(run)}</a:t></a:r>')
+    return ''.join(out)
+
+
+def text_paragraphs(text):
+    """Paragraph XML for `text_frame.text = text` (one paragraph per line)."""
+    out = []
+    for line in text.split('\n'):
+        runs = _runs(line)
+        out.append(f'<a:p>{runs}</a:p>' if runs else '<a:p/>')
+    return ''.join(out)
+
+
+def content_paragraphs(content):
+    """Paragraph XML appended by HyFluxPPTGenerator._set_text_content.
+
+    Mirrors its line handling: bullet characters are stripped, blank lines
+    become empty paragraphs, and a plain line continues the previous
+    paragraph after a line break unless that one ends with ':', '.' or '!'.
+    """
+    paragraphs = []
+    for line in content.strip().split('\n'):
+        line = line.rstrip()
+        stripped = line.strip()
+        if not stripped:
+            paragraphs.append('')
+        elif stripped.startswith('•') or stripped.startswith('-'):
+            for char in ('•', '-', '*'):
+                if stripped.startswith(char):
+                    stripped = stripped[1:].strip()
+                    break
+            paragraphs.append(stripped)
+        elif paragraphs and paragraphs[-1] and not paragraphs[-1].endswith((':', '.', '!')):
+            paragraphs[-1] += '\n' + stripped
+        else:
+            paragraphs.append(stripped)
+    return ''.join(f'<a:p><a:pPr/>{_runs(text)}</a:p>' for text in paragraphs)
+
+
+class SlideSkeleton:
+    """A layout's blank slide XML, split around the paragraphs of each placeholder.
+
+    Placeholders are referred to by their position among the slide's shapes.
+    Roles used by the generator:
+
+        title        the title placeholder (idx 0), or None
+        subtitle     the first placeholder with idx 1, or None
+        text_slots   placeholders with a text frame and idx > 0, in shape order
+        first_text   the first shape with a text frame, or None
+    """
+
+    def __init__(self, slide_layout):
+        self.layout_part = slide_layout.part
+        scratch = SlidePart.new(PackURI(SLIDE_PARTNAME % 1), self.layout_part.package, self.layout_part)
+        scratch.slide.shapes.clone_layout_placeholders(slide_layout)
+        # Every slide of this layout has the same single relationship
+        self.rels_xml = scratch.rels.xml
+
+        self.title = self.subtitle = self.first_text = None
+        self.text_slots = []
+        self.texts = {}  # slot -> text as cloned, for `shape.text +=`
+        self.created = set()  # slots whose text body only exists once the frame is used
+        for position, shape in enumerate(scratch.slide.shapes):
+            idx = shape.placeholder_format.idx if shape.is_placeholder else None
+            if idx == 0 and self.title is None:
+                self.title = position
+            if idx == 1 and self.subtitle is None:
+                self.subtitle = position
+            if not shape.has_text_frame:
+                continue
+            if self.first_text is None:
+                self.first_text = position
+            if idx is not None and idx > 0:
+                self.text_slots.append(position)
+            if shape._element.txBody is None:
+                self.created.add(position)
+                self.texts[position] = ''
+            else:
+                self.texts[position] = shape.text_frame.text
+
+        # Serialized as cloned, and with every text frame cleared as _set_text_content does
+        self.statics, self.slots = self._split(self._marked(scratch._element, clear=False))
+        _, cleared = self._split(self._marked(scratch._element, clear=True))
+        self.cleared = {position: paras for position, (_, paras, _) in cleared.items()}
+
+    def _marked(self, sld, clear):
+        """Slide XML with comments around each text body and its paragraphs."""
+        sld = copy.deepcopy(sld)
+        for position, sp in enumerate(sld.cSld.spTree.iter_shape_elms()):
+            if position not in self.texts:
+                continue
+            txBody = sp.get_or_add_txBody()
+            if clear:
+                TextFrame(txBody, None).clear()
+            txBody.addprevious(etree.Comment(_MARK % (position, 'open')))
+            p_lst = txBody.p_lst
+            if p_lst:
+                p_lst[0].addprevious(etree.Comment(_MARK % (position, 'paras')))
+                p_lst[-1].addnext(etree.Comment(_MARK % (position, 'close')))
+            else:
+                txBody.append(etree.Comment(_MARK % (position, 'paras')))
+                txBody.append(etree.Comment(_MARK % (position, 'close')))
+            txBody.addnext(etree.Comment(_MARK % (position, 'end')))
+        return serialize_part_xml(sld).decode('utf-8')
+
+    @staticmethod
+    def _split(xml):
+        """([static text between slots], {slot: (text body head, paragraphs, text body tail)})."""
+        tokens = _MARK_RE.split(xml)
+        statics, slots = [tokens[0]], {}
+        # tokens repeat as: position, kind, text up to the next mark
+        for i in range(1, len(tokens), 12):
+            position = int(tokens[i])
+            head, paras, tail, static = tokens[i + 2], tokens[i + 5], tokens[i + 8], tokens[i + 11]
+            slots[position] = (head, paras, tail)
+            statics.append(static)
+        return statics, slots
+
+    def render(self, fills):
+        """Slide part XML with `fills` applied.
+
+        fills maps a slot to ('text', str) for `shape.text = str`, or to
+        ('content', str) for _set_text_content(shape.text_frame, str).
+        Slots left out keep their cloned (empty) text.
+        """
+        out = [self.statics[0]]
+        for (position, (head, paras, tail)), static in zip(self.slots.items(), self.statics[1:]):
+            fill = fills.get(position)
+            if fill is None:
+                if position not in self.created:
+                    out += (head, paras, tail)
+            else:
+                mode, text = fill
+                if mode == 'text':
+                    out += (head, text_paragraphs(text), tail)
+                elif text:
+                    out += (head, self.cleared[position], content_paragraphs(text), tail)
+                else:
+                    # the frame was used (and so created) but left as is
+                    out += (head, paras, tail)
+            out.append(static)
+        return ''.join(out).encode('utf-8')
+
+
+class FastSlideWriter:
+    """Appends skeleton-rendered slides to a Presentation's package.
+
+    Slides added here are plain package parts holding their XML, not
+    python-pptx Slide objects: they count in `prs.slides` and are saved
+    with the presentation, but cannot be edited through the shapes API.
+    """
+
+    def __init__(self, prs, skeletons=None):
+        """skeletons, if given, is a dict shared by writers on the same presentation."""
+        self.prs = prs
+        self._skeletons = {} if skeletons is None else skeletons
+        self._sldIdLst = prs.part._element.get_or_add_sldIdLst()
+        self._next_id = self._sldIdLst._next_id
+
+    def skeleton(self, slide_layout):
+        """The (cached) skeleton of a layout."""
+        key = slide_layout.part.partname
+        skeleton = self._skeletons.get(key)
+        if skeleton is None:
+            skeleton = self._skeletons[key] = SlideSkeleton(slide_layout)
+        return skeleton
+
+    def add_slide(self, skeleton, fills):
+        """Render a slide and add it at the end of the deck; returns its part."""
+        part = Part(self._next_partname(), CT.PML_SLIDE, self.prs.part.package, skeleton.render(fills))
+        part.relate_to(skeleton.layout_part, RT.SLIDE_LAYOUT)
+        self._append(part)
+        return part
+
+    def _next_partname(self):
+        return PackURI(SLIDE_PARTNAME % (len(self._sldIdLst) + 1))
+
+    def _append(self, part):
+        # A new part cannot already be related, so skip relate_to's scan for an existing rel
+        rId = self.prs.part.rels._add_relationship(RT.SLIDE, part)
+        self._sldIdLst._add_sldId(id=self._next_id, rId=rId)
+        self._next_id += 1
+
+
+class StreamingSlideWriter(FastSlideWriter):
+    """FastSlideWriter that writes each slide to a StreamingPackage as it is built.
+
+    The presentation only keeps a StreamedPart (name and content type) per
+    slide, so memory does not grow with the slides' XML.
+    """
+
+    def __init__(self, prs, package, skeletons=None):
+        super().__init__(prs, skeletons)
+        self.package = package
+
+    def add_slide(self, skeleton, fills):
+        partname = self._next_partname()
+        self.package.write(partname.membername, skeleton.render(fills))
+        self.package.write(partname.rels_uri.membername, skeleton.rels_xml)
+        part = StreamedPart(partname, CT.PML_SLIDE, self.prs.part.package)
+        self._append(part)
+        return part
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+HyFlux Package Optimizer
+Per-part size analysis and media optimization for generated .pptx packages.
+"""
+
+import hashlib
+import io
+import os
+import posixpath
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from pathlib import Path
+from xml.etree import ElementTree as ET
+
+from lxml import etree
+from pptx.opc.oxml import serialize_part_xml
+
+CONTENT_TYPES_PART = '[Content_Types].xml'
+
+NS = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+    'ct': 'http://schemas.openxmlformats.org/package/2006/content-types',
+}
+
+# Partname prefix -> report category (first match wins)
+PART_CATEGORIES = [
+    ('ppt/media/', 'media'),
+    ('ppt/embeddings/', 'media'),
+    ('ppt/slideLayouts/', 'layouts'),
+    ('ppt/slideMasters/', 'masters'),
+    ('ppt/slides/', 'slides'),
+    ('ppt/notesSlides/', 'notes'),
+    ('ppt/notesMasters/', 'notes'),
+    ('ppt/handoutMasters/', 'notes'),
+    ('ppt/theme/', 'themes'),
+]
+
+# Raster formats Pillow can safely downsample / recompress
+RASTER_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff'}
+
+EMU_PER_INCH = 914400
+
+# PNG ancillary chunks carried over when an image is recompressed: colour
+# space, text, EXIF and timestamps (pHYs only while the pixel size is kept)
+PNG_METADATA_CHUNKS = (b'gAMA', b'cHRM', b'sRGB', b'iCCP', b'sBIT', b'pHYs',
+                       b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME')
+
+
+def _categorize(partname):
+    """Map a zip entry name to a report category."""
+    if partname == CONTENT_TYPES_PART or partname.endswith('.rels'):
+        return 'relationships'
+    for prefix, category in PART_CATEGORIES:
+        if partname.startswith(prefix):
+            return category
+    return 'other'
+
+
+def _rels_name(partname):
+    """Return the .rels entry name for a part ('' for the package itself)."""
+    directory, name = posixpath.split(partname)
+    return posixpath.join(directory, '_rels', name + '.rels')
+
+
+def _read_rels(zf, partname, names):
+    """Return [(rId, target_partname, element)] for a part's internal relationships."""
+    rels_name = _rels_name(partname)
+    if rels_name not in names:
+        return []
+
+    base_dir = posixpath.dirname(partname)
+    root = ET.fromstring(zf.read(rels_name))
+    rels = []
+    for rel in root.findall('rel:Relationship', NS):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target', '')
+        if target.startswith('/'):
+            target_name = target.lstrip('/')
+        else:
+            target_name = posixpath.normpath(posixpath.join(base_dir, target))
+        rels.append((rel.get('Id'), target_name, rel))
+    return rels
+
+
+def _reachable_parts(zf, names):
+    """Walk the relationship graph from the package root."""
+    reachable = set()
+    pending = [target for _, target, _ in _read_rels(zf, '', names)]
+    while pending:
+        partname = pending.pop()
+        if partname in reachable or partname not in names:
+            continue
+        reachable.add(partname)
+        pending.extend(target for _, target, _ in _read_rels(zf, partname, names))
+    return reachable
+
+
+def analyze_package(pptx_path):
+    """Break a .pptx package down by part category.
+
+    Returns a dict with the total size, per-category byte counts
+    (uncompressed and compressed), the largest parts and any parts that
+    are not reachable from the package relationships.
+    """
+    pptx_path = Path(pptx_path)
+    categories = defaultdict(lambda: {'count': 0, 'bytes': 0, 'compressed': 0})
+    parts = []
+
+    with zipfile.ZipFile(pptx_path) as zf:
+        infos = zf.infolist()
+        names = {info.filename for info in infos}
+        reachable = _reachable_parts(zf, names)
+
+        unreferenced = []
+        for info in infos:
+            if info.is_dir():
+                continue
+            category = _categorize(info.filename)
+            entry = categories[category]
+            entry['count'] += 1
+            entry['bytes'] += info.file_size
+            entry['compressed'] += info.compress_size
+            parts.append({
+                'name': info.filename,
+                'category': category,
+                'bytes': info.file_size,
+                'compressed': info.compress_size,
+            })
+            if category != 'relationships' and info.filename not in reachable:
+                unreferenced.append(parts[-1])
+
+    parts.sort(key=lambda p: p['compressed'], reverse=True)
+    return {
+        'path': str(pptx_path),
+        'file_size': pptx_path.stat().st_size,
+        'categories': dict(categories),
+        'largest_parts': parts[:10],
+        'unreferenced': unreferenced,
+        'unreferenced_bytes': sum(p['compressed'] for p in unreferenced),
+    }
+
+
+def format_analysis(analysis):
+    """Render an analysis dict as report lines."""
+    lines = [f"Package size: {analysis['file_size'] / 1024:.1f} KB"]
+    for category, entry in sorted(analysis['categories'].items(),
+                                  key=lambda item: item[1]['compressed'], reverse=True):
+        lines.append(
+            f"  {category:<14}{entry['count']:>5} parts  "
+            f"{entry['compressed'] / 1024:>9.1f} KB  "
+            f"({entry['bytes'] / 1024:.1f} KB uncompressed)"
+        )
+    if analysis['unreferenced']:
+        lines.append(
+            f"  unreferenced  {len(analysis['unreferenced']):>5} parts  "
+            f"{analysis['unreferenced_bytes'] / 1024:>9.1f} KB"
+        )
+    return lines
+
+
+def _displayed_extents(zf, names):
+    """Return {media_partname: (cx, cy)} with the largest on-slide extent per image.
+
+    Images used anywhere without a known extent (backgrounds, fills, charts)
+    map to None so they are never downsampled.
+    """
+    extents = {}
+    for partname in names:
+        if not partname.endswith('.xml') or not partname.startswith('ppt/'):
+            continue
+        rels = _read_rels(zf, partname, names)
+        media_rels = {rId: target for rId, target, _ in rels if target.startswith('ppt/media/')}
+        if not media_rels:
+            continue
+
+        root = ET.fromstring(zf.read(partname))
+        sized = set()
+        for pic in root.iter(f"{{{NS['p']}}}pic"):
+            blip = pic.find('.//a:blip', NS)
+            ext = pic.find('p:spPr/a:xfrm/a:ext', NS)
+            if blip is None or ext is None:
+                continue
+            target = media_rels.get(blip.get(f"{{{NS['r']}}}embed"))
+            if target is None:
+                continue
+            sized.add(target)
+            cx, cy = int(ext.get('cx', 0)), int(ext.get('cy', 0))
+
+            # Cropped pictures only show part of the source image
+            crop = pic.find('p:blipFill/a:srcRect', NS)
+            if crop is not None:
+                visible_x = 1 - (int(crop.get('l', 0)) + int(crop.get('r', 0))) / 100000
+                visible_y = 1 - (int(crop.get('t', 0)) + int(crop.get('b', 0))) / 100000
+                cx = int(cx / max(visible_x, 0.01))
+                cy = int(cy / max(visible_y, 0.01))
+
+            if target in extents:
+                extents[target] = _merge_extents(extents[target], (cx, cy))
+            else:
+                extents[target] = (cx, cy)
+
+        # Any other reference (background, shape fill, ...) has no known size
+        for target in set(media_rels.values()) - sized:
+            extents[target] = None
+    return extents
+
+
+def _merge_extents(first, second):
+    """Combine two displayed extents; an unknown (None) extent wins."""
+    if first is None or second is None:
+        return None
+    return (max(first[0], second[0]), max(first[1], second[1]))
+
+
+def _optimize_image(data, extent, target_dpi):
+    """Downsample and losslessly recompress one image; returns (bytes, action) or (None, None)."""
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return None, None
+
+    if getattr(image, 'is_animated', False):
+        return None, None
+
+    fmt = image.format
+    action = None
+    if extent is not None:
+        max_w = max(1, round(extent[0] / EMU_PER_INCH * target_dpi))
+        max_h = max(1, round(extent[1] / EMU_PER_INCH * target_dpi))
+        if image.width > max_w * 1.1 and image.height > max_h * 1.1:
+            scale = max(max_w / image.width, max_h / image.height)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.LANCZOS)
+            action = 'downsampled'
+
+    if action is None and fmt not in ('PNG', 'GIF', 'BMP', 'TIFF'):
+        # JPEG re-encoding is lossy; only touch it when it was resized
+        return None, None
+
+    out = io.BytesIO()
+    save_args = {'optimize': True}
+    if fmt == 'JPEG':
+        save_args['quality'] = 90
+        for key in ('icc_profile', 'exif'):
+            if key in image.info:
+                save_args[key] = image.info[key]
+    elif fmt == 'PNG':
+        save_args['compress_level'] = 9
+    try:
+        image.save(out, format=fmt, **save_args)
+    except Exception:
+        return None, None
+
+    result = out.getvalue()
+    if fmt == 'PNG':
+        result = _copy_png_metadata(data, result, resized=action is not None)
+    if len(result) >= len(data):
+        return None, None
+    return result, action or 'recompressed'
+
+
+def _png_chunks(data):
+    """Yield (type, raw chunk bytes including length and CRC) for a PNG file."""
+    pos = 8
+    while pos + 12 <= len(data):
+        length = int.from_bytes(data[pos:pos + 4], 'big')
+        end = pos + 12 + length
+        yield data[pos + 4:pos + 8], data[pos:end]
+        pos = end
+
+
+def _copy_png_metadata(original, optimized, resized=False):
+    """Carry the original's metadata chunks over into Pillow's re-encoded PNG.
+
+    Pillow only writes back the ICC profile and transparency, so gamma,
+    chromaticities, sRGB intent, text and EXIF would otherwise be lost.
+    Chunks are copied verbatim (CRC included) right after IHDR, which is a
+    valid position for all of them.
+    """
+    present = {kind for kind, _ in _png_chunks(optimized)}
+    if present & {b'sRGB', b'iCCP'}:
+        # A PNG carries one colour profile: keep the one Pillow wrote
+        present |= {b'sRGB', b'iCCP'}
+    if resized:
+        present.add(b'pHYs')
+
+    copied = [chunk for kind, chunk in _png_chunks(original)
+              if kind in PNG_METADATA_CHUNKS and kind not in present]
+    if not copied:
+        return optimized
+    header_end = 8 + 12 + int.from_bytes(optimized[8:12], 'big')  # signature + IHDR
+    return optimized[:header_end] + b''.join(copied) + optimized[header_end:]
+
+
+def optimize_package(pptx_path, output_path=None, target_dpi=220, downsample=True, recompress=True):
+    """Optimize a .pptx package.
+
+    - Drops parts that are unreachable from the package relationships
+    - Dedupes identical media parts by content hash and repoints relationships
+    - Downsamples images larger than their displayed size at target_dpi
+    - Losslessly recompresses PNG/GIF/BMP/TIFF images and re-deflates all parts;
+      PNG colour and text chunks and JPEG ICC / EXIF data are kept, other
+      formats keep only what Pillow writes back
+
+    Writes to output_path (or replaces pptx_path in place) and returns a
+    report dict with bytes saved and time spent.
+    """
+    start = time.perf_counter()
+    pptx_path = Path(pptx_path)
+    output_path = Path(output_path) if output_path else pptx_path
+    size_before = pptx_path.stat().st_size
+    report = {
+        'dropped': [],
+        'deduped': [],
+        'downsampled': [],
+        'recompressed': [],
+    }
+
+    with zipfile.ZipFile(pptx_path) as zf:
+        infos = [info for info in zf.infolist() if not info.is_dir()]
+        names = {info.filename for info in infos}
+        data = {info.filename: zf.read(info.filename) for info in infos}
+
+        # 1. Drop parts nothing refers to (e.g. leftover template slides)
+        reachable = _reachable_parts(zf, names)
+        for name in sorted(data):
+            if name == CONTENT_TYPES_PART or name.endswith('.rels') or name in reachable:
+                continue
+            report['dropped'].append({'part': name, 'bytes': len(data.pop(name))})
+            data.pop(_rels_name(name), None)
+        names = set(data)
+
+        # 2. Dedupe media by hash
+        canonical = {}
+        replaced = {}
+        for name in sorted(n for n in names if n.startswith('ppt/media/')):
+            digest = hashlib.sha256(data[name]).hexdigest()
+            if digest in canonical:
+                replaced[name] = canonical[digest]
+            else:
+                canonical[digest] = name
+
+        if replaced:
+            for name in list(data):
+                if not name.endswith('.rels'):
+                    continue
+                source = name.replace('_rels/', '').rsplit('.rels', 1)[0]
+                if source == '':
+                    continue
+                rels = _read_rels(zf, source, names)
+                if not any(target in replaced for _, target, _ in rels):
+                    continue
+                root = etree.fromstring(data[name])
+                base_dir = posixpath.dirname(source)
+                for rel in root.findall('rel:Relationship', NS):
+                    target = rel.get('Target', '')
+                    resolved = target.lstrip('/') if target.startswith('/') else \
+                        posixpath.normpath(posixpath.join(base_dir, target))
+                    if resolved in replaced:
+                        rel.set('Target', posixpath.relpath(replaced[resolved], base_dir))
+                data[name] = serialize_part_xml(root)
+
+            for duplicate, kept in replaced.items():
+                report['deduped'].append({'part': duplicate, 'kept': kept, 'bytes': len(data[duplicate])})
+                del data[duplicate]
+
+        removed = set(replaced) | {entry['part'] for entry in report['dropped']}
+        if removed:
+            data[CONTENT_TYPES_PART] = _drop_overrides(data[CONTENT_TYPES_PART], removed)
+
+        # 3. Downsample / recompress remaining raster media
+        if downsample or recompress:
+            extents = _displayed_extents(zf, names) if downsample else {}
+            for duplicate, kept in replaced.items():
+                if duplicate not in extents:
+                    continue
+                if kept in extents:
+                    extents[kept] = _merge_extents(extents[kept], extents[duplicate])
+                else:
+                    extents[kept] = extents[duplicate]
+
+            for name in sorted(n for n in data if n.startswith('ppt/media/')):
+                if posixpath.splitext(name)[1].lower() not in RASTER_EXTENSIONS:
+                    continue
+                optimized, action = _optimize_image(data[name], extents.get(name), target_dpi)
+                if optimized is None or (action == 'recompressed' and not recompress):
+                    continue
+                report[action].append({'part': name, 'before': len(data[name]), 'after': len(optimized)})
+                data[name] = optimized
+
+    # 4. Re-deflate everything at maximum compression
+    fd, tmp_name = tempfile.mkstemp(suffix='.pptx', dir=str(output_path.parent))
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_name, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as out:
+            # [Content_Types].xml must stay the first entry
+            ordered = [CONTENT_TYPES_PART] + [info.filename for info in infos
+                                              if info.filename in data and info.filename != CONTENT_TYPES_PART]
+            for name in ordered:
+                out.writestr(name, data[name])
+        os.replace(tmp_name, output_path)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+    size_after = output_path.stat().st_size
+    report.update({
+        'output': str(output_path),
+        'size_before': size_before,
+        'size_after': size_after,
+        'bytes_saved': size_before - size_after,
+        'elapsed': time.perf_counter() - start,
+    })
+    return report
+
+
+def format_optimization(report):
+    """Render an optimization report as report lines."""
+    saved = report['bytes_saved']
+    pct = (saved / report['size_before'] * 100) if report['size_before'] else 0
+    lines = [
+        f"Optimized: {report['output']}",
+        f"  Size:    {report['size_before'] / 1024:.1f} KB → {report['size_after'] / 1024:.1f} KB "
+        f"({saved / 1024:.1f} KB saved, {pct:.1f}%)",
+        f"  Time:    {report['elapsed'] * 1000:.0f} ms",
+        f"  Dropped parts:    {len(report['dropped'])}",
+        f"  Deduped media:    {len(report['deduped'])}",
+        f"  Downsampled:      {len(report['downsampled'])}",
+        f"  Recompressed:     {len(report['recompressed'])}",
+    ]
+    return lines
+
+
+def _drop_overrides(content_types_xml, removed_parts):
+    """Remove [Content_Types].xml overrides for parts that no longer exist."""
+    removed = {'/' + name for name in removed_parts}
+    # lxml keeps the parsed prefixes; serialize_part_xml writes standalone="yes" like python-pptx
+    root = etree.fromstring(content_types_xml)
+    for override in root.findall('ct:Override', NS):
+        if override.get('PartName') in removed:
+            root.remove(override)
+    return serialize_part_xml(root)
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+HyFlux Package Writer
+Saves a presentation by copying unchanged template entries compressed as-is.
+
+python-pptx's `prs.save` re-serializes every part and deflates it again,
+including the template's masters, layouts, theme and media, which come out
+byte-for-byte the same on every run. This writer serializes the parts the
+same way but, when a part (or .rels item) matches the template entry of the
+same name by size and CRC-32, copies that entry's already-compressed bytes
+into the output. Only new or modified parts are compressed, at a
+configurable level (0 stores them uncompressed).
+
+The output has the same entries, in the same order, with the same content
+as `prs.save` writes.
+
+StreamingPackage writes a deck while it is being built: slide parts go to
+the zip as soon as they are rendered and the presentation keeps only a
+StreamedPart (name and content type) for each, so no slide XML is held
+until the save. What remains per slide is the bookkeeping every writer
+needs: a relationship, a slide list entry and a zip directory record.
+The remaining parts are written by close().
+
+Usage:
+    python3 package_writer.py bench <content_spec.yaml> [--slides N] [--levels 0,1,6,9]
+    python3 package_writer.py memory <content_spec.yaml> [--slides 100,1000,5000]
+"""
+
+import argparse
+import io
+import os
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+from xml.sax.saxutils import escape
+
+from pptx.opc.constants import NAMESPACE
+from pptx.opc.package import Part, _Relationships
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+
+# zlib level for new and modified parts; 0 stores them uncompressed
+DEFAULT_COMPRESSLEVEL = 6
+
+# Sizes and offsets from here on, and entry counts from ZIP32_MAX_ENTRIES on,
+# are written as zip64 records (as zipfile does with allowZip64)
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+
+# Identical .rels items up to this size (one per slide layout) are compressed once per save
+COMPRESSED_CACHE_MAX = 4096
+COMPRESSED_CACHE_ENTRIES = 256
+
+_ENCRYPTED = 0x1
+_DATA_DESCRIPTOR = 0x8
+
+_XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+
+
+def _attr(value):
+    return '"' + escape(value, {'"': '&quot;'}) + '"'
+
+
+def content_types_xml(parts):
+    """[Content_Types].xml for `parts`, as python-pptx writes it (sorted Defaults, then Overrides)."""
+    defaults, overrides = _ContentTypesItem(parts)._defaults_and_overrides
+    items = [f'<Types xmlns="{NAMESPACE.OPC_CONTENT_TYPES}">']
+    items += (f'<Default Extension={_attr(ext)} ContentType={_attr(content_type)}/>'
+              for ext, content_type in sorted(defaults.items()))
+    items += (f'<Override PartName={_attr(partname)} ContentType={_attr(content_type)}/>'
+              for partname, content_type in sorted(overrides.items()))
+    items.append('</Types>')
+    return _XML_DECLARATION + ''.join(items).encode('utf-8')
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class PackageZip:
+    """Write-only zip archive that also accepts already-compressed entries.
+
+    Entries are written to `fp` as they are added; only their packed
+    central directory records are kept until close(). Zip64 extra fields and
+    end records are added only where a size, offset or the entry count
+    overflows the zip32 fields, so ordinary decks match zipfile's output.
+    """
+
+    def __init__(self, fp, date_time=None):
+        self.fp = fp
+        self.dos_time, self.dos_date = _dos_date_time(date_time or time.localtime()[:6])
+        self.entries = []  # central directory record + name, per entry
+        self.offset = 0
+
+    def add(self, name, data, compresslevel=DEFAULT_COMPRESSLEVEL):
+        """Add `data`, deflated at `compresslevel` (stored when 0); returns (compress_type, payload)."""
+        if compresslevel:
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            compress_type = zipfile.ZIP_DEFLATED
+        else:
+            payload, compress_type = data, zipfile.ZIP_STORED
+        self.add_raw(name, compress_type, zlib.crc32(data), len(data), payload)
+        return compress_type, payload
+
+    def add_raw(self, name, compress_type, crc, file_size, payload, flag_bits=0):
+        """Add an entry whose `payload` is already compressed with `compress_type`."""
+        encoded = name.encode('utf-8')
+        if not encoded.isascii():
+            flag_bits |= 0x800
+        compress_size = len(payload)
+
+        # The local header needs both sizes in its zip64 field if either overflows
+        local_zip64 = file_size >= ZIP32_LIMIT or compress_size >= ZIP32_LIMIT
+        local_extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size) if local_zip64 else b''
+        header = struct.pack(
+            zipfile.structFileHeader, zipfile.stringFileHeader, 45 if local_zip64 else 20, 0,
+            flag_bits, compress_type, self.dos_time, self.dos_date, crc,
+            ZIP32_LIMIT if local_zip64 else compress_size, ZIP32_LIMIT if local_zip64 else file_size,
+            len(encoded), len(local_extra)
+        )
+        self.fp.write(header)
+        self.fp.write(encoded)
+        self.fp.write(local_extra)
+        self.fp.write(payload)
+
+        # The central record carries only the overflowing fields, in this order
+        zip64_fields = [value for value in (file_size, compress_size, self.offset) if value >= ZIP32_LIMIT]
+        extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields) \
+            if zip64_fields else b''
+        version = 45 if zip64_fields else 20
+        record = struct.pack(
+            zipfile.structCentralDir, zipfile.stringCentralDir, version, 3, version, 0, flag_bits,
+            compress_type, self.dos_time, self.dos_date, crc, min(compress_size, ZIP32_LIMIT),
+            min(file_size, ZIP32_LIMIT), len(encoded), len(extra), 0, 0, 0, 0o600 << 16,
+            min(self.offset, ZIP32_LIMIT)
+        )
+        self.entries.append(record + encoded + extra)
+        self.offset += len(header) + len(encoded) + len(local_extra) + compress_size
+
+    def close(self):
+        """Write the central directory; returns the archive size."""
+        start = self.offset
+        for record in self.entries:
+            self.fp.write(record)
+            self.offset += len(record)
+        count, size = len(self.entries), self.offset - start
+        if count >= ZIP32_MAX_ENTRIES or size >= ZIP32_LIMIT or start >= ZIP32_LIMIT:
+            self.fp.write(struct.pack(
+                zipfile.structEndArchive64, zipfile.stringEndArchive64, zipfile.sizeEndCentDir64 - 12,
+                45, 45, 0, 0, count, count, size, start
+            ))
+            self.fp.write(struct.pack(
+                zipfile.structEndArchive64Locator, zipfile.stringEndArchive64Locator, 0, self.offset, 1
+            ))
+            self.offset += zipfile.sizeEndCentDir64 + zipfile.sizeEndCentDir64Locator
+        self.fp.write(struct.pack(
+            zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0, min(count, ZIP32_MAX_ENTRIES),
+            min(count, ZIP32_MAX_ENTRIES), min(size, ZIP32_LIMIT), min(start, ZIP32_LIMIT), 0
+        ))
+        self.offset += zipfile.sizeEndCentDir
+        return self.offset
+
+
+class TemplateArchive:
+    """The template's zip entries, readable as stored (still compressed)."""
+
+    def __init__(self, source):
+        """source is the template's path or its bytes."""
+        self._fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, 'rb')
+        with zipfile.ZipFile(self._fp) as zf:
+            self.infos = {
+                info.filename: info for info in zf.infolist()
+                # Only plain stored/deflated entries are safe to copy verbatim
+                if info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+                and not info.flag_bits & _ENCRYPTED
+            }
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def match(self, name, data):
+        """The template entry holding exactly `data` under `name`, or None."""
+        info = self.infos.get(name)
+        if info is None or info.file_size != len(data) or info.CRC != zlib.crc32(data):
+            return None
+        return info
+
+    def raw(self, info):
+        """The entry's compressed bytes, read past its local header."""
+        self._fp.seek(info.header_offset)
+        header = self._fp.read(zipfile.sizeFileHeader)
+        # The local header's name and extra field lengths can differ from the central directory's
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        self._fp.seek(name_length + extra_length, io.SEEK_CUR)
+        return self._fp.read(info.compress_size)
+
+
+class PackageWriter:
+    """Writes package items, copying the ones the template already holds."""
+
+    def __init__(self, fp, template, compresslevel=DEFAULT_COMPRESSLEVEL):
+        self.zip = PackageZip(fp)
+        self.template = template
+        self.compresslevel = compresslevel
+        self._rels_xml = {}  # relationship set -> .rels bytes
+        self._compressed = {}  # small item bytes -> (crc, payload)
+        self.report = {
+            'copied': 0, 'compressed': 0,
+            'copied_bytes': 0, 'compressed_bytes': 0,
+            'compression_ms': 0.0,
+        }
+
+    def write(self, name, data):
+        info = self.template.match(name, data) if self.template is not None else None
+        if info is not None:
+            self.zip.add_raw(name, info.compress_type, info.CRC, info.file_size,
+                             self.template.raw(info), info.flag_bits & ~_DATA_DESCRIPTOR)
+            self.report['copied'] += 1
+            self.report['copied_bytes'] += info.file_size
+            return
+        started = time.perf_counter()
+        cacheable = name.endswith('.rels') and len(data) <= COMPRESSED_CACHE_MAX
+        cached = self._compressed.get(data) if cacheable else None
+        if cached is not None:
+            self.zip.add_raw(name, cached[0], cached[1], len(data), cached[2])
+        else:
+            compress_type, payload = self.zip.add(name, data, self.compresslevel)
+            if cacheable and len(self._compressed) < COMPRESSED_CACHE_ENTRIES:
+                self._compressed[data] = (compress_type, zlib.crc32(data), payload)
+        self.report['compression_ms'] += (time.perf_counter() - started) * 1000
+        self.report['compressed'] += 1
+        self.report['compressed_bytes'] += len(data)
+
+    def write_part(self, part):
+        """A part and, if it has relationships, its .rels item."""
+        self.write(part.partname.membername, part.blob)
+        if part._rels:
+            self.write(part.partname.rels_uri.membername, self.rels_xml(part))
+
+    def write_package(self, package, parts, skip=()):
+        """[Content_Types].xml, the package .rels and every part but the `skip` types, in prs.save order."""
+        self.write(CONTENT_TYPES_URI.membername, content_types_xml(parts))
+        self.write(PACKAGE_URI.rels_uri.membername, package._rels.xml)
+        for part in parts:
+            if not isinstance(part, skip):
+                self.write_part(part)
+
+    def rels_xml(self, part):
+        """part.rels.xml, serialized once per distinct relationship set.
+
+        Slides built from the same layout all have the same single
+        relationship, and lxml serialization is most of their save cost.
+        """
+        rels = part.rels
+        key = (part.partname.baseURI,) + tuple(sorted(
+            (rel.rId, rel.reltype, rel.is_external, rel.target_ref if rel.is_external else rel.target_part.partname)
+            for rel in rels.values()
+        ))
+        xml = self._rels_xml.get(key)
+        if xml is None:
+            xml = self._rels_xml[key] = rels.xml
+        return xml
+
+    def close(self):
+        self.report['size'] = self.zip.close()
+        self.report['compression_ms'] = round(self.report['compression_ms'], 3)
+        return self.report
+
+
+def save_package(prs, output, template, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """Save `prs` to the `output` path or file object like prs.save does.
+
+    template is the path or bytes of the .pptx `prs` was opened from.
+    Returns {copied, compressed, copied_bytes, compressed_bytes,
+    compression_ms, size}.
+    """
+    package = prs.part.package
+    parts = tuple(package.iter_parts())
+    fp = open(output, 'wb') if isinstance(output, (str, Path)) else output
+    try:
+        with TemplateArchive(template) as archive:
+            writer = PackageWriter(fp, archive, compresslevel)
+            writer.write_package(package, parts)
+            return writer.close()
+    finally:
+        if fp is not output:
+            fp.close()
+
+
+class StreamedPart(Part):
+    """A part already written to the output: only its name and content type are kept."""
+
+    # Its .rels went out with it; sharing one empty collection keeps the save's
+    # walk of the package from creating one for every streamed slide
+    rels = _Relationships('/')
+
+
+class StreamingPackage:
+    """An output .pptx written while the deck is built.
+
+    Slide items are passed to write() as they are rendered; close() adds
+    everything else (copied from the template where unchanged) and the
+    zip directory. The file is written as `<output>.part` and renamed by
+    close(), so a failed build leaves no half-written deck behind.
+    """
+
+    def __init__(self, prs, output, template, compresslevel=DEFAULT_COMPRESSLEVEL):
+        self.prs = prs
+        self.output = Path(output)
+        self._partial = self.output.with_name(self.output.name + '.part')
+        self._archive = TemplateArchive(template)
+        self._fp = open(self._partial, 'wb')
+        self.writer = PackageWriter(self._fp, self._archive, compresslevel)
+        self.streamed = 0
+
+    def write(self, name, data):
+        self.writer.write(name, data)
+        self.streamed += 1
+
+    def close(self):
+        """Finish the package; returns the save_package report plus `streamed` items."""
+        try:
+            package = self.prs.part.package
+            self.writer.write_package(package, tuple(package.iter_parts()), skip=StreamedPart)
+            report = self.writer.close()
+            self._fp.close()
+            os.replace(self._partial, self.output)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._archive.close()
+        report['streamed'] = self.streamed
+        return report
+
+    def abort(self):
+        """Drop the partial output."""
+        self._fp.close()
+        self._archive.close()
+        try:
+            os.unlink(self._partial)
+        except FileNotFoundError:
+            pass
+
+
+def _repeat_spec(content_spec, slides, directory):
+    """Write a copy of the spec with its slides repeated up to `slides`; returns its path."""
+    import yaml
+
+    with open(content_spec) as f:
+        spec = yaml.safe_load(f)
+    source = spec.get('slides', [])
+    spec['slides'] = [dict(source[i % len(source)]) for i in range(slides)]
+    spec_path = Path(directory) / f'bench_{slides}.yaml'
+    with open(spec_path, 'w') as f:
+        yaml.safe_dump(spec, f, allow_unicode=True)
+    return spec_path
+
+
+def bench(content_spec, slides=None, levels=(0, 1, 6, 9), engine='fast', repeat=3):
+    """Time prs.save against save_package at each level; returns result rows.
+
+    Each writer is timed by the generator's own save stage, since generate()
+    clears its slides again when the session ends.
+    """
+    import tempfile
+
+    from ppt_generator import HyFluxPPTGenerator, find_template
+
+    template = find_template()
+    template_bytes = template.read_bytes()
+    tmp_dir = tempfile.TemporaryDirectory()
+    spec_path = _repeat_spec(content_spec, slides, tmp_dir.name) if slides else content_spec
+    output = Path(tmp_dir.name) / 'bench.pptx'
+
+    def best_of(package_writer, compresslevel=DEFAULT_COMPRESSLEVEL):
+        generator = HyFluxPPTGenerator(str(template), template_bytes=template_bytes, engine=engine,
+                                       package_writer=package_writer, compresslevel=compresslevel)
+        runs = [generator.generate(str(spec_path), str(output)) for _ in range(repeat)]
+        return runs[-1]['slide_count'], min(run['timings']['stages_ms']['save'] for run in runs), \
+            output.stat().st_size
+
+    slide_count, ms, size = best_of('pptx')
+    rows = [('prs.save', ms, size)]
+    for level in levels:
+        _, ms, size = best_of('raw', level)
+        rows.append((f'raw copy, level {level}', ms, size))
+    tmp_dir.cleanup()
+    return slide_count, rows
+
+
+def bench_memory(content_spec, slide_counts=(100, 1000, 5000), writers=('raw', 'stream')):
+    """Peak traced memory from the first slide to the end of the save; returns result rows.
+
+    The spec's own size is left out by measuring from the first slide stage.
+    """
+    import tempfile
+    import tracemalloc
+
+    from ppt_generator import GeneratorHooks, HyFluxPPTGenerator, find_template
+
+    class PeakFromFirstSlide(GeneratorHooks):
+        def __init__(self):
+            self.baseline = None
+
+        def on_start(self, stage, info):
+            if stage == 'slide' and self.baseline is None:
+                tracemalloc.reset_peak()
+                self.baseline = tracemalloc.get_traced_memory()[0]
+
+    template = find_template()
+    template_bytes = template.read_bytes()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for slides in slide_counts:
+            spec_path = _repeat_spec(content_spec, slides, tmp_dir)
+            for writer in writers:
+                generator = HyFluxPPTGenerator(
+                    str(template), template_bytes=template_bytes, engine='fast', package_writer=writer
+                )
+                peak = PeakFromFirstSlide()
+                tracemalloc.start()
+                try:
+                    generator.generate(str(spec_path), str(Path(tmp_dir) / 'bench.pptx'), hooks=[peak])
+                    rows.append((slides, writer, tracemalloc.get_traced_memory()[1] - peak.baseline))
+                finally:
+                    tracemalloc.stop()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 package_writer.py {bench,memory} <content_spec.yaml> [--slides N[,N...]] [--levels 0,1,6,9]"
+    )
+    parser.add_argument('command', choices=['bench', 'memory'])
+    parser.add_argument('content_spec', help="YAML content specification")
+    parser.add_argument('--slides', help="Repeat the spec's slides up to this many (memory: a list)")
+    parser.add_argument('--levels', default='0,1,6,9', help="Compression levels to compare")
+    args = parser.parse_args()
+
+    if args.command == 'memory':
+        counts = [int(n) for n in (args.slides or '100,1000,5000').split(',')]
+        print("Peak memory from the first slide to the end of the save (fast engine)")
+        print(f"  {'slides':>7} {'writer':<8} {'KB':>9} {'bytes/slide':>12}")
+        for slides, writer, peak in bench_memory(args.content_spec, counts):
+            print(f"  {slides:>7} {writer:<8} {peak / 1024:>9.1f} {peak / slides:>12.0f}")
+        return
+
+    slides = int(args.slides) if args.slides else None
+
+    slide_count, rows = bench(args.content_spec, slides, [int(level) for level in args.levels.split(',')])
+    print(f"Save of a {slide_count}-slide deck (best of 3)")
+    print(f"  {'writer':<22} {'ms':>8} {'KB':>9}")
+    for name, ms, size in rows:
+        print(f"  {name:<22} {ms:>8.1f} {size / 1024:>9.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,10 @@ HyFlux PowerPoint Generator
 Automates presentation creation from YAML content specs.
 """
 
+import io
 import sys
+import time
+import argparse
 import yaml
 from pathlib import Path
 from pptx import Presentation
@@ -12,6 +15,9 @@ from pptx.util import Pt, Inches
 from pptx.enum.text import PP_ALIGN
 from datetime import datetime
 import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
 
 # Layout mapping (index to friendly name)
 LAYOUT_MAP = {
@@ -33,12 +39,144 @@ LAYOUT_MAP = {
     'end_slide': 35
 }
 
+# Slide build engines: python-pptx's shape API, or fast_writer's precompiled
+# per-layout XML skeletons (same output, built without per-slide proxy objects)
+ENGINES = ('pptx', 'fast')
+
+# Package writers: python-pptx's prs.save; package_writer's save_package, which
+# copies unchanged template entries without recompressing them; or 'stream',
+# which writes each slide to the output as it is built (fast engine only)
+PACKAGE_WRITERS = ('pptx', 'raw', 'stream')
+
+# Alternative type names accepted in specs
+TYPE_ALIASES = {
+    'title': 'title_white',
+    'two_content': 'two_column',
+    'three_content': 'three_column',
+}
+
+
+class GeneratorHooks:
+    """Instrumentation hook interface for HyFluxPPTGenerator.
+    
+    Subclass and override what you need. Stages, in order:
+    
+        template_load   parsing the template (constructor hooks only)
+        spec_load       reading the YAML spec
+        normalize       normalizing slide text
+        slide           one per slide; info has `index`, `layout` and `title`
+        save            writing the .pptx
+    
+    on_end is called even when the stage raised.
+    """
+    
+    def on_start(self, stage, info):
+        pass
+    
+    def on_end(self, stage, seconds, info):
+        pass
+
+
+class StageTimings(GeneratorHooks):
+    """Collects stage and per-slide timings; generate() reports one of these."""
+    
+    def __init__(self):
+        self.stages = {}
+        self.slides = []
+    
+    def on_end(self, stage, seconds, info):
+        if stage == 'slide':
+            self.slides.append({
+                'index': info['index'],
+                'layout': info['layout'],
+                'title': info.get('title'),
+                'ms': round(seconds * 1000, 3),
+            })
+        else:
+            self.stages[stage] = self.stages.get(stage, 0) + seconds
+    
+    def by_layout(self):
+        """{layout: {count, total_ms, avg_ms, max_ms}}, most total time first."""
+        layouts = {}
+        for slide in self.slides:
+            entry = layouts.setdefault(slide['layout'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += slide['ms']
+            entry['max_ms'] = max(entry['max_ms'], slide['ms'])
+        for entry in layouts.values():
+            entry['avg_ms'] = round(entry['total_ms'] / entry['count'], 3)
+            entry['total_ms'] = round(entry['total_ms'], 3)
+        return dict(sorted(layouts.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+    
+    def slowest(self, limit=5):
+        return sorted(self.slides, key=lambda slide: slide['ms'], reverse=True)[:limit]
+    
+    def report(self, slowest=5):
+        stages = {}
+        for stage in ('template_load', 'spec_load', 'normalize', 'slides', 'save'):
+            if stage == 'slides':
+                stages['slides'] = round(sum(slide['ms'] for slide in self.slides), 3)
+            elif stage in self.stages:
+                stages[stage] = round(self.stages[stage] * 1000, 3)
+        return {
+            'stages_ms': stages,
+            'slide_types': self.by_layout(),
+            'slowest_slides': self.slowest(slowest),
+        }
+    
+    def format_table(self, slowest=5):
+        """Render the report as lines for the CLI."""
+        report = self.report(slowest)
+        lines = ['Stage            ms']
+        for stage, ms in report['stages_ms'].items():
+            lines.append(f'  {stage:<14} {ms:>9.1f}')
+        lines += ['', 'Slide type       count   total ms   avg ms   max ms']
+        for layout, entry in report['slide_types'].items():
+            lines.append(f"  {layout:<14} {entry['count']:>5} {entry['total_ms']:>10.1f} "
+                         f"{entry['avg_ms']:>8.2f} {entry['max_ms']:>8.2f}")
+        if report['slowest_slides']:
+            lines += ['', 'Slowest slides']
+            for slide in report['slowest_slides']:
+                title = f" {str(slide['title'])[:40]!r}" if slide.get('title') else ''
+                lines.append(f"  #{slide['index'] + 1:<4} {slide['layout']:<14} {slide['ms']:>8.2f} ms{title}")
+        return lines
+
+
 class HyFluxPPTGenerator:
-    def __init__(self, template_path, config_path=None):
-        """Initialize generator with template."""
+    def __init__(self, template_path, config_path=None, template_bytes=None, hooks=(), engine='pptx',
+                 package_writer='pptx', compresslevel=6):
+        """Initialize generator with template.
+        
+        template_bytes, if given, is the already-read template file and is
+        parsed instead of reading template_path from disk. hooks are
+        GeneratorHooks notified of every stage, from template load on.
+        engine is one of ENGINES and selects how slides are built;
+        package_writer is one of PACKAGE_WRITERS and selects how the deck
+        is saved, with compresslevel (0-9, 0 = stored) for the parts the
+        'raw' and 'stream' writers have to compress.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+        if package_writer not in PACKAGE_WRITERS:
+            raise ValueError(f"Unknown package writer {package_writer!r}, expected one of {', '.join(PACKAGE_WRITERS)}")
+        if package_writer == 'stream' and engine != 'fast':
+            raise ValueError("The 'stream' package writer needs engine='fast'")
+        if not 0 <= compresslevel <= 9:
+            raise ValueError(f"compresslevel must be 0-9, got {compresslevel}")
         self.template_path = Path(template_path)
-        self.prs = Presentation(str(self.template_path))
+        self.template_bytes = template_bytes
+        self.hooks = list(hooks)
+        self.engine = engine
+        self.package_writer = package_writer
+        self.compresslevel = compresslevel
+        with self._stage('template_load', self.hooks):
+            if template_bytes is not None:
+                self.prs = Presentation(io.BytesIO(template_bytes))
+            else:
+                self.prs = Presentation(str(self.template_path))
         self.config = self._load_config(config_path)
+        self._session_lock = threading.Lock()
+        self._skeletons = {}  # fast engine skeletons by layout, kept across sessions
         
         # Validate template
         if len(self.prs.slide_layouts) < 36:
@@ -243,61 +381,157 @@ class HyFluxPPTGenerator:
                 normalized.append(line)
         return '\n'.join(normalized)
     
-    def generate(self, content_spec_path, output_path):
-        """Generate presentation from content specification."""
-        # Load content spec
-        with open(content_spec_path) as f:
-            spec = yaml.safe_load(f)
+    @contextmanager
+    def _stage(self, stage, hooks, **info):
+        """Time a stage and notify hooks of its start and end."""
+        for hook in hooks:
+            hook.on_start(stage, info)
+        started = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - started
+            for hook in hooks:
+                hook.on_end(stage, seconds, info)
+    
+    @contextmanager
+    def session(self):
+        """Build one deck on the template; yields the Presentation (self.prs).
+        
+        The template's slides are removed on entry. On exit every slide
+        added during the session is removed again, releasing its parts, so
+        the next session starts from the same clean template state and one
+        generator can produce any number of independent decks without
+        re-reading the template. A generator runs one session at a time;
+        concurrent callers need a generator each.
+        """
+        if not self._session_lock.acquire(blocking=False):
+            raise RuntimeError("This generator is already building a deck")
+        try:
+            self._clear_slides()
+            yield self.prs
+        finally:
+            try:
+                self._clear_slides()
+            finally:
+                self._session_lock.release()
+    
+    def _clear_slides(self):
+        """Remove every slide and drop the relationships only they used."""
+        part = self.prs.part
+        sldIdLst = self.prs.slides._sldIdLst
+        # One pass over the r:id references instead of drop_rel's per-slide count
+        references = Counter(part._element.xpath('//@r:id'))
+        for sldId in list(sldIdLst):
+            rId = sldId.rId
+            sldIdLst.remove(sldId)
+            if references[rId] < 2:
+                part.rels.pop(rId)
+    
+    def package_parts(self):
+        """Number of parts reachable from the presentation (see session())."""
+        return sum(1 for _ in self.prs.part.package.iter_parts())
+    
+    def generate(self, content_spec_path, output_path, hooks=()):
+        """Generate presentation from content specification.
         
-        # Normalize content before generation
-        spec = self._normalize_content(spec)
+        Each call runs in its own session(), so a generator can be reused.
+        hooks are notified for this call in addition to the constructor's.
+        The result includes `timings`: milliseconds per stage, per slide
+        type, and the slowest slides (see StageTimings.report).
+        """
+        timings = StageTimings()
+        hooks = self.hooks + list(hooks) + [timings]
         
-        # Clear template slides (keep only master)
-        while len(self.prs.slides) > 0:
-            rId = self.prs.slides._sldIdLst[0].rId
-            self.prs.part.drop_rel(rId)
-            del self.prs.slides._sldIdLst[0]
+        # Load content spec
+        with self._stage('spec_load', hooks):
+            with open(content_spec_path) as f:
+                spec = yaml.safe_load(f)
         
-        # Generate slides from spec
-        for slide_spec in spec.get('slides', []):
-            self._add_slide(slide_spec)
+        # Normalize content before generation
+        with self._stage('normalize', hooks):
+            spec = self._normalize_content(spec)
         
-        # Save presentation
         output_file = Path(output_path)
         output_file.parent.mkdir(parents=True, exist_ok=True)
-        self.prs.save(str(output_file))
-        
-        return {
-            'success': True,
-            'output': str(output_file),
-            'slide_count': len(self.prs.slides)
-        }
+        template = self.template_bytes if self.template_bytes is not None else self.template_path
+        
+        # Build and save on a clean copy of the template
+        with self.session():
+            # Generate slides from spec
+            writer = stream = None
+            if self.package_writer == 'stream':
+                from fast_writer import StreamingSlideWriter
+                from package_writer import StreamingPackage
+                stream = StreamingPackage(self.prs, output_file, template, self.compresslevel)
+                writer = StreamingSlideWriter(self.prs, stream, self._skeletons)
+            elif self.engine == 'fast':
+                from fast_writer import FastSlideWriter
+                writer = FastSlideWriter(self.prs, self._skeletons)
+            try:
+                for index, slide_spec in enumerate(spec.get('slides', [])):
+                    with self._stage('slide', hooks, index=index, layout=self._layout_type(slide_spec),
+                                     title=slide_spec.get('title')):
+                        if writer is not None:
+                            self._add_fast_slide(writer, slide_spec)
+                        else:
+                            self._add_slide(slide_spec)
+            except BaseException:
+                if stream is not None:
+                    stream.abort()
+                raise
+            
+            # Save presentation
+            package = None
+            with self._stage('save', hooks):
+                if stream is not None:
+                    package = stream.close()
+                elif self.package_writer == 'raw':
+                    from package_writer import save_package
+                    package = save_package(self.prs, output_file, template, self.compresslevel)
+                else:
+                    self.prs.save(str(output_file))
+            
+            result = {
+                'success': True,
+                'output': str(output_file),
+                'slide_count': len(self.prs.slides),
+                'timings': timings.report()
+            }
+            if package is not None:
+                result['package'] = package
+        return result
     
-    def _add_slide(self, slide_spec):
-        """Add a single slide based on specification."""
-        # Get layout - normalize type name
+    @staticmethod
+    def _layout_type(slide_spec):
+        """Spec type normalized to a LAYOUT_MAP name (aliases and upper case resolved)."""
         layout_type = slide_spec.get('type', 'title_only')
         layout_type_lower = layout_type.lower()
-        
-        # Map alternative type names
-        type_mapping = {
-            'title': 'title_white',
-            'two_content': 'two_column',
-            'three_content': 'three_column',
-        }
-        if layout_type_lower in type_mapping:
-            layout_type = type_mapping[layout_type_lower]
+        if layout_type_lower in TYPE_ALIASES:
+            layout_type = TYPE_ALIASES[layout_type_lower]
         elif layout_type.isupper():
             layout_type = layout_type.lower()
-            if layout_type in type_mapping:
-                layout_type = type_mapping[layout_type]
-        
+            if layout_type in TYPE_ALIASES:
+                layout_type = TYPE_ALIASES[layout_type]
+        return layout_type
+    
+    def _layout_index(self, layout_type):
+        """Template layout index for a layout type (Title Only if unknown or missing)."""
         layout_idx = LAYOUT_MAP.get(layout_type, 12)
         
         if layout_idx >= len(self.prs.slide_layouts):
             print(f"⚠️  Layout {layout_type} (index {layout_idx}) not found, using Title Only")
             layout_idx = 12
         
+        return layout_idx
+    
+    def _add_slide(self, slide_spec):
+        """Add a single slide based on specification."""
+        # Get layout - normalize type name
+        layout_type = self._layout_type(slide_spec)
+        
+        layout_idx = self._layout_index(layout_type)
+        
         slide = self.prs.slides.add_slide(self.prs.slide_layouts[layout_idx])
         
         # Populate content based on layout type
@@ -341,6 +575,17 @@ class HyFluxPPTGenerator:
         if hasattr(slide.shapes, 'title') and slide.shapes.title is not None and 'title' in spec:
             slide.shapes.title.text = spec['title']
         
+        content_text = self._content_text(spec)
+        
+        # Find content text box
+        for shape in slide.shapes:
+            if hasattr(shape, 'has_text_frame') and shape.has_text_frame:
+                if hasattr(shape, 'placeholder_format') and shape.placeholder_format.idx > 0:
+                    self._set_text_content(shape.text_frame, content_text)
+                    break
+    
+    def _content_text(self, spec):
+        """Body text of a text_only slide."""
         # Handle content - can be array or string
         content_text = ''
         if 'content' in spec:
@@ -351,19 +596,28 @@ class HyFluxPPTGenerator:
                 content_text = content
             else:
                 content_text = str(content)
-        
-        # Find content text box
-        for shape in slide.shapes:
-            if hasattr(shape, 'has_text_frame') and shape.has_text_frame:
-                if hasattr(shape, 'placeholder_format') and shape.placeholder_format.idx > 0:
-                    self._set_text_content(shape.text_frame, content_text)
-                    break
+        return content_text
     
     def _populate_columns(self, slide, spec):
         """Populate multi-column slide."""
         if hasattr(slide.shapes, 'title') and slide.shapes.title is not None and 'title' in spec:
             slide.shapes.title.text = spec['title']
         
+        columns = self._column_texts(spec)
+        
+        # Populate columns
+        col_idx = 0
+        for shape in slide.shapes:
+            if hasattr(shape, 'has_text_frame') and shape.has_text_frame:
+                if hasattr(shape, 'placeholder_format') and shape.placeholder_format.idx > 0:
+                    if col_idx < len(columns) and columns[col_idx]:
+                        self._set_text_content(shape.text_frame, columns[col_idx])
+                    col_idx += 1
+                    if col_idx >= len(columns):
+                        break
+    
+    def _column_texts(self, spec):
+        """[left, right, middle] text of a multi-column slide, in placeholder order."""
         # Handle different content structures
         columns = []
         
@@ -388,17 +642,7 @@ class HyFluxPPTGenerator:
                 spec.get('right_content', ''),
                 spec.get('middle_content', '')
             ]
-        
-        # Populate columns
-        col_idx = 0
-        for shape in slide.shapes:
-            if hasattr(shape, 'has_text_frame') and shape.has_text_frame:
-                if hasattr(shape, 'placeholder_format') and shape.placeholder_format.idx > 0:
-                    if col_idx < len(columns) and columns[col_idx]:
-                        self._set_text_content(shape.text_frame, columns[col_idx])
-                    col_idx += 1
-                    if col_idx >= len(columns):
-                        break
+        return columns
     
     def _format_content_list(self, content):
         """Format content list or object into text string."""
@@ -449,38 +693,144 @@ class HyFluxPPTGenerator:
                 if hasattr(shape, 'placeholder_format') and shape.placeholder_format.idx > 0:
                     self._set_text_content(shape.text_frame, spec.get('contact', ''))
                     break
+    
+    def _add_fast_slide(self, writer, slide_spec):
+        """Add a single slide through the fast engine (see fast_writer).
+        
+        Fills the same placeholders with the same text as _add_slide and
+        the _populate_* methods; keep the two in step.
+        """
+        layout_type = self._layout_type(slide_spec)
+        skeleton = writer.skeleton(self.prs.slide_layouts[self._layout_index(layout_type)])
+        return writer.add_slide(skeleton, self._slide_fills(layout_type, slide_spec, skeleton))
+    
+    def _slide_fills(self, layout_type, spec, skeleton):
+        """{slot: ('text' | 'content', text)} for a fast-engine slide."""
+        fills = {}
+        title = skeleton.title
+        body = skeleton.text_slots[0] if skeleton.text_slots else None
+        
+        if layout_type == 'end_slide':
+            if title is not None:
+                fills[title] = ('text', spec.get('title', 'Thank You'))
+        elif layout_type != 'quote' and title is not None and 'title' in spec:
+            fills[title] = ('text', spec['title'])
+        
+        if layout_type in ['title_white', 'title_reverse', 'title']:
+            if skeleton.subtitle is not None:
+                fills[skeleton.subtitle] = ('text', spec.get('subtitle', ''))
+        elif layout_type == 'text_only':
+            if body is not None:
+                fills[body] = ('content', self._content_text(spec))
+        elif layout_type in ['two_column', 'two_content', 'three_column', 'three_content']:
+            for slot, text in zip(skeleton.text_slots, self._column_texts(spec)):
+                if text:
+                    fills[slot] = ('content', text)
+        elif layout_type == 'quote':
+            slot = skeleton.first_text
+            if slot is not None:
+                text = spec['quote'] if 'quote' in spec else None
+                if 'attribution' in spec:
+                    text = (skeleton.texts[slot] if text is None else text) + f"\n\n— {spec['attribution']}"
+                if text is not None:
+                    fills[slot] = ('text', text)
+        elif layout_type == 'end_slide':
+            if body is not None:
+                fills[body] = ('content', spec.get('contact', ''))
+        
+        return fills
+
+
+# Template locations tried by the CLI, in order
+TEMPLATE_SEARCH_PATHS = [
+    Path(__file__).parent.absolute().parent / "templates" / "HyFlux_Template_-.pptx",  # From scripts/ -> ../templates/
+    Path(__file__).parent.absolute() / "templates" / "HyFlux_Template_-.pptx",  # scripts/templates/
+    Path("templates") / "HyFlux_Template_-.pptx",  # Current directory
+    Path("../templates") / "HyFlux_Template_-.pptx",  # One level up
+]
+
+
+def find_template():
+    """First existing template in TEMPLATE_SEARCH_PATHS, or None."""
+    for template_path in TEMPLATE_SEARCH_PATHS:
+        if template_path.exists():
+            return template_path
+    return None
+
+
+# Traced memory a leak check tolerates between its first and last checkpoint
+LEAK_TOLERANCE_KB = 256
+
+
+def leak_check(generator, content_spec_path, output_path, generations=1000, checkpoints=10):
+    """Build `generations` decks with one generator, checking it leaks nothing.
+
+    Returns (rows, ok). A row is taken after a gc.collect() at each of
+    `checkpoints` evenly spaced generations: (generation, traced KB, parts
+    reachable from the presentation, live Part objects). ok means the part
+    counts never changed and traced memory grew by less than
+    LEAK_TOLERANCE_KB from the first checkpoint to the last.
+    """
+    import gc
+    import tracemalloc
+    from pptx.opc.package import Part
+
+    every = max(1, generations // checkpoints)
+    rows = []
+    tracemalloc.start()
+    try:
+        for generation in range(1, generations + 1):
+            generator.generate(content_spec_path, output_path)
+            if generation % every == 0 or generation == generations:
+                gc.collect()
+                live_parts = sum(1 for obj in gc.get_objects() if isinstance(obj, Part))
+                rows.append((generation, tracemalloc.get_traced_memory()[0] / 1024,
+                             generator.package_parts(), live_parts))
+    finally:
+        tracemalloc.stop()
+    ok = (
+        len({row[2] for row in rows}) == 1
+        and len({row[3] for row in rows}) == 1
+        and rows[-1][1] - rows[0][1] < LEAK_TOLERANCE_KB
+    )
+    return rows, ok
 
 
 def main():
     """CLI entry point."""
-    if len(sys.argv) < 3:
-        print("Usage: python3 ppt_generator.py <content_spec.yaml> <output.pptx>")
-        print("\nExample:")
-        print("  python3 ppt_generator.py input/content_spec.yaml output/presentation.pptx")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        usage="python3 ppt_generator.py <content_spec.yaml> <output.pptx> [options]",
+        epilog="Example:\n  python3 ppt_generator.py input/content_spec.yaml output/presentation.pptx",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('content_spec', help="YAML content specification")
+    parser.add_argument('output', help="Output .pptx path")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Dedupe, downsample and recompress media after generation")
+    parser.add_argument('--timings', action='store_true',
+                        help="Print per-stage and per-slide-type timings and the slowest slides")
+    parser.add_argument('--engine', choices=ENGINES, default='pptx',
+                        help="Slide build engine: python-pptx shapes (default) or precompiled XML skeletons")
+    parser.add_argument('--package-writer', choices=PACKAGE_WRITERS, default='pptx',
+                        help="Save with python-pptx (default), copy unchanged template parts without "
+                             "recompressing (raw), or also write each slide as it is built (stream, needs --engine fast)")
+    parser.add_argument('--compresslevel', type=int, default=6, choices=range(10), metavar='0-9',
+                        help="Deflate level for parts the raw and stream writers compress, 0 = stored (default: 6)")
+    parser.add_argument('--leak-check', type=int, metavar='N',
+                        help="Build the deck N times with one generator and check memory and part counts stay flat")
+    args = parser.parse_args()
+    if args.package_writer == 'stream' and args.engine != 'fast':
+        parser.error("--package-writer stream needs --engine fast")
     
-    content_spec = sys.argv[1]
-    output_file = sys.argv[2]
+    content_spec = args.content_spec
+    output_file = args.output
     
-    # Find template - try multiple locations
-    script_dir = Path(__file__).parent.absolute()
-    possible_template_paths = [
-        script_dir.parent / "templates" / "HyFlux_Template_-.pptx",  # From scripts/ -> ../templates/
-        script_dir / "templates" / "HyFlux_Template_-.pptx",  # scripts/templates/
-        Path("templates") / "HyFlux_Template_-.pptx",  # Current directory
-        Path("../templates") / "HyFlux_Template_-.pptx",  # One level up
-    ]
-    
-    template = None
-    for template_path in possible_template_paths:
-        if template_path.exists():
-            template = template_path
-            break
+    template = find_template()
     
     if not template:
         print(f"❌ Template not found: HyFlux_Template_-.pptx")
         print("   Searched in:")
-        for path in possible_template_paths:
+        for path in TEMPLATE_SEARCH_PATHS:
             print(f"     - {path}")
         print("   Place HyFlux_Template_-.pptx in templates/ directory")
         sys.exit(1)
@@ -496,12 +846,45 @@ def main():
         print(f"   Content:  {content_spec}")
         print(f"   Output:   {output_file}")
         
-        generator = HyFluxPPTGenerator(str(template))
+        timings = StageTimings()
+        # Constructor hooks see every generation; a leak check runs without them
+        generator = HyFluxPPTGenerator(str(template), hooks=() if args.leak_check else [timings], engine=args.engine,
+                                       package_writer=args.package_writer, compresslevel=args.compresslevel)
+        
+        if args.leak_check:
+            rows, ok = leak_check(generator, content_spec, output_file, args.leak_check)
+            print("\n   Generations  traced KB  package parts  live parts")
+            for generation, traced_kb, package_parts, live_parts in rows:
+                print(f"   {generation:>11} {traced_kb:>10.1f} {package_parts:>14} {live_parts:>11}")
+            growth = rows[-1][1] - rows[0][1]
+            if not ok:
+                print(f"\n❌ Leak check failed: {growth:+.1f} KB traced, part counts "
+                      f"{'changed' if len({row[2:] for row in rows}) > 1 else 'flat'}")
+                sys.exit(1)
+            print(f"\n✅ Leak check passed: {growth:+.1f} KB traced, part counts flat")
+            return
+        
         result = generator.generate(content_spec, output_file)
         
         print(f"\n✅ Success!")
         print(f"   Created: {result['output']}")
         print(f"   Slides:  {result['slide_count']}")
+        if 'package' in result:
+            package = result['package']
+            print(f"   Package: {package['copied']} template entries copied, "
+                  f"{package['compressed']} compressed, {package['size'] / 1024:.0f} KB")
+        
+        if args.timings:
+            print()
+            for line in timings.format_table():
+                print(f"   {line}")
+        
+        if args.optimize:
+            from package_optimizer import optimize_package, format_optimization
+            report = optimize_package(result['output'])
+            print()
+            for line in format_optimization(report):
+                print(f"   {line}")
         
     except Exception as e:
         print(f"\n❌ Generation failed: {e}")
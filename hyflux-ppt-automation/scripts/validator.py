@@ -9,6 +9,8 @@ from pathlib import Path
 from pptx import Presentation
 from collections import Counter
 
+from package_optimizer import analyze_package, format_analysis, optimize_package, format_optimization
+
 class HyFluxValidator:
     def __init__(self, pptx_path):
         self.path = Path(pptx_path)
@@ -145,7 +147,7 @@ class HyFluxValidator:
             self.info.append("✓ No obvious placeholders found")
     
     def _check_file_size(self):
-        """Check file size is reasonable."""
+        """Check file size is reasonable and break it down per part."""
         size_mb = self.path.stat().st_size / (1024 * 1024)
         
         if size_mb > 50:
@@ -154,6 +156,16 @@ class HyFluxValidator:
             )
         else:
             self.info.append(f"✓ File size: {size_mb:.1f} MB")
+        
+        analysis = analyze_package(self.path)
+        for line in format_analysis(analysis)[1:]:
+            self.info.append(f"  {line.strip()}")
+        
+        if analysis['unreferenced']:
+            self.warnings.append(
+                f"{len(analysis['unreferenced'])} unreferenced parts "
+                f"({analysis['unreferenced_bytes'] / 1024:.1f} KB) - run 'validator.py optimize'"
+            )
     
     def _generate_report(self):
         """Generate validation report."""
@@ -190,18 +202,43 @@ class HyFluxValidator:
             return True
 
 
+def _print_usage():
+    print("Usage: python3 validator.py <presentation.pptx>")
+    print("       python3 validator.py analyze <presentation.pptx>")
+    print("       python3 validator.py optimize <presentation.pptx> [output.pptx]")
+    print("\nExample:")
+    print("  python3 validator.py output/presentation.pptx")
+    print("  python3 validator.py optimize output/presentation.pptx")
+
+
 def main():
     """CLI entry point."""
     if len(sys.argv) < 2:
-        print("Usage: python3 validator.py <presentation.pptx>")
-        print("\nExample:")
-        print("  python3 validator.py output/presentation.pptx")
+        _print_usage()
         sys.exit(1)
     
-    pptx_file = sys.argv[1]
+    command = sys.argv[1]
     
     try:
-        validator = HyFluxValidator(pptx_file)
+        if command == 'analyze':
+            if len(sys.argv) < 3:
+                _print_usage()
+                sys.exit(1)
+            for line in format_analysis(analyze_package(sys.argv[2])):
+                print(line)
+            sys.exit(0)
+        
+        if command == 'optimize':
+            if len(sys.argv) < 3:
+                _print_usage()
+                sys.exit(1)
+            output = sys.argv[3] if len(sys.argv) > 3 else None
+            report = optimize_package(sys.argv[2], output)
+            for line in format_optimization(report):
+                print(line)
+            sys.exit(0)
+        
+        validator = HyFluxValidator(command)
         passed = validator.validate_all()
         
         sys.exit(0 if passed else 1)
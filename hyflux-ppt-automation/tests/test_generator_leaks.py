@@ -0,0 +1,38 @@
+"""
+Leak checks for reused generators: one HyFluxPPTGenerator builds the same
+deck many times and must not accumulate parts or memory between sessions.
+
+Run from hyflux-ppt-automation/ with:
+    python3 -m pytest tests/
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
+
+from ppt_generator import LEAK_TOLERANCE_KB, HyFluxPPTGenerator, find_template, leak_check  # noqa: E402
+
+SPEC = Path(__file__).parent / 'minimal_spec.yaml'
+GENERATIONS = 100
+
+
+@pytest.mark.parametrize('engine, package_writer', [
+    ('pptx', 'pptx'),
+    ('fast', 'raw'),
+    ('fast', 'stream'),
+])
+def test_reused_generator_does_not_leak(tmp_path, engine, package_writer):
+    template = find_template()
+    if template is None:
+        pytest.skip("HyFlux_Template_-.pptx is not installed in templates/")
+
+    generator = HyFluxPPTGenerator(str(template), engine=engine, package_writer=package_writer)
+    rows, ok = leak_check(generator, str(SPEC), str(tmp_path / 'leak.pptx'), GENERATIONS)
+
+    assert len({package_parts for _, _, package_parts, _ in rows}) == 1, rows
+    assert len({live_parts for _, _, _, live_parts in rows}) == 1, rows
+    assert rows[-1][1] - rows[0][1] < LEAK_TOLERANCE_KB, rows
+    assert ok
@@ -31,6 +31,7 @@ fi
 # Create output directories if they don't exist
 mkdir -p hyflux-ppt-automation/output/generated
 mkdir -p hyflux-ppt-automation/output/uploads
+mkdir -p hyflux-ppt-automation/output/cache
 
 echo "🚀 Starting Docker containers..."
 echo ""
@@ -0,0 +1,45 @@
+"""
+Admin gate for the diagnostics endpoints (profiling, memory snapshots).
+
+Admin requests carry the token from HYFLUX_ADMIN_TOKEN in an
+`X-Admin-Token` header (or `Authorization: Bearer <token>`). Without a
+configured token every admin feature is off.
+
+Environment:
+    HYFLUX_ADMIN_TOKEN   shared secret for admin requests (default: unset, admin features disabled)
+"""
+
+import hmac
+import os
+from functools import wraps
+
+from flask import jsonify, request
+
+ADMIN_TOKEN = os.environ.get('HYFLUX_ADMIN_TOKEN', '')
+
+
+def request_token(headers):
+    token = headers.get('X-Admin-Token', '')
+    if not token:
+        scheme, _, value = headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer':
+            token = value.strip()
+    return token
+
+
+def is_admin(headers=None):
+    """Whether the current request (or the given headers) carries the admin token."""
+    if not ADMIN_TOKEN:
+        return False
+    token = request_token(request.headers if headers is None else headers)
+    return bool(token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            error = 'Admin token required' if ADMIN_TOKEN else 'Admin endpoints are disabled (set HYFLUX_ADMIN_TOKEN)'
+            return jsonify({'success': False, 'error': error}), 403
+        return view(*args, **kwargs)
+    return wrapper
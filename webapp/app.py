@@ -7,8 +7,13 @@ Flask-based web interface for creating and generating presentations
 import os
 import sys
 import re
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 from werkzeug.utils import secure_filename
 import yaml
 import tempfile
@@ -20,16 +25,43 @@ import requests
 # In Docker, ppt_generator.py will be copied to /app/
 sys.path.insert(0, str(Path(__file__).parent))
 try:
-    from ppt_generator import HyFluxPPTGenerator
+    from ppt_generator import HyFluxPPTGenerator, GeneratorHooks
 except ImportError:
     # Fallback: try relative path (for local development)
     sys.path.insert(0, str(Path(__file__).parent.parent / 'hyflux-ppt-automation' / 'scripts'))
-    from ppt_generator import HyFluxPPTGenerator
+    from ppt_generator import HyFluxPPTGenerator, GeneratorHooks
+# Shipped next to ppt_generator, so it resolves from whichever path worked
+from package_optimizer import optimize_package
+
+from ollama_client import ollama, gate, OllamaOverloaded
+from chat_cache import ChatResponseCache
+from chat_sessions import ChatSessionStore
+from yaml_repair import RepairPipeline, YAML_FENCE_RE
+from deck_drafter import DeckDrafter
+import prompt_builder
+from model_residency import residency, router
+from spec_library import SpecLibrary
+from retention import RetentionPolicy
+import http_cache
+import metrics
+import admin
+import profiling
+import memory_diagnostics
+from slide_schema import (VALID_SLIDE_TYPES, ValidityStats, spec_json_schema, spec_to_yaml,
+                          validate_yaml_strict)
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = '/app/uploads'
 app.config['OUTPUT_FOLDER'] = '/app/output'
+app.config['INPUT_FOLDER'] = '/app/input'
+app.config['CACHE_FOLDER'] = os.environ.get('HYFLUX_CACHE_FOLDER', '/app/cache')
+
+# Content ETags, conditional/range downloads and JSON compression (see http_cache.py)
+http_cache.init_app(app)
+
+# Per-route request timing for /metrics (see metrics.py)
+metrics.init_app(app)
 
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -37,7 +69,68 @@ os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
 # Paths
 TEMPLATE_PATH = Path('/app/ppt_templates/HyFlux_Template_-.pptx')
-SAMPLE_YAML_PATH = Path('/app/input/sample_content_spec.yaml')
+SAMPLE_YAML_PATH = Path(app.config['INPUT_FOLDER']) / 'sample_content_spec.yaml'
+
+# Index of saved specs (shared by all workers; see spec_library.py)
+spec_library = SpecLibrary(
+    app.config['INPUT_FOLDER'],
+    Path(app.config['CACHE_FOLDER']) / 'saved_specs.sqlite3',
+    exclude={SAMPLE_YAML_PATH.name}
+)
+
+# Keeps generated decks and uploads within the retention limits (see retention.py)
+retention = RetentionPolicy(
+    [app.config['OUTPUT_FOLDER'], app.config['UPLOAD_FOLDER']],
+    Path(app.config['CACHE_FOLDER']) / 'retention.lock'
+)
+
+# Admin-requested request profiles and the background stack sampler (see profiling.py)
+profile_store = profiling.ProfileStore(
+    os.environ.get('HYFLUX_PROFILE_DIR') or Path(app.config['CACHE_FOLDER']) / 'profiles'
+)
+sampler = profiling.BackgroundSampler(profile_store)
+profiling.init_app(app, profile_store, sampler)
+
+# Per-request memory use, allocation snapshots and the RSS watchdog (see memory_diagnostics.py)
+memory_tracker = memory_diagnostics.MemoryTracker()
+memory_diagnostics.init_app(app, memory_tracker)
+
+# Precompiled patterns (compiled at import so preforked workers share them)
+NUMBERED_ITEM_RE = re.compile(r'^\d+[\.\)]\s')
+
+# Repairs YAML specs pulled out of model answers
+yaml_repair = RepairPipeline(VALID_SLIDE_TYPES)
+
+# Cached template bytes: (path, mtime_ns, size, bytes)
+_template_cache = None
+
+# Last template parse check for /readyz: ((path, mtime_ns, size), error or None)
+_template_check = None
+
+# /readyz fails when the output volume has less free space than this
+READY_MIN_FREE_MB = float(os.environ.get('HYFLUX_READY_MIN_FREE_MB', 100))
+
+# Slide build engine for /api/generate: 'pptx' or 'fast' (see fast_writer.py)
+GENERATOR_ENGINE = os.environ.get('HYFLUX_GENERATOR_ENGINE', 'pptx')
+
+# Deck saving: 'pptx' (prs.save), 'raw' (copy unchanged template entries, see
+# package_writer.py) or 'stream' ('raw' plus each slide written as it is built;
+# needs the fast engine), and the deflate level of what they compress (0 = stored)
+PACKAGE_WRITER = os.environ.get('HYFLUX_PACKAGE_WRITER', 'pptx')
+COMPRESSLEVEL = int(os.environ.get('HYFLUX_COMPRESSLEVEL', 6))
+
+# Idle generators kept per worker and reused by /api/generate, each holding a
+# parsed template. A request that finds none idle builds its own.
+GENERATOR_POOL_SIZE = int(os.environ.get('HYFLUX_GENERATOR_POOL', 1))
+
+# 1 to run package_optimizer on each generated deck (dedupe, downsample and
+# recompress media) before it is served; costs time on media-heavy decks
+OPTIMIZE_OUTPUT = os.environ.get('HYFLUX_OPTIMIZE', '0') == '1'
+OPTIMIZE_TARGET_DPI = int(os.environ.get('HYFLUX_OPTIMIZE_DPI', 220))
+
+# Pooled generators and the template (path, mtime_ns, size) they were built from
+_generator_pool = {'template': None, 'idle': []}
+_generator_pool_lock = threading.Lock()
 
 
 def find_template():
@@ -58,6 +151,167 @@ def find_template():
     return None
 
 
+def load_template():
+    """Return (path, bytes) for the PowerPoint template, cached in memory.
+
+    The cache is keyed on mtime and size so a replaced template is picked
+    up without a restart. Returns (None, None) if no template exists.
+    """
+    global _template_cache
+    template_path = find_template()
+    if not template_path:
+        return None, None
+    
+    stat = template_path.stat()
+    cache = _template_cache
+    if cache and cache[0] == template_path and cache[1] == stat.st_mtime_ns and cache[2] == stat.st_size:
+        return template_path, cache[3]
+    
+    template_bytes = template_path.read_bytes()
+    _template_cache = (template_path, stat.st_mtime_ns, stat.st_size, template_bytes)
+    return template_path, template_bytes
+
+
+@contextmanager
+def pooled_generator():
+    """A generator for the current template, reused from this worker's pool.
+
+    Yields None if no template exists. Each generate() runs in its own
+    session, so a reused generator starts every deck from the clean
+    template; it goes back to the pool afterwards unless the template
+    file changed in the meantime.
+    """
+    template_path, template_bytes = load_template()
+    if not template_path:
+        yield None
+        return
+    cache = _template_cache
+    key = (template_path, cache[1], cache[2])
+    generator = None
+    with _generator_pool_lock:
+        if _generator_pool['template'] != key:
+            _generator_pool['template'], _generator_pool['idle'] = key, []
+        elif _generator_pool['idle']:
+            generator = _generator_pool['idle'].pop()
+    if generator is None:
+        generator = HyFluxPPTGenerator(str(template_path), template_bytes=template_bytes, engine=GENERATOR_ENGINE,
+                                       package_writer=PACKAGE_WRITER, compresslevel=COMPRESSLEVEL)
+    try:
+        yield generator
+    finally:
+        with _generator_pool_lock:
+            if _generator_pool['template'] == key and len(_generator_pool['idle']) < GENERATOR_POOL_SIZE:
+                _generator_pool['idle'].append(generator)
+
+
+def check_template():
+    """Readiness of the template: found, cached and parseable by the generator.
+
+    The parse result is kept until the file changes, so probes only pay for
+    a stat().
+    """
+    global _template_check
+    template_path, template_bytes = load_template()
+    if not template_path:
+        return {'ok': False, 'error': 'Template file not found'}
+    cache = _template_cache
+    key = (template_path, cache[1], cache[2])
+    check = _template_check
+    if check is None or check[0] != key:
+        try:
+            HyFluxPPTGenerator(str(template_path), template_bytes=template_bytes)
+            error = None
+        except Exception as e:
+            error = f'Template cannot be parsed: {e}'
+        check = _template_check = (key, error)
+    return {'ok': check[1] is None, 'error': check[1], 'path': str(template_path), 'size': cache[2]}
+
+
+def warm_up():
+    """Load and exercise everything a request needs before workers fork.
+
+    Reads and parses the template, runs strict validation and a throwaway
+    generation, so preforked workers share the loaded modules, the template
+    bytes and a pooled generator copy-on-write and serve their first
+    request warm.
+    """
+    template_path, template_bytes = load_template()
+    if not template_path:
+        print("⚠️  Warm-up: template not found, generation will fail until it is mounted")
+        return False
+    
+    sample = SAMPLE_YAML_PATH.read_text() if SAMPLE_YAML_PATH.exists() else (
+        'presentation:\n  title: "Warm-up"\nslides:\n'
+        '  - type: title_white\n    title: "Warm-up"\n    subtitle: "Warm-up"\n'
+    )
+    validate_yaml_strict(sample)
+    spec = _normalize_yaml_content(yaml.safe_load(sample))
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spec_path = Path(tmp_dir) / 'warm_up.yaml'
+        with open(spec_path, 'w') as f:
+            yaml.dump(spec, f, default_flow_style=False, sort_keys=False, allow_unicode=True)
+        # Leaves a generator in the pool for the forked workers
+        with pooled_generator() as generator:
+            generator.generate(str(spec_path), str(Path(tmp_dir) / 'warm_up.pptx'))
+    
+    check_template()
+    print(f"✓ Warm-up complete: template {template_path.name} ({len(template_bytes) / 1024:.0f} KB) preloaded")
+    return True
+
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the worker is up and answering. Touches nothing else."""
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: can this worker generate decks right now?
+
+    Fails (503) when the template is missing or unparseable or the output
+    volume is not writable or nearly full. Queue depth and Ollama health
+    are reported from cached state but don't fail the check, since deck
+    generation works without the chat assistant.
+    """
+    template = check_template()
+    
+    output_dir = app.config['OUTPUT_FOLDER']
+    try:
+        free = shutil.disk_usage(output_dir).free
+        writable = os.access(output_dir, os.W_OK)
+        output = {
+            'ok': writable and free >= READY_MIN_FREE_MB * 1024 * 1024,
+            'writable': writable,
+            'free_bytes': free,
+            'min_free_bytes': int(READY_MIN_FREE_MB * 1024 * 1024),
+        }
+    except OSError as e:
+        output = {'ok': False, 'error': str(e)}
+    
+    queue = {}
+    for name, admission in metrics.tracked_gates().items():
+        stats = admission.stats()
+        queue[name] = {
+            'active': stats['active'],
+            'queued': stats['queued'],
+            'max_queue': stats['max_queue'],
+            'saturated': stats['queued'] >= stats['max_queue'],
+        }
+    
+    ready = template['ok'] and output['ok']
+    return jsonify({
+        'ready': ready,
+        'checks': {
+            'template': template,
+            'output': output,
+            'queue': queue,  # this worker only
+            'ollama': ollama.status(),
+        }
+    }), 200 if ready else 503
+
+
 @app.route('/')
 def index():
     """Main page."""
@@ -123,189 +377,6 @@ slides:
         }), 500
 
 
-def validate_yaml_strict(yaml_content):
-    """Strict YAML→PPT validation according to HyFlux render-safe rules."""
-    errors = []
-    warnings = []
-    lines = yaml_content.split('\n')
-    patch_suggestions = []
-    
-    try:
-        spec = yaml.safe_load(yaml_content)
-        
-        # Check top-level keys
-        if not isinstance(spec, dict):
-            errors.append("Line 1: YAML must be a dictionary/object")
-            return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
-        
-        top_level_keys = set(spec.keys())
-        required_keys = {'presentation', 'slides'}
-        if not required_keys.issubset(top_level_keys):
-            missing = required_keys - top_level_keys
-            errors.append(f"Line 1: Missing required top-level keys: {', '.join(missing)}")
-        if len(top_level_keys) > len(required_keys):
-            extra = top_level_keys - required_keys
-            errors.append(f"Line 1: Unexpected top-level keys: {', '.join(extra)}. Must be exactly 'presentation' and 'slides'.")
-        
-        # Check presentation section
-        if 'presentation' in spec:
-            if not isinstance(spec['presentation'], dict):
-                errors.append("Line 2: 'presentation' must be a dictionary")
-        
-        # Check slides
-        if 'slides' not in spec:
-            errors.append("Missing 'slides' section")
-            return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
-        
-        if not isinstance(spec['slides'], list):
-            errors.append("'slides' must be a list")
-            return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
-        
-        # Validate each slide
-        valid_types = {
-            'title_white', 'divider', 'text_only', 'two_column', 
-            'three_column', 'quote', 'title_only', 'end_slide'
-        }
-        
-        # Required fields per type
-        required_fields = {
-            'title_white': {'title', 'subtitle'},
-            'divider': {'title'},
-            'text_only': {'title', 'content'},
-            'two_column': {'title', 'left_content', 'right_content'},
-            'three_column': {'title', 'left_content', 'middle_content', 'right_content'},
-            'quote': {'quote', 'attribution'},
-            'title_only': {'title'},
-            'end_slide': {'title'}  # end_slide MUST have title only
-        }
-        
-        # Allowed fields per type (required + optional)
-        allowed_fields = {
-            'title_white': {'type', 'title', 'subtitle'},
-            'divider': {'type', 'title'},
-            'text_only': {'type', 'title', 'content'},
-            'two_column': {'type', 'title', 'left_content', 'right_content'},
-            'three_column': {'type', 'title', 'left_content', 'middle_content', 'right_content'},
-            'quote': {'type', 'quote', 'attribution'},
-            'title_only': {'type', 'title'},
-            'end_slide': {'type', 'title'}  # end_slide: title ONLY, no content/contact
-        }
-        
-        for i, slide in enumerate(spec['slides']):
-            slide_num = i + 1
-            line_num = None
-            
-            # Find line number for this slide
-            for line_idx, line in enumerate(lines, 1):
-                if f'- type: {slide.get("type", "")}' in line:
-                    line_num = line_idx
-                    break
-                elif line.strip().startswith('-') and i == 0:
-                    line_num = line_idx
-                    break
-            
-            if not isinstance(slide, dict):
-                errors.append(f"Slide {slide_num} (line ~{line_num or '?'}): must be an object")
-                continue
-            
-            slide_type = slide.get('type', '')
-            if not slide_type:
-                errors.append(f"Slide {slide_num} (line ~{line_num or '?'}): missing 'type' field")
-                continue
-            
-            if slide_type not in valid_types:
-                errors.append(f"Slide {slide_num} (line ~{line_num or '?'}): invalid type '{slide_type}'. Must be one of: {', '.join(sorted(valid_types))}")
-                continue
-            
-            # Check required fields
-            required = required_fields.get(slide_type, set())
-            slide_keys = set(slide.keys())
-            missing = required - slide_keys
-            if missing:
-                errors.append(f"Slide {slide_num} (type: {slide_type}, line ~{line_num or '?'}): missing required fields: {', '.join(missing)}")
-            
-            # Check for forbidden fields (render-blocking)
-            allowed = allowed_fields.get(slide_type, set())
-            forbidden = slide_keys - allowed
-            
-            # Special handling for end_slide and title_only
-            if slide_type == 'end_slide':
-                if 'content' in slide or 'contact' in slide:
-                    errors.append(f"Slide {slide_num} (end_slide, line ~{line_num or '?'}): MUST NOT contain 'content' or 'contact' - text will not render. Use 'title' only.")
-                    patch_suggestions.append(f"Slide {slide_num}: Remove 'content'/'contact' from end_slide (only 'title' renders)")
-            
-            if slide_type == 'title_only':
-                if 'content' in slide:
-                    warnings.append(f"Slide {slide_num} (title_only, line ~{line_num or '?'}): 'content' field present but will not render. title_only is for title only.")
-                    patch_suggestions.append(f"Slide {slide_num}: Remove 'content' from title_only or change to text_only")
-            
-            if slide_type == 'divider':
-                if 'content' in slide:
-                    warnings.append(f"Slide {slide_num} (divider, line ~{line_num or '?'}): 'content' field present but divider is title-only.")
-                    patch_suggestions.append(f"Slide {slide_num}: Remove 'content' from divider or change to text_only")
-            
-            # Check for other unexpected fields
-            if forbidden:
-                # Filter out the special cases we already handled
-                forbidden_filtered = forbidden - {'content', 'contact'}
-                if forbidden_filtered:
-                    warnings.append(f"Slide {slide_num} (type: {slide_type}, line ~{line_num or '?'}): unexpected fields (may not render): {', '.join(forbidden_filtered)}")
-        
-        # Check indentation (tabs are errors)
-        for line_idx, line in enumerate(lines, 1):
-            if '\t' in line:
-                errors.append(f"Line {line_idx}: Tabs detected. Use 2 spaces for indentation.")
-        
-        # Check block scalar indentation
-        in_block_scalar = False
-        scalar_start_line = None
-        for line_idx, line in enumerate(lines, 1):
-            if '|' in line and ':' in line:
-                in_block_scalar = True
-                scalar_start_line = line_idx
-                continue
-            if in_block_scalar:
-                if line.strip() and ':' in line and not line.strip().startswith('-') and not line.startswith(' '):
-                    in_block_scalar = False
-                elif in_block_scalar and line.strip():
-                    # Check if content is properly indented (at least 2 spaces after the key)
-                    if not (line.startswith('      ') or line.startswith('        ') or not line.strip()):
-                        if line.startswith('    ') and ':' in lines[scalar_start_line-1]:
-                            # This might be okay if it's the first content line
-                            pass
-                        else:
-                            warnings.append(f"Line {line_idx}: Block scalar content may have incorrect indentation (should be 2+ spaces)")
-        
-        # Generate minimal patch if there are errors
-        patch = ""
-        if errors:
-            patch = "Minimal patch suggestions:\n"
-            for suggestion in patch_suggestions:
-                patch += f"  - {suggestion}\n"
-            if not patch_suggestions:
-                patch += "  - Fix the errors listed above\n"
-        
-        valid = len(errors) == 0
-        return {
-            'valid': valid,
-            'errors': errors,
-            'warnings': warnings,
-            'slide_count': len(spec.get('slides', [])),
-            'patch': patch
-        }
-        
-    except yaml.YAMLError as e:
-        # Try to extract line number from error
-        error_str = str(e)
-        line_match = re.search(r'line (\d+)', error_str)
-        line_num = line_match.group(1) if line_match else '?'
-        errors.append(f"Line {line_num}: Invalid YAML syntax - {error_str}")
-        return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
-    except Exception as e:
-        errors.append(f"Validation error: {str(e)}")
-        return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
-
-
 @app.route('/api/validate', methods=['POST'])
 def validate_yaml():
     """Validate YAML content with strict rules."""
@@ -397,7 +468,7 @@ def _normalize_yaml_content(spec):
             is_bullet = stripped.startswith('•') or \
                        stripped.startswith('-') or \
                        stripped.startswith('*') or \
-                       re.match(r'^\d+[\.\)]\s', stripped)
+                       NUMBERED_ITEM_RE.match(stripped)
             
             # Check if line looks like a heading (ends with :, no bullet, short)
             is_heading = not is_bullet and stripped.endswith(':') and len(stripped) < 50
@@ -409,7 +480,7 @@ def _normalize_yaml_content(spec):
                 if not stripped.startswith('•'):
                     if stripped.startswith('-') or stripped.startswith('*'):
                         stripped = '•' + stripped[1:].strip()
-                    elif re.match(r'^\d+[\.\)]\s', stripped):
+                    elif NUMBERED_ITEM_RE.match(stripped):
                         # Keep numbered items
                         pass
                     else:
@@ -461,70 +532,150 @@ def _normalize_yaml_content(spec):
 
 @app.route('/api/generate', methods=['POST'])
 def generate_presentation():
-    """Generate PowerPoint from YAML."""
+    """Generate PowerPoint from YAML.
+    
+    The answer includes `timings` (milliseconds per stage and per slide
+    type, slowest slides), also sent as a Server-Timing header.
+    """
+    request_started = time.perf_counter()
+    stages = {}
     try:
         data = request.json
         yaml_content = data.get('yaml', '')
         
         # Validate YAML first
+        started = time.perf_counter()
         spec = yaml.safe_load(yaml_content)
+        stages['parse'] = time.perf_counter() - started
         if not spec or 'slides' not in spec:
+            record_generation('invalid', stages)
             return jsonify({
                 'success': False,
                 'error': 'Invalid YAML structure'
             }), 400
         
         # Normalize content before generation
+        started = time.perf_counter()
         spec = _normalize_yaml_content(spec)
+        stages['normalize'] = time.perf_counter() - started
         
-        # Find template
-        template_path = find_template()
-        if not template_path:
-            return jsonify({
-                'success': False,
-                'error': 'Template file not found. Please ensure HyFlux_Template_-.pptx is in templates/ directory.'
-            }), 500
-        
-        # Create temporary YAML file with normalized content
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-            yaml.dump(spec, f, default_flow_style=False, sort_keys=False, allow_unicode=True)
-            temp_yaml = f.name
-        
-        try:
-            # Generate output filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            project_name = spec.get('presentation', {}).get('title', 'presentation')
-            project_name = secure_filename(project_name.replace(' ', '_'))[:50]
-            output_filename = f"{timestamp}_{project_name}.pptx"
-            output_path = Path(app.config['OUTPUT_FOLDER']) / output_filename
+        # Take a generator from this worker's pool (template parsed once per worker)
+        started = time.perf_counter()
+        with pooled_generator() as generator:
+            if generator is None:
+                record_generation('error', stages)
+                return jsonify({
+                    'success': False,
+                    'error': 'Template file not found. Please ensure HyFlux_Template_-.pptx is in templates/ directory.'
+                }), 500
+            stages['template_acquire'] = time.perf_counter() - started
             
-            # Generate presentation
-            generator = HyFluxPPTGenerator(str(template_path))
-            result = generator.generate(temp_yaml, str(output_path))
+            # Create temporary YAML file with normalized content
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+                yaml.dump(spec, f, default_flow_style=False, sort_keys=False, allow_unicode=True)
+                temp_yaml = f.name
             
-            return jsonify({
-                'success': True,
-                'filename': output_filename,
-                'slide_count': result['slide_count'],
-                'message': f'Generated {result["slide_count"]} slides'
-            })
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_yaml):
-                os.unlink(temp_yaml)
+            try:
+                # Generate output filename
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                project_name = spec.get('presentation', {}).get('title', 'presentation')
+                project_name = secure_filename(project_name.replace(' ', '_'))[:50]
+                output_filename = f"{timestamp}_{project_name}.pptx"
+                output_path = Path(app.config['OUTPUT_FOLDER']) / output_filename
+            
+                # Generate presentation
+                result = generator.generate(temp_yaml, str(output_path), hooks=[SlideMetricsHooks()])
+                retention.notify()
+            
+                timings = result['timings']
+                generator_ms = timings['stages_ms']
+                # The generator re-reads the spec from the temp file
+                stages['spec_reload'] = (generator_ms.get('spec_load', 0) + generator_ms.get('normalize', 0)) / 1000
+                stages['slide_build'] = generator_ms.get('slides', 0) / 1000
+                stages['save'] = generator_ms.get('save', 0) / 1000
+                optimized = optimize_output(output_path, stages) if OPTIMIZE_OUTPUT else None
+                record_generation('success', stages, result['slide_count'])
+            
+                stages_ms = {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()}
+                stages_ms['total'] = round((time.perf_counter() - request_started) * 1000, 3)
+                response = jsonify({
+                    'success': True,
+                    'filename': output_filename,
+                    'slide_count': result['slide_count'],
+                    'message': f'Generated {result["slide_count"]} slides',
+                    'timings': {
+                        'stages_ms': stages_ms,
+                        'slide_types': timings['slide_types'],
+                        'slowest_slides': timings['slowest_slides'],
+                    },
+                    **({'optimized': optimized} if optimized else {})
+                })
+                response.headers['Server-Timing'] = server_timing(stages_ms)
+                return response
+            finally:
+                # Clean up temp file
+                if os.path.exists(temp_yaml):
+                    os.unlink(temp_yaml)
                 
     except yaml.YAMLError as e:
+        record_generation('invalid', stages)
         return jsonify({
             'success': False,
             'error': f'Invalid YAML: {str(e)}'
         }), 400
     except Exception as e:
+        record_generation('error', stages)
         return jsonify({
             'success': False,
             'error': f'Generation failed: {str(e)}'
         }), 500
 
 
+def optimize_output(output_path, stages):
+    """Optimize a generated deck in place; returns a size summary, or None if it failed.
+    
+    optimize_package replaces the file only once the new one is complete,
+    so a failure leaves the deck as generated.
+    """
+    started = time.perf_counter()
+    try:
+        report = optimize_package(output_path, target_dpi=OPTIMIZE_TARGET_DPI)
+    except Exception as e:
+        print(f"Optimizing {output_path.name} failed, serving it unoptimized: {e}")
+        return None
+    finally:
+        stages['optimize'] = time.perf_counter() - started
+    return {
+        'size_before': report['size_before'],
+        'size_after': report['size_after'],
+        'bytes_saved': report['bytes_saved'],
+        **{action: len(report[action]) for action in ('dropped', 'deduped', 'downsampled', 'recompressed')},
+    }
+
+
+class SlideMetricsHooks(GeneratorHooks):
+    """Feeds per-slide build times, by layout, to /metrics."""
+    
+    def on_end(self, stage, seconds, info):
+        if stage == 'slide':
+            metrics.slide_build_duration.observe(seconds, pid=metrics.pid(), layout=info['layout'])
+
+
+def server_timing(stages_ms):
+    """Server-Timing header value, e.g. `parse;dur=1.2, save;dur=14.0`."""
+    return ', '.join(f'{stage};dur={ms}' for stage, ms in stages_ms.items())
+
+
+def record_generation(result, stages, slide_count=0):
+    """Export one generation's outcome and stage timings (seconds) to /metrics."""
+    pid = metrics.pid()
+    metrics.generations.inc(pid=pid, result=result)
+    if slide_count:
+        metrics.generated_slides.inc(slide_count, pid=pid)
+    for stage, seconds in stages.items():
+        metrics.generation_stage_duration.observe(seconds, pid=pid, stage=stage)
+
+
 @app.route('/api/download/<filename>')
 def download_file(filename):
     """Download generated presentation."""
@@ -536,8 +687,10 @@ def download_file(filename):
                 'error': 'File not found'
             }), 404
         
-        return send_file(
-            str(file_path),
+        # The last download time drives least-recently-used eviction
+        retention.touch(file_path)
+        return http_cache.send_file_cached(
+            file_path,
             as_attachment=True,
             download_name=filename,
             mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation'
@@ -594,95 +747,345 @@ def upload_yaml():
         }), 500
 
 
-def clean_yaml_content(yaml_content):
-    """Clean YAML content to ensure it's a single valid document."""
-    if not yaml_content:
-        return None
-    
-    # Remove document separators (---)
-    lines = yaml_content.split('\n')
-    cleaned_lines = []
-    
-    for line in lines:
-        stripped = line.strip()
-        # Skip standalone document separators
-        if stripped == '---' or stripped == '...':
-            continue
-        # Skip lines that are just separators with whitespace
-        if stripped.startswith('---') and len(stripped) <= 5:
-            continue
-        cleaned_lines.append(line)
+def get_ollama_base_url():
+    """Get the Ollama base URL (discovered once, cached with a TTL)."""
+    return ollama.base_url()
+
+
+# Structured mode: Ollama constrains the answer to this JSON schema, so the
+# spec is decoded directly instead of being scraped out of free text
+SPEC_JSON_SCHEMA = spec_json_schema()
+
+STRUCTURED_SYSTEM_PROMPT = """You are an AI assistant generating PowerPoint slide specifications for the HyFlux template.
+
+Answer with a single JSON object that matches the provided schema:
+- 'presentation' holds 'title', 'author' and 'date' (YYYY-MM-DD)
+- 'slides' is the list of slides; every slide has a 'type' and exactly the fields for that type:
+  - title_white: title, subtitle
+  - divider: title (section divider, no body text)
+  - text_only: title, content
+  - two_column: title, left_content, right_content
+  - three_column: title, left_content, middle_content, right_content
+  - quote: quote, attribution
+  - title_only: title (for charts/images, no body text)
+  - end_slide: title (closing slide, no body text)
+
+TEXT RULES:
+1. Body fields (content, left_content, middle_content, right_content) are bullet lists: one line per bullet, separated by newlines
+2. Every bullet line starts with "• " (no -, * or numbered lists)
+3. Section labels are bullets too (e.g. "• Core pack:")
+4. No blank lines inside bullet lists
+5. Start with a title_white slide and finish with an end_slide
+
+If the user asks to change an existing deck, answer with the complete updated spec."""
+
+# Changes whenever the prompt text changes, so stale cached answers are never served
+CHAT_PROMPT_VERSION = prompt_builder.PROMPT_VERSION
+STRUCTURED_PROMPT_VERSION = hashlib.sha256(
+    (STRUCTURED_SYSTEM_PROMPT + json.dumps(SPEC_JSON_SCHEMA, sort_keys=True)).encode('utf-8')
+).hexdigest()[:12]
+
+# How long Ollama keeps the model loaded after each turn
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+
+chat_cache = ChatResponseCache(Path(app.config['CACHE_FOLDER']) / 'chat_responses.sqlite3')
+chat_sessions = ChatSessionStore(Path(app.config['CACHE_FOLDER']) / 'chat_sessions.sqlite3')
+spec_validity = ValidityStats()
+
+
+def is_structured(session):
+    """Whether a session runs in schema-constrained (JSON) output mode."""
+    return session['system'] == STRUCTURED_SYSTEM_PROMPT
+
+
+def lookup_chat_cache(data, model, message, prompt_version=CHAT_PROMPT_VERSION):
+    """Return (cache_key, cached_payload) for a chat request.
     
-    yaml_content = '\n'.join(cleaned_lines).strip()
+    Sending "no_cache": true skips the lookup; the fresh answer still
+    replaces the cached one.
+    """
+    cache_key = chat_cache.make_key(model, prompt_version, message)
+    if data.get('no_cache'):
+        chat_cache.record_bypass()
+        return cache_key, None
+    return cache_key, chat_cache.get(cache_key)
+
+
+def store_chat_cache(cache_key, model, raw_response, ai_response, send_yaml, validation_result):
+    chat_cache.put(cache_key, model, {
+        'raw_response': raw_response,
+        'response': ai_response,
+        'yaml_content': send_yaml,
+        'validation': validation_result
+    })
+
+
+def ollama_chat_payload(model, messages, stream, structured=False):
+    """Request body for Ollama /api/chat."""
+    payload = {
+        'model': model,
+        'messages': messages,
+        'stream': stream,
+        'keep_alive': OLLAMA_KEEP_ALIVE
+    }
+    if structured:
+        payload['format'] = SPEC_JSON_SCHEMA
+    return payload
+
+
+def ollama_timings(result):
+    """Per-turn timings reported by Ollama (its durations are in ns).
     
-    # Remove any leading/trailing separators
-    yaml_content = re.sub(r'^---+\s*\n', '', yaml_content, flags=re.MULTILINE)
-    yaml_content = re.sub(r'\n---+\s*$', '', yaml_content, flags=re.MULTILINE)
-    yaml_content = re.sub(r'\n\.\.\.\s*$', '', yaml_content, flags=re.MULTILINE)
+    prompt_eval_count only counts tokens the model actually had to process,
+    so it drops sharply once a session's system prompt is cached.
+    """
+    return {
+        'total_ms': round(result.get('total_duration', 0) / 1e6),
+        'load_ms': round(result.get('load_duration', 0) / 1e6),
+        'prompt_eval_ms': round(result.get('prompt_eval_duration', 0) / 1e6),
+        'prompt_eval_count': result.get('prompt_eval_count'),
+        'eval_ms': round(result.get('eval_duration', 0) / 1e6),
+        'eval_count': result.get('eval_count')
+    }
+
+
+def extract_yaml_from_response(ai_response):
+    """Extract and repair the YAML spec from a model response (None if absent)."""
+    yaml_content, report = yaml_repair.run(ai_response)
+    if report['fired'] and report['fired'] != ['extract_fence']:
+        print(f"YAML repair: {', '.join(report['fired'])} "
+              f"({report['parses']} parses, {report['ms']} ms, {'ok' if yaml_content else 'failed'})")
+    return yaml_content
+
+
+def decode_structured_response(raw_response):
+    """(display text, YAML) for a schema-constrained JSON answer."""
+    try:
+        spec = json.loads(raw_response)
+    except ValueError:
+        return raw_response, None
+    if not isinstance(spec, dict):
+        return raw_response, None
+    yaml_content = spec_to_yaml(spec)
+    return f"```yaml\n{yaml_content}```", yaml_content
+
+
+def annotate_chat_response(ai_response, yaml_content):
+    """Validate extracted YAML and append usage notes or issues to the response.
     
-    # If content still has multiple documents, take the first one
-    if '---' in yaml_content:
-        parts = yaml_content.split('---')
-        # Find the part with 'presentation:' or 'slides:'
-        for part in parts:
-            if 'presentation:' in part or 'slides:' in part:
-                yaml_content = part.strip()
-                break
+    Returns (ai_response, send_yaml, validation_result); send_yaml is only
+    set when the YAML passed strict validation.
+    """
+    # Validate extracted YAML if present
+    validation_result = None
+    if yaml_content:
+        validation_result = validate_yaml_strict(yaml_content)
+        
+        if not validation_result['valid']:
+            # Add validation errors to response
+            error_summary = "\n\n⚠️ **YAML Validation Issues Detected:**\n\n"
+            error_summary += "**Errors:**\n"
+            for error in validation_result['errors']:
+                error_summary += f"- {error}\n"
+            if validation_result['warnings']:
+                error_summary += "\n**Warnings:**\n"
+                for warning in validation_result['warnings']:
+                    error_summary += f"- {warning}\n"
+            error_summary += "\nThe YAML has been extracted but needs fixes before use."
+            ai_response = ai_response + error_summary
         else:
-            # If no part has presentation/slides, use the first non-empty part
-            yaml_content = parts[0].strip() if parts else yaml_content
+            # Add usage instructions if YAML is valid
+            instructions = """
+
+### How to use the YAML
+
+1. **Copy the YAML block** above into the editor on the left.
+2. **Replace placeholders**:
+   - Update `title`, `author`, and `date` with your own values
+   - Modify slide content to match your needs
+   - Adjust slide types and layouts as required
+3. **Validate** the YAML using the Validate button (already validated ✓)
+4. **Generate** your PowerPoint presentation
+5. **Review** the generated slides and fine-tune if needed
+
+The YAML has been automatically extracted and validated. It's ready to use in the editor."""
+            ai_response = ai_response + instructions
+            
+            # If there are warnings, add them
+            if validation_result['warnings']:
+                warnings_text = "\n\n⚠️ **Validation Warnings:**\n"
+                for warning in validation_result['warnings']:
+                    warnings_text += f"- {warning}\n"
+                ai_response = ai_response + warnings_text
     
-    return yaml_content
+    # Only send YAML if it's valid
+    send_yaml = yaml_content if (yaml_content and (not validation_result or validation_result['valid'])) else None
+    return ai_response, send_yaml, validation_result
 
 
-def get_ollama_base_url():
-    """Get the appropriate Ollama base URL based on environment."""
-    import os
-    # Check if we're in Docker
+def ollama_connection_error(ollama_base):
+    """Build the user-facing message for an unreachable Ollama."""
+    error_msg = f'Cannot connect to Ollama at {ollama_base}. '
+    error_msg += 'Please ensure:\n'
+    error_msg += '1. Ollama is installed and running\n'
+    error_msg += '2. Ollama is accessible at the expected URL\n'
     if os.path.exists('/.dockerenv'):
-        # Try multiple methods to reach host
-        # host.docker.internal works on Docker Desktop (Mac/Windows)
-        # On Linux, we might need to use the host's IP or gateway
-        import socket
-        try:
-            # Try host.docker.internal first (Docker Desktop)
-            test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            test_socket.settimeout(1)
-            result = test_socket.connect_ex(('host.docker.internal', 11434))
-            test_socket.close()
-            if result == 0:
-                return 'http://host.docker.internal:11434'
-        except:
-            pass
-        
-        # Fallback: try gateway IP (Linux Docker)
-        try:
-            with open('/etc/hosts', 'r') as f:
-                for line in f:
-                    if 'gateway' in line.lower():
-                        gateway_ip = line.split()[0]
-                        return f'http://{gateway_ip}:11434'
-        except:
-            pass
-        
-        # Last resort: try host.docker.internal anyway
-        return 'http://host.docker.internal:11434'
+        error_msg += '3. For Docker: Ensure host networking is accessible\n'
+        error_msg += '   Try: docker run --add-host=host.docker.internal:host-gateway ...'
+    return error_msg
+
+
+def ollama_overloaded(e):
+    """429 response telling the client when to retry."""
+    response = jsonify({
+        'success': False,
+        'error': f'{e}. Please try again in {e.retry_after} seconds.',
+        'retry_after': e.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def coalesce_key(model, messages):
+    """Identical model + conversation share one in-flight generation."""
+    raw = json.dumps([model, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def resolve_chat_model(data, message, kind=None):
+    """Return (model, routing) for a chat request.
+    
+    Requests with model "auto" (or without a model when HYFLUX_MODEL_ROUTING=1)
+    are routed by request size and model residency; routing is None for an
+    explicitly chosen model. A continued session keeps its model.
+    """
+    model = data.get('model') or ('auto' if router.enabled else 'llama3.2')  # Default model
+    if model != 'auto':
+        return model, None
+    session = chat_sessions.get(data.get('session_id'))
+    if session:
+        return session['model'], {
+            'requested': 'auto',
+            'model': session['model'],
+            'kind': 'session',
+            'reason': 'continuing session',
+            'resident': residency.is_loaded(session['model'])
+        }
+    return router.route(message, kind)
+
+
+def start_chat_turn(data, model, message, routing=None):
+    """Resolve the session and cache entry for a chat turn.
+    
+    Returns (session, cache_key, cached, message); cached is the stored
+    payload when this turn can be answered from the response cache, and
+    message is the user message to send (a later turn may carry rules for
+    slide types the session's system prompt left out).
+    """
+    structured = bool(data.get('structured'))
+    session = chat_sessions.get(data.get('session_id'))
+    if structured:
+        if not (session and session['model'] == model and is_structured(session)):
+            session = chat_sessions.create(model, STRUCTURED_SYSTEM_PROMPT)
+    elif session and session['model'] == model and not is_structured(session) \
+            and prompt_builder.is_current(session['system']):
+        message = prompt_builder.followup_message(session['system'], session['messages'], message)
+    else:
+        # The system prompt is trimmed to the first request and then kept for
+        # the whole session, so Ollama can reuse the evaluated prefix
+        system, report = prompt_builder.build_system_prompt(message, model)
+        session = chat_sessions.create(model, system)
+        session['prompt'] = report
+        print(f"Chat prompt for {model}: ~{report['estimated_tokens']}/{report['budget']} tokens, "
+              f"types={','.join(report['types'])}"
+              + (f", dropped={','.join(report['dropped'])}" if report['dropped'] else ''))
+    
+    # Only a session's first turn is independent of history, so only it is cacheable;
+    # the key covers the trimmed prompt, which is derived from the message and model
+    prompt_version = STRUCTURED_PROMPT_VERSION if structured else CHAT_PROMPT_VERSION
+    cache_key, cached = (
+        lookup_chat_cache(data, model, message, prompt_version) if not session['messages'] else (None, None)
+    )
+    if routing:
+        session['routing'] = routing
+    if cached:
+        chat_sessions.append(session, message, cached['raw_response'])
+    return session, cache_key, cached, message
+
+
+def session_extras(session):
+    """Per-turn reports carried on a session: the prompt it was built with, routing."""
+    return {key: session[key] for key in ('prompt', 'routing') if key in session}
+
+
+def cached_chat_payload(session, model, cached):
+    """/api/chat response body for a cache hit."""
+    return {
+        'success': True,
+        'response': cached['response'],
+        'yaml_content': cached['yaml_content'],
+        'model': model,
+        'validation': cached['validation'],
+        'session_id': session['id'],
+        'cached': True,
+        **session_extras(session)
+    }
+
+
+def complete_chat_turn(session, model, message, cache_key, raw_response):
+    """Record a finished reply; returns (ai_response, send_yaml, validation_result)."""
+    chat_sessions.append(session, message, raw_response)
+    if is_structured(session):
+        # Every structured answer is a spec attempt, decoded without repair
+        display, yaml_content = decode_structured_response(raw_response)
+        ai_response, send_yaml, validation_result = annotate_chat_response(display, yaml_content)
+        spec_validity.record('structured', send_yaml is not None)
     else:
-        # Not in Docker, use localhost
-        return 'http://localhost:11434'
+        yaml_content = extract_yaml_from_response(raw_response)
+        ai_response, send_yaml, validation_result = annotate_chat_response(raw_response, yaml_content)
+        if yaml_content:
+            spec_validity.record('freeform', send_yaml is not None)
+    if cache_key:
+        store_chat_cache(cache_key, model, raw_response, ai_response, send_yaml, validation_result)
+    return ai_response, send_yaml, validation_result
+
+
+def finish_chat_turn(session, model, message, cache_key, result):
+    """Record Ollama's reply and build the /api/chat response body."""
+    raw_response = result.get('message', {}).get('content') or 'No response generated'
+    timings = ollama_timings(result)
+    residency.record(model, timings)
+    print(f"Chat ({model}): prompt eval {timings['prompt_eval_count']} tokens in {timings['prompt_eval_ms']} ms")
+    
+    ai_response, send_yaml, validation_result = complete_chat_turn(session, model, message, cache_key, raw_response)
+    
+    return {
+        'success': True,
+        'response': ai_response,
+        'yaml_content': send_yaml,  # Only send if valid
+        'model': model,
+        'validation': validation_result if validation_result else None,
+        'session_id': session['id'],
+        'cached': False,
+        'timings': timings,
+        **session_extras(session)
+    }
 
 
 @app.route('/api/chat', methods=['POST'])
 def chat_with_ollama():
-    """Chat with Ollama API."""
+    """Chat with Ollama API.
+    
+    Pass the returned session_id back to continue the conversation; the
+    system prompt is only evaluated on the first turn of a session.
+    """
     try:
         data = request.json
         message = data.get('message', '')
-        model = data.get('model', 'llama3.2')  # Default model
         
         # Get Ollama base URL
         ollama_base = get_ollama_base_url()
-        ollama_url = f'{ollama_base}/api/generate'
         
         if not message:
             return jsonify({
@@ -690,402 +1093,36 @@ def chat_with_ollama():
                 'error': 'No message provided'
             }), 400
         
-        # Prepare prompt - add context about PPT generation
-        context_prompt = """You are an AI assistant helping users create PowerPoint presentations using YAML specifications for the HyFlux template.
-
-You must follow STRICT YAML→PPT validation rules. Your output will be validated against these rules:
-
-STRICT VALIDATION RULES (render-safe):
-1. Top-level keys MUST be exactly: 'presentation' and 'slides' (nothing else)
-2. Slides must be under 'slides:' and indented with 2 spaces (NO TABS)
-3. Supported slide types ONLY: title_white, divider, text_only, two_column, three_column, quote, title_only, end_slide
-4. Required fields per type:
-   - title_white: MUST have 'title' and 'subtitle'
-   - divider: MUST have 'title' only (divider is title-only, no content)
-   - text_only: MUST have 'title' and 'content'
-   - two_column: MUST have 'title', 'left_content', 'right_content'
-   - three_column: MUST have 'title', 'left_content', 'middle_content', 'right_content'
-   - quote: MUST have 'quote' and 'attribution'
-   - title_only: MUST have 'title' only (title_only should not be used for body text)
-   - end_slide: MUST have 'title' only (MUST NOT contain 'content' or 'contact' - text will NOT render)
-5. Render rules:
-   - end_slide: Template-only, text in 'content' or 'contact' will NOT render. Use 'title' only.
-   - title_only: Should not be used for body text. Use text_only if you need content.
-   - divider: Title-only, no content field.
-6. Block scalars (|) must have correctly indented content (2+ spaces)
-7. Use 2 spaces for indentation throughout (NO TABS)
-8. All YAML must be valid and parseable
-
-
-CRITICAL YAML REQUIREMENTS:
-1. Output ONLY a SINGLE YAML document - NO document separators (---)
-2. Always start with 'presentation:' section at the top with title, author, date
-3. Use proper indentation (2 spaces, no tabs)
-4. Use double quotes for strings with special characters
-5. Do NOT include multiple YAML documents or separators
-6. The YAML must be a single, continuous document
-
-SUPPORTED SLIDE TYPES (use lowercase):
-- title_white: Title slide
-- divider: Section divider slide
-- text_only: Text content slide
-- two_column: Two-column layout
-- three_column: Three-column layout
-- title_only: Title only (for charts/images)
-- quote: Quote slide
-- end_slide: Closing slide
-
-FIELD NAMES - USE THESE EXACT NAMES:
-
-For TITLE slides (type: title_white):
-```yaml
-- type: title_white
-  title: "Main Title"
-  subtitle: "Subtitle text (can include \\n for line breaks)"
-```
-
-For DIVIDER slides:
-```yaml
-- type: divider
-  title: "Section Name"
-```
-
-For TEXT_ONLY slides:
-```yaml
-- type: text_only
-  title: "Slide Title"
-  content: |
-    • Bullet point 1
-    • Bullet point 2
-    • Section label: (headings must be bullets)
-    • More content
-    # Note: No blank lines inside bullet blocks, all bullets start with •
-```
-
-For TWO_COLUMN slides:
-```yaml
-- type: two_column
-  title: "Slide Title"
-  left_content: |
-    Left column content
-    • Item 1
-    • Item 2
-  right_content: |
-    Right column content
-    • Item 1
-    • Item 2
-```
-
-For THREE_COLUMN slides:
-```yaml
-- type: three_column
-  title: "Slide Title"
-  left_content: |
-    Left content
-    • Item 1
-  middle_content: |
-    Middle content
-    • Item 1
-  right_content: |
-    Right content
-    • Item 1
-```
-
-For QUOTE slides:
-```yaml
-- type: quote
-  quote: "The quote text here"
-  attribution: "Author Name"
-```
-
-For END_SLIDE (CRITICAL: title only, content/contact will NOT render):
-```yaml
-- type: end_slide
-  title: "Thank You"
-  # DO NOT use 'content' or 'contact' - they will NOT render!
-  # end_slide is template-only, only 'title' displays
-```
-
-COMPLETE WORKING EXAMPLE:
-```yaml
-presentation:
-  title: "Presentation Title"
-  author: "Author Name"
-  date: "2025-12-25"
-
-slides:
-  - type: title_white
-    title: "Main Title"
-    subtitle: "Subtitle here"
-  
-  - type: divider
-    title: "Section 1"
-  
-  - type: text_only
-    title: "Agenda"
-    content: |
-      1. First item
-      2. Second item
-      3. Third item
-  
-  - type: two_column
-    title: "Two Column Slide"
-    left_content: |
-      Left side
-      • Point 1
-      • Point 2
-    right_content: |
-      Right side
-      • Point 1
-      • Point 2
-  
-  - type: three_column
-    title: "Three Column Slide"
-    left_content: "Left"
-    middle_content: "Middle"
-    right_content: "Right"
-  
-  - type: end_slide
-    title: "Thank You"
-    # Note: 'content' and 'contact' fields will NOT render on end_slide
-```
-
-CRITICAL FIELD NAME RULES:
-- Use 'subtitle' for title_white slides (NOT 'content')
-- Use 'left_content' and 'right_content' for two_column (NOT 'content.left' or nested structures)
-- Use 'left_content', 'middle_content', 'right_content' for three_column
-- Use 'content' for text_only slides (as multi-line string with |)
-- Use 'quote' and 'attribution' for quote slides
-- end_slide: Use 'title' ONLY. Do NOT use 'content' or 'contact' - they will NOT render
-- Always use the exact field names shown above
-- Do NOT use nested content structures like content.left/right
-- Use multi-line strings (|) for content that spans multiple lines
-- Use 2 spaces for indentation (NO TABS)
-
-CONTENT NORMALIZATION RULES (applied automatically before PPT generation):
-1. Every bullet line MUST start with • (convert -, *, numbered lists to •)
-2. No headings without bullets inside text_only - convert headings to bullets (e.g. "Core pack:" → "• Core pack:")
-3. No blank lines inside bullet blocks (blank lines break bullet formatting)
-4. Section labels MUST be written as bullet text (e.g. "• Core pack:" not "Core pack:")
-5. No reliance on formatting semantics the renderer doesn't support
-
-VALIDATION CHECKLIST BEFORE OUTPUTTING:
-✓ Top-level has only 'presentation' and 'slides'
-✓ All slides have correct 'type' from supported list
-✓ Each slide has ALL required fields for its type
-✓ end_slide has ONLY 'title' (no content/contact)
-✓ title_only has ONLY 'title' (no content)
-✓ divider has ONLY 'title' (no content)
-✓ All bullet points start with • (not -, *, or numbers)
-✓ No headings without bullets in text content
-✓ No blank lines inside bullet blocks
-✓ Section labels are bullet text (e.g. • Section:)
-✓ Indentation uses 2 spaces (no tabs)
-✓ Block scalars are properly indented
-✓ YAML is valid and parseable
-
-User question: """
+        model, routing = resolve_chat_model(data, message)
+        session, cache_key, cached, message = start_chat_turn(data, model, message, routing)
+        if cached:
+            return jsonify(cached_chat_payload(session, model, cached))
+        
+        messages = chat_sessions.messages(session, message)
         
-        full_prompt = context_prompt + message
+        def call_ollama():
+            try:
+                response = ollama.post(
+                    '/api/chat',
+                    json=ollama_chat_payload(model, messages, stream=False, structured=is_structured(session)),
+                    timeout=60
+                )
+                response.raise_for_status()
+            except requests.exceptions.RequestException:
+                residency.record_error(model)
+                raise
+            return response.json()
         
-        # Call Ollama API
+        # Call Ollama API (through the admission gate; identical requests share a call)
         try:
-            response = requests.post(
-                ollama_url,
-                json={
-                    'model': model,
-                    'prompt': full_prompt,
-                    'stream': False
-                },
-                timeout=60
-            )
-            response.raise_for_status()
-            result = response.json()
-            ai_response = result.get('response', 'No response generated')
-            
-            # Extract YAML from response if present
-            yaml_content = None
-            
-            # Try to find YAML code blocks (more flexible pattern)
-            yaml_blocks = re.findall(r'```yaml\s*\n(.*?)```', ai_response, re.DOTALL)
-            if not yaml_blocks:
-                # Try without language tag but check if it looks like YAML
-                all_blocks = re.findall(r'```\s*\n(.*?)```', ai_response, re.DOTALL)
-                for block in all_blocks:
-                    # Check if it looks like YAML (has 'slides:' or 'presentation:')
-                    if 'slides:' in block or 'presentation:' in block or 'type:' in block:
-                        yaml_blocks = [block]
-                        break
-            
-            if yaml_blocks:
-                yaml_content = yaml_blocks[0].strip()
-                
-                # Clean YAML: Remove document separators and multiple documents
-                yaml_content = clean_yaml_content(yaml_content)
-                # Validate and fix YAML if needed
-                try:
-                    # Try to load as single document
-                    parsed = yaml.safe_load(yaml_content)
-                    
-                    # If None or not a dict, try loading all documents and taking first
-                    if parsed is None:
-                        # Try loading all and taking first
-                        try:
-                            all_docs = list(yaml.safe_load_all(yaml_content))
-                            if all_docs and len(all_docs) > 0:
-                                parsed = all_docs[0]
-                                # Re-dump as single document
-                                yaml_content = yaml.dump(parsed, default_flow_style=False, sort_keys=False, allow_unicode=True)
-                        except:
-                            yaml_content = None
-                    
-                    # Ensure it has the required structure
-                    if not isinstance(parsed, dict):
-                        yaml_content = None
-                    elif 'slides' in parsed and 'presentation' not in parsed:
-                        # Fix: add presentation section if missing
-                        yaml_content = f"presentation:\n  title: \"Generated Presentation\"\n  author: \"User\"\n  date: \"{datetime.now().strftime('%Y-%m-%d')}\"\n\n{yaml.dump({'slides': parsed.get('slides', [])}, default_flow_style=False, sort_keys=False, allow_unicode=True)}"
-                        # Re-validate
-                        parsed = yaml.safe_load(yaml_content)
-                except yaml.YAMLError as e:
-                    # Try to fix common YAML errors
-                    try:
-                        error_str = str(e).lower()
-                        
-                        # Handle multiple documents error
-                        if 'single document' in error_str and 'found another document' in error_str:
-                            # Try to extract first document only
-                            try:
-                                all_docs = list(yaml.safe_load_all(yaml_content))
-                                if all_docs and len(all_docs) > 0:
-                                    parsed = all_docs[0]
-                                    if isinstance(parsed, dict):
-                                        yaml_content = yaml.dump(parsed, default_flow_style=False, sort_keys=False, allow_unicode=True)
-                                    else:
-                                        yaml_content = None
-                                else:
-                                    yaml_content = None
-                            except:
-                                # If safe_load_all fails, try manual extraction
-                                # Remove everything after first ---
-                                if '---' in yaml_content:
-                                    first_part = yaml_content.split('---')[0].strip()
-                                    if first_part:
-                                        yaml_content = first_part
-                                        parsed = yaml.safe_load(yaml_content)
-                                        if parsed:
-                                            yaml_content = yaml.dump(parsed, default_flow_style=False, sort_keys=False, allow_unicode=True)
-                                        else:
-                                            yaml_content = None
-                                    else:
-                                        yaml_content = None
-                                else:
-                                    yaml_content = None
-                        # If error is about missing document start or block mapping
-                        elif 'document start' in error_str or 'block mapping' in error_str:
-                            # Check if it starts with 'slides:' - add presentation section
-                            if yaml_content.strip().startswith('slides:'):
-                                # Extract just the slides content
-                                slides_content = yaml_content.strip()
-                                yaml_content = f"presentation:\n  title: \"Generated Presentation\"\n  author: \"User\"\n  date: \"{datetime.now().strftime('%Y-%m-%d')}\"\n\n{slides_content}"
-                                # Re-validate
-                                parsed = yaml.safe_load(yaml_content)
-                                if parsed:
-                                    # Re-dump to ensure proper formatting
-                                    yaml_content = yaml.dump(parsed, default_flow_style=False, sort_keys=False, allow_unicode=True)
-                            else:
-                                # Try wrapping in presentation
-                                try:
-                                    temp_parsed = yaml.safe_load(yaml_content)
-                                    if isinstance(temp_parsed, dict):
-                                        yaml_content = yaml.dump({
-                                            'presentation': {
-                                                'title': 'Generated Presentation',
-                                                'author': 'User',
-                                                'date': datetime.now().strftime('%Y-%m-%d')
-                                            },
-                                            **temp_parsed
-                                        }, default_flow_style=False, sort_keys=False, allow_unicode=True)
-                                except:
-                                    yaml_content = None
-                        else:
-                            # Try to parse and re-dump to fix formatting
-                            try:
-                                parsed = yaml.safe_load(yaml_content)
-                                if parsed:
-                                    yaml_content = yaml.dump(parsed, default_flow_style=False, sort_keys=False, allow_unicode=True)
-                                else:
-                                    yaml_content = None
-                            except:
-                                yaml_content = None
-                    except Exception as fix_error:
-                        # If we can't fix it, set to None and let user see the error
-                        print(f"Could not fix YAML: {fix_error}")
-                        yaml_content = None
-            
-            # Validate extracted YAML if present
-            validation_result = None
-            if yaml_content:
-                validation_result = validate_yaml_strict(yaml_content)
-                
-                if not validation_result['valid']:
-                    # Add validation errors to response
-                    error_summary = "\n\n⚠️ **YAML Validation Issues Detected:**\n\n"
-                    error_summary += "**Errors:**\n"
-                    for error in validation_result['errors']:
-                        error_summary += f"- {error}\n"
-                    if validation_result['warnings']:
-                        error_summary += "\n**Warnings:**\n"
-                        for warning in validation_result['warnings']:
-                            error_summary += f"- {warning}\n"
-                    error_summary += "\nThe YAML has been extracted but needs fixes before use."
-                    ai_response = ai_response + error_summary
-                else:
-                    # Add usage instructions if YAML is valid
-                    instructions = """
-
-### How to use the YAML
-
-1. **Copy the YAML block** above into the editor on the left.
-2. **Replace placeholders**:
-   - Update `title`, `author`, and `date` with your own values
-   - Modify slide content to match your needs
-   - Adjust slide types and layouts as required
-3. **Validate** the YAML using the Validate button (already validated ✓)
-4. **Generate** your PowerPoint presentation
-5. **Review** the generated slides and fine-tune if needed
-
-The YAML has been automatically extracted and validated. It's ready to use in the editor."""
-                    ai_response = ai_response + instructions
-                    
-                    # If there are warnings, add them
-                    if validation_result['warnings']:
-                        warnings_text = "\n\n⚠️ **Validation Warnings:**\n"
-                        for warning in validation_result['warnings']:
-                            warnings_text += f"- {warning}\n"
-                        ai_response = ai_response + warnings_text
-            
-            # Only send YAML if it's valid
-            send_yaml = yaml_content if (yaml_content and (not validation_result or validation_result['valid'])) else None
-            
-            return jsonify({
-                'success': True,
-                'response': ai_response,
-                'yaml_content': send_yaml,  # Only send if valid
-                'model': model,
-                'validation': validation_result if validation_result else None
-            })
+            result = gate.run(coalesce_key(model, messages), call_ollama)
+            return jsonify(finish_chat_turn(session, model, message, cache_key, result))
+        except OllamaOverloaded as e:
+            return ollama_overloaded(e)
         except requests.exceptions.ConnectionError:
-            error_msg = f'Cannot connect to Ollama at {ollama_base}. '
-            error_msg += 'Please ensure:\n'
-            error_msg += '1. Ollama is installed and running\n'
-            error_msg += '2. Ollama is accessible at the expected URL\n'
-            if os.path.exists('/.dockerenv'):
-                error_msg += '3. For Docker: Ensure host networking is accessible\n'
-                error_msg += '   Try: docker run --add-host=host.docker.internal:host-gateway ...'
             return jsonify({
                 'success': False,
-                'error': error_msg,
+                'error': ollama_connection_error(ollama_base),
                 'ollama_url': ollama_base
             }), 503
         except requests.exceptions.Timeout:
@@ -1106,6 +1143,437 @@ The YAML has been automatically extracted and validated. It's ready to use in th
         }), 500
 
 
+def sse_event(event, data):
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # Don't let proxies buffer the stream
+}
+
+
+def replay_cached_stream(session, model, cached):
+    """SSE frames replaying a cached answer."""
+    yield sse_event('token', {'text': cached['raw_response']})
+    if cached['yaml_content']:
+        yield sse_event('yaml', {'yaml_content': cached['yaml_content'], 'validation': cached['validation']})
+    payload = cached_chat_payload(session, model, cached)
+    payload['timings'] = {'first_token_ms': 0, 'total_ms': 0}
+    yield sse_event('done', payload)
+
+
+class ChatStreamRelay:
+    """Turns Ollama's streamed /api/chat chunks into SSE frames.
+    
+    Transport-agnostic so the WSGI and ASGI stream endpoints share it: feed()
+    each decoded chunk, stop once `done` is set, then send finish().
+    """
+    
+    def __init__(self, session, model, message, cache_key):
+        self.session = session
+        self.model = model
+        self.message = message
+        self.cache_key = cache_key
+        self.started = time.perf_counter()
+        self.first_token_ms = None
+        self.chunks = []
+        self.scan_from = 0
+        self.yaml_sent = False
+        self.final = {}
+        self.done = False
+        self.failed = False
+    
+    def feed(self, chunk):
+        """Frames for one Ollama chunk."""
+        if chunk.get('error'):
+            self.failed = self.done = True
+            return [sse_event('error', {'error': chunk['error'], 'status': 500})]
+        
+        frames = []
+        token = chunk.get('message', {}).get('content', '')
+        if token:
+            if self.first_token_ms is None:
+                self.first_token_ms = round((time.perf_counter() - self.started) * 1000)
+            self.chunks.append(token)
+            frames.append(sse_event('token', {'text': token}))
+        
+        # Extract and validate as soon as the first YAML block closes
+        # (structured answers are JSON and are decoded once complete)
+        if not self.yaml_sent and '`' in token and not is_structured(self.session):
+            text = ''.join(self.chunks)
+            match = YAML_FENCE_RE.search(text, self.scan_from)
+            if match:
+                self.yaml_sent = True
+                yaml_content = extract_yaml_from_response(match.group(0))
+                _, send_yaml, validation = annotate_chat_response('', yaml_content)
+                frames.append(sse_event('yaml', {'yaml_content': send_yaml, 'validation': validation}))
+            else:
+                # Only rescan from the last unmatched opening fence
+                fence = text.rfind('```yaml')
+                self.scan_from = fence if fence >= 0 else max(0, len(text) - 8)
+        
+        if chunk.get('done'):
+            self.final = chunk
+            self.done = True
+        return frames
+    
+    def fail(self, error, status):
+        self.failed = self.done = True
+        residency.record_error(self.model)
+        return sse_event('error', {'error': error, 'status': status})
+    
+    def finish(self):
+        """Record the turn and build the closing `done` frame."""
+        raw_response = ''.join(self.chunks) or 'No response generated'
+        ai_response, send_yaml, validation_result = complete_chat_turn(
+            self.session, self.model, self.message, self.cache_key, raw_response
+        )
+        
+        timings = ollama_timings(self.final)
+        timings['first_token_ms'] = self.first_token_ms
+        timings['total_ms'] = round((time.perf_counter() - self.started) * 1000)
+        residency.record(self.model, timings)
+        print(f"Chat stream ({self.model}): first token {self.first_token_ms} ms, "
+              f"prompt eval {timings['prompt_eval_count']} tokens in {timings['prompt_eval_ms']} ms, "
+              f"total {timings['total_ms']} ms")
+        return sse_event('done', {
+            'success': True,
+            'response': ai_response,
+            'yaml_content': send_yaml,
+            'model': self.model,
+            'validation': validation_result,
+            'session_id': self.session['id'],
+            'cached': False,
+            'timings': timings,
+            **session_extras(self.session)
+        })
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_with_ollama_stream():
+    """Chat with Ollama, relaying tokens to the browser as Server-Sent Events.
+    
+    Events:
+      token  {"text": ...}                          each chunk as it arrives
+      yaml   {"yaml_content", "validation"}         once the first ```yaml block closes
+      done   {"response", "yaml_content", "validation", "model", "session_id", "timings"}
+      error  {"error", "status"}
+    """
+    data = request.json or {}
+    message = data.get('message', '')
+    
+    if not message:
+        return jsonify({
+            'success': False,
+            'error': 'No message provided'
+        }), 400
+    
+    ollama_base = get_ollama_base_url()
+    model, routing = resolve_chat_model(data, message)
+    session, cache_key, cached, message = start_chat_turn(data, model, message, routing)
+    if cached:
+        return Response(replay_cached_stream(session, model, cached), mimetype='text/event-stream', headers=SSE_HEADERS)
+    
+    def generate():
+        relay = ChatStreamRelay(session, model, message, cache_key)
+        try:
+            # Read timeout applies between chunks, so long answers don't time out
+            with ollama.post(
+                '/api/chat',
+                json=ollama_chat_payload(
+                    model, chat_sessions.messages(session, message), stream=True, structured=is_structured(session)
+                ),
+                stream=True,
+                timeout=(5, 60)
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    yield from relay.feed(json.loads(line))
+                    if relay.done:
+                        break
+        except requests.exceptions.ConnectionError:
+            yield relay.fail(ollama_connection_error(ollama_base), 503)
+        except requests.exceptions.Timeout:
+            yield relay.fail('Request to Ollama timed out', 504)
+        except requests.exceptions.RequestException as e:
+            yield relay.fail(f'Ollama API error: {str(e)}', 500)
+        
+        if not relay.failed:
+            yield relay.finish()
+    
+    # Take a generation slot before committing to a 200 stream, so overload
+    # is reported as 429 rather than as an error event
+    try:
+        acquired_at = gate.acquire()
+    except OllamaOverloaded as e:
+        return ollama_overloaded(e)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+    # Released when the stream finishes or the client goes away
+    response.call_on_close(lambda: gate.release(acquired_at))
+    return response
+
+
+@app.route('/api/chat/deck', methods=['POST'])
+def draft_deck_stream():
+    """Draft a large deck in two phases, streaming progress as Server-Sent Events.
+    
+    The model first outlines slide types and titles, then every slide is
+    drafted concurrently and checked on its own (see deck_drafter.py).
+    
+    Events:
+      progress  {"phase": "outline", "planned"}       while the outline streams in
+      outline   {"presentation", "outline"}          once the outline is decoded
+      slide     {"index", "slide", "valid", "attempts", "completed", "total", ...}
+      done      {"yaml_content", "validation", "response", "failed", "timings", "model"}
+      error     {"error", "status"}
+    """
+    data = request.json or {}
+    message = data.get('message', '')
+    
+    if not message:
+        return jsonify({
+            'success': False,
+            'error': 'No message provided'
+        }), 400
+    
+    ollama_base = get_ollama_base_url()
+    model, routing = resolve_chat_model(data, message, kind='deck')
+    drafter = DeckDrafter(ollama, model, OLLAMA_KEEP_ALIVE, gate=gate)
+    released = []
+    
+    def release_outline_slot():
+        if not released:
+            released.append(True)
+            gate.release(acquired_at)
+    
+    def generate():
+        try:
+            for event, payload in drafter.draft(message):
+                if event == 'outline':
+                    # Slide calls take a slot each; holding this one too could starve them
+                    release_outline_slot()
+                if event != 'assembled':
+                    yield sse_event(event, payload)
+                    continue
+                
+                yaml_content = spec_to_yaml(payload['spec'])
+                ai_response, send_yaml, validation_result = annotate_chat_response(
+                    f"```yaml\n{yaml_content}```", yaml_content
+                )
+                spec_validity.record('deck', send_yaml is not None)
+                print(f"Deck draft ({model}): {len(payload['spec']['slides'])} slides, "
+                      f"outline {payload['timings']['outline_ms']} ms, total {payload['timings']['total_ms']} ms, "
+                      f"failed {payload['failed'] or 'none'}")
+                yield sse_event('done', {
+                    'success': True,
+                    'response': ai_response,
+                    'yaml_content': send_yaml,
+                    'validation': validation_result,
+                    'failed': payload['failed'],
+                    'model': model,
+                    'routing': routing,
+                    'timings': payload['timings']
+                })
+        except requests.exceptions.ConnectionError:
+            yield sse_event('error', {'error': ollama_connection_error(ollama_base), 'status': 503})
+        except requests.exceptions.Timeout:
+            yield sse_event('error', {'error': 'Request to Ollama timed out', 'status': 504})
+        except requests.exceptions.RequestException as e:
+            yield sse_event('error', {'error': f'Ollama API error: {str(e)}', 'status': 500})
+        except ValueError as e:
+            yield sse_event('error', {'error': f'Could not draft an outline: {str(e)}', 'status': 502})
+    
+    # The outline call holds the slot taken here (so overload is a 429, not an
+    # error event); the slide calls then run up to HYFLUX_DECK_PARALLELISM at
+    # once, each in its own gate slot
+    try:
+        acquired_at = gate.acquire()
+    except OllamaOverloaded as e:
+        return ollama_overloaded(e)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.call_on_close(release_outline_slot)
+    return response
+
+
+@app.route('/api/chat/session/<session_id>', methods=['DELETE'])
+def end_chat_session(session_id):
+    """Forget a chat session's history."""
+    chat_sessions.delete(session_id)
+    return jsonify({'success': True})
+
+
+@app.route('/api/chat/stats', methods=['GET'])
+def chat_stats():
+    """Chat subsystem counters (response cache hit rate, ...)."""
+    return jsonify(chat_stats_payload(gate.stats()))
+
+
+@app.route('/api/chat/residency', methods=['GET'])
+def chat_residency():
+    """Loaded models (Ollama /api/ps), per-model latency and routing settings."""
+    try:
+        residency.refresh()
+    except (requests.exceptions.RequestException, ValueError):
+        pass  # Report the last known state; last_error says why
+    return jsonify({'success': True, **residency.snapshot(), 'routing': router.config()})
+
+
+def model_residency_payload(refresh=False):
+    """Residency hints for the model picker.
+    
+    Served from the keep-warm thread's last check; refresh=True reads
+    /api/ps first, which puts an Ollama round trip on the request path.
+    """
+    if refresh:
+        try:
+            residency.refresh(timeout=2)
+        except (requests.exceptions.RequestException, ValueError):
+            pass  # Fall back to the last known state
+    return {'loaded': residency.loaded(), 'routing': router.config()}
+
+
+def chat_stats_payload(admission):
+    return {
+        'success': True,
+        'prompt_version': CHAT_PROMPT_VERSION,
+        'structured_prompt_version': STRUCTURED_PROMPT_VERSION,
+        'prompt_budget': {'default': prompt_builder.DEFAULT_TOKEN_BUDGET, 'models': prompt_builder.MODEL_TOKEN_BUDGETS},
+        'cache': chat_cache.stats(),
+        'sessions': {'active': chat_sessions.count()},
+        'admission': admission,  # this worker only
+        'repair': yaml_repair.stats(),  # this worker only
+        'validity': spec_validity.stats(),  # this worker only
+        'residency': residency.snapshot()  # this worker only
+    }
+
+
+@app.route('/api/storage', methods=['GET'])
+def storage_stats():
+    """Disk usage of the output and upload volumes, retention policy and evictions."""
+    return jsonify({'success': True, **retention.stats()})
+
+
+def chat_cache_metric(field):
+    stats = chat_cache.stats()
+    if not stats or not stats['enabled']:
+        return None
+    return stats[field]
+
+
+def chat_cache_lookups():
+    stats = chat_cache.stats()
+    if not stats or not stats['enabled']:
+        return None
+    return {result: stats[result] for result in ('hits', 'misses', 'bypassed')}
+
+
+def storage_metrics(field):
+    return {directory: usage[field] for directory, usage in retention.usage().items()}
+
+
+def storage_free_bytes():
+    free = {}
+    for directory in retention.directories:
+        try:
+            free[str(directory)] = shutil.disk_usage(directory).free
+        except OSError:
+            continue
+    return free
+
+
+# Values read from shared state when /metrics is scraped
+metrics.track_gate('sync', gate)
+metrics.chat_cache_requests.collect_from(chat_cache_lookups)
+metrics.chat_cache_hit_ratio.collect_from(lambda: chat_cache_metric('hit_rate'))
+metrics.chat_cache_entries.collect_from(lambda: chat_cache_metric('entries'))
+metrics.storage_bytes.collect_from(lambda: storage_metrics('bytes'))
+metrics.storage_files.collect_from(lambda: storage_metrics('files'))
+metrics.storage_free_bytes.collect_from(storage_free_bytes)
+metrics.retention_evictions.collect_from(
+    lambda: {(metrics.pid(), reason): count for reason, count in dict(retention.evicted).items()}
+)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics."""
+    if not metrics.ENABLED:
+        return jsonify({'success': False, 'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin.admin_required
+def list_profiles():
+    """Stored request profiles and background sampler dumps, newest first."""
+    return jsonify({'success': True, 'profiles': profile_store.list(), 'sampler': sampler.stats()})
+
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+@admin.admin_required
+def get_profile(name):
+    """One profile file: a pstats summary (.txt) or collapsed stacks (.collapsed)."""
+    path = profile_store.path(name)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    return http_cache.send_file_cached(path, mimetype='text/plain', as_attachment=name.endswith('.collapsed'))
+
+
+@app.route('/api/admin/sampler/dump', methods=['POST'])
+@admin.admin_required
+def dump_sampler():
+    """Write the background sampler's current window now."""
+    if not sampler.enabled:
+        return jsonify({'success': False, 'error': 'Sampler is disabled (set HYFLUX_SAMPLER_HZ)'}), 400
+    return jsonify({'success': True, 'file': sampler.dump()})
+
+
+@app.route('/api/admin/memory', methods=['GET'])
+@admin.admin_required
+def memory_stats():
+    """RSS, tracemalloc state, per-route memory use and the watchdog (this worker)."""
+    return jsonify({'success': True, **memory_tracker.stats()})
+
+
+@app.route('/api/admin/memory/snapshots', methods=['POST'])
+@admin.admin_required
+def take_memory_snapshot():
+    """Take an allocation snapshot; diff it against a later one to find growth."""
+    data = request.get_json(silent=True) or {}
+    snapshot = memory_tracker.snapshot(label=str(data.get('label', '')))
+    return jsonify({'success': True, 'snapshot': snapshot, 'snapshots': memory_tracker.snapshots()})
+
+
+@app.route('/api/admin/memory/snapshots', methods=['DELETE'])
+@admin.admin_required
+def clear_memory_snapshots():
+    memory_tracker.clear_snapshots()
+    return jsonify({'success': True})
+
+
+@app.route('/api/admin/memory/diff', methods=['GET'])
+@admin.admin_required
+def diff_memory_snapshots():
+    """Allocation sites that grew between two snapshots (?from=&to=, default oldest vs newest)."""
+    key = request.args.get('key', 'lineno')
+    if key not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'success': False, 'error': 'key must be lineno, filename or traceback'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 25)), 1), 200)
+        diff = memory_tracker.diff(request.args.get('from'), request.args.get('to'), limit=limit, key=key)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be a number'}), 400
+    except LookupError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **diff})
+
+
 @app.route('/api/save', methods=['POST'])
 def save_yaml():
     """Save YAML content to file."""
@@ -1140,12 +1608,13 @@ def save_yaml():
             filename = secure_filename(filename)
         
         # Save to input directory
-        input_dir = Path('/app/input')
+        input_dir = Path(app.config['INPUT_FOLDER'])
         input_dir.mkdir(parents=True, exist_ok=True)
         file_path = input_dir / filename
         
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(yaml_content)
+        spec_library.update(filename)
         
         return jsonify({
             'success': True,
@@ -1161,24 +1630,30 @@ def save_yaml():
 
 @app.route('/api/saved-files', methods=['GET'])
 def list_saved_files():
-    """List all saved YAML files."""
+    """List saved YAML files, one page at a time.
+    
+    Query parameters: page (from 1), per_page (max 100), sort (modified,
+    name, title, size, slides), order (asc, desc) and q (matches title or
+    file name).
+    """
     try:
-        input_dir = Path('/app/input')
-        saved_files = []
-        
-        if input_dir.exists():
-            for file_path in sorted(input_dir.glob('*.yaml'), reverse=True):
-                if file_path.is_file() and file_path.name != 'sample_content_spec.yaml':
-                    stat = file_path.stat()
-                    saved_files.append({
-                        'filename': file_path.name,
-                        'size': stat.st_size,
-                        'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                    })
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = min(100, max(1, request.args.get('per_page', 20, type=int)))
+        files, total = spec_library.list(
+            page=page,
+            per_page=per_page,
+            sort=request.args.get('sort', 'modified'),
+            order=request.args.get('order', 'desc'),
+            query=request.args.get('q', '').strip()
+        )
         
         return jsonify({
             'success': True,
-            'files': saved_files
+            'files': files,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page
         })
     except Exception as e:
         return jsonify({
@@ -1193,7 +1668,7 @@ def load_saved_file(filename):
     """Load a saved YAML file."""
     try:
         filename = secure_filename(filename)
-        file_path = Path('/app/input') / filename
+        file_path = Path(app.config['INPUT_FOLDER']) / filename
         
         if not file_path.exists():
             return jsonify({
@@ -1221,7 +1696,7 @@ def download_yaml_file(filename):
     """Download a YAML file."""
     try:
         filename = secure_filename(filename)
-        file_path = Path('/app/input') / filename
+        file_path = Path(app.config['INPUT_FOLDER']) / filename
         
         if not file_path.exists():
             return jsonify({
@@ -1229,8 +1704,8 @@ def download_yaml_file(filename):
                 'error': 'File not found'
             }), 404
         
-        return send_file(
-            str(file_path),
+        return http_cache.send_file_cached(
+            file_path,
             as_attachment=True,
             download_name=filename,
             mimetype='text/yaml'
@@ -1242,15 +1717,21 @@ def download_yaml_file(filename):
         }), 500
 
 
+OLLAMA_SETUP_SUGGESTIONS = [
+    'Ensure Ollama is installed and running',
+    'Check if Ollama is accessible at the URL',
+    'For Docker: Verify host networking configuration'
+]
+
+
 @app.route('/api/chat/test', methods=['GET'])
 def test_ollama_connection():
     """Test Ollama connection."""
+    # Bound before the try: discovery itself can fail
+    ollama_base = None
     try:
         ollama_base = get_ollama_base_url()
-        test_url = f'{ollama_base}/api/tags'
-        
-        response = requests.get(test_url, timeout=5)
-        response.raise_for_status()
+        ollama.probe(timeout=5)
         
         return jsonify({
             'success': True,
@@ -1264,11 +1745,7 @@ def test_ollama_connection():
             'message': 'Cannot connect to Ollama',
             'ollama_url': ollama_base,
             'status': 'disconnected',
-            'suggestions': [
-                'Ensure Ollama is installed and running',
-                'Check if Ollama is accessible at the URL',
-                'For Docker: Verify host networking configuration'
-            ]
+            'suggestions': OLLAMA_SETUP_SUGGESTIONS
         }), 503
     except Exception as e:
         return jsonify({
@@ -1279,15 +1756,20 @@ def test_ollama_connection():
         }), 500
 
 
+def models_connection_error(ollama_base):
+    error_msg = f'Cannot connect to Ollama at {ollama_base}. '
+    error_msg += 'Make sure Ollama is running and accessible.'
+    return error_msg
+
+
 @app.route('/api/chat/models', methods=['GET'])
 def get_ollama_models():
     """Get available Ollama models."""
     try:
         ollama_base = get_ollama_base_url()
-        ollama_url = f'{ollama_base}/api/tags'
         
         try:
-            response = requests.get(ollama_url, timeout=10)
+            response = ollama.get('/api/tags', timeout=10)
             response.raise_for_status()
             result = response.json()
             
@@ -1295,14 +1777,13 @@ def get_ollama_models():
             
             return jsonify({
                 'success': True,
-                'models': models
+                'models': models,
+                **model_residency_payload()
             })
         except requests.exceptions.ConnectionError:
-            error_msg = f'Cannot connect to Ollama at {ollama_base}. '
-            error_msg += 'Make sure Ollama is running and accessible.'
             return jsonify({
                 'success': False,
-                'error': error_msg,
+                'error': models_connection_error(ollama_base),
                 'models': [],
                 'ollama_url': ollama_base
             }), 503
@@ -1322,5 +1803,9 @@ def get_ollama_models():
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    residency.start()
+    retention.start()
+    memory_tracker.start()
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG', '1') == '1')
 
@@ -0,0 +1,320 @@
+"""
+ASGI entry point for the HyFlux PPT Generator web application.
+
+Async serving mode: the Ollama-bound chat routes run on the event loop with a
+non-blocking HTTP client, so one worker can hold hundreds of waiting chats.
+Every other route (deck generation, validation, files) is the unchanged
+Flask app, run in a bounded thread pool so CPU-bound work never blocks the
+loop. Responses match the Flask routes field for field.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+
+Environment:
+    HYFLUX_SYNC_THREADS    threads for the Flask routes per worker (default: 4)
+"""
+
+import asyncio
+import json
+import os
+from urllib.parse import parse_qsl
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import Headers
+
+import app as flask_app
+import http_cache
+import metrics
+import profiling
+from ollama_client import OllamaOverloaded
+from ollama_async import aollama, agate
+from model_residency import residency
+
+SYNC_THREADS = int(os.environ.get('HYFLUX_SYNC_THREADS', 4))
+
+wsgi = WSGIMiddleware(flask_app.app, workers=SYNC_THREADS)
+
+# The event-loop chat routes queue on their own gate
+metrics.track_gate('async', agate)
+
+
+async def read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def send_json(send, payload, status=200, headers=None, scope=None):
+    """Send a JSON response; pass the request scope to gzip large bodies as the Flask routes do."""
+    body = json.dumps(payload).encode('utf-8')
+    raw_headers = [(b'content-type', b'application/json')]
+    if scope is not None:
+        raw_headers.append((b'vary', b'Accept-Encoding'))
+        accept_encoding = dict(scope['headers']).get(b'accept-encoding', b'').decode('latin-1')
+        if len(body) >= http_cache.GZIP_MIN_SIZE and http_cache.accepts_gzip(accept_encoding):
+            body = http_cache.gzip_body(body)
+            raw_headers.append((b'content-encoding', b'gzip'))
+    raw_headers.append((b'content-length', str(len(body)).encode()))
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), str(value).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_overloaded(send, e):
+    await send_json(send, {
+        'success': False,
+        'error': f'{e}. Please try again in {e.retry_after} seconds.',
+        'retry_after': e.retry_after
+    }, 429, {'Retry-After': e.retry_after})
+
+
+async def chat(scope, receive, send):
+    """POST /api/chat"""
+    try:
+        data = await read_json(receive)
+        if data is None:
+            # Same outcome as Flask's request.json on a bad body
+            raise ValueError('Failed to decode JSON object')
+        message = data.get('message', '')
+
+        ollama_base = await aollama.base_url()
+
+        if not message:
+            return await send_json(send, {'success': False, 'error': 'No message provided'}, 400)
+
+        # Session and cache lookups are SQLite calls, so keep them off the loop
+        model, routing = await asyncio.to_thread(flask_app.resolve_chat_model, data, message)
+        session, cache_key, cached, message = await asyncio.to_thread(
+            flask_app.start_chat_turn, data, model, message, routing
+        )
+        if cached:
+            return await send_json(send, flask_app.cached_chat_payload(session, model, cached), scope=scope)
+
+        messages = flask_app.chat_sessions.messages(session, message)
+
+        async def call_ollama():
+            try:
+                response = await aollama.post('/api/chat', json=flask_app.ollama_chat_payload(
+                    model, messages, stream=False, structured=flask_app.is_structured(session)
+                ))
+                response.raise_for_status()
+            except httpx.HTTPError:
+                residency.record_error(model)
+                raise
+            return response.json()
+
+        try:
+            result = await agate.run(flask_app.coalesce_key(model, messages), call_ollama)
+            payload = await asyncio.to_thread(flask_app.finish_chat_turn, session, model, message, cache_key, result)
+            return await send_json(send, payload, scope=scope)
+        except OllamaOverloaded as e:
+            return await send_overloaded(send, e)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            return await send_json(send, {
+                'success': False,
+                'error': flask_app.ollama_connection_error(ollama_base),
+                'ollama_url': ollama_base
+            }, 503)
+        except httpx.TimeoutException:
+            return await send_json(send, {'success': False, 'error': 'Request to Ollama timed out'}, 504)
+        except httpx.HTTPError as e:
+            return await send_json(send, {'success': False, 'error': f'Ollama API error: {str(e)}'}, 500)
+
+    except Exception as e:
+        return await send_json(send, {'success': False, 'error': str(e)}, 500)
+
+
+async def chat_stream(scope, receive, send):
+    """POST /api/chat/stream (same events as the Flask route)"""
+    data = await read_json(receive) or {}
+    message = data.get('message', '')
+
+    if not message:
+        return await send_json(send, {'success': False, 'error': 'No message provided'}, 400)
+
+    ollama_base = await aollama.base_url()
+    model, routing = await asyncio.to_thread(flask_app.resolve_chat_model, data, message)
+    session, cache_key, cached, message = await asyncio.to_thread(
+        flask_app.start_chat_turn, data, model, message, routing
+    )
+
+    async def start_stream():
+        headers = [(b'content-type', b'text/event-stream; charset=utf-8')]
+        headers += [(k.lower().encode(), v.encode()) for k, v in flask_app.SSE_HEADERS.items()]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    async def emit(frame):
+        await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+
+    if cached:
+        await start_stream()
+        for frame in flask_app.replay_cached_stream(session, model, cached):
+            await emit(frame)
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    # Take a slot before committing to a 200 stream, as the Flask route does
+    try:
+        acquired_at = await agate.acquire()
+    except OllamaOverloaded as e:
+        return await send_overloaded(send, e)
+
+    try:
+        await start_stream()
+        relay = flask_app.ChatStreamRelay(session, model, message, cache_key)
+        payload = flask_app.ollama_chat_payload(
+            model, flask_app.chat_sessions.messages(session, message), stream=True,
+            structured=flask_app.is_structured(session)
+        )
+        try:
+            # Read timeout applies between chunks, so long answers don't time out
+            async with aollama.stream('POST', '/api/chat', json=payload, timeout=httpx.Timeout(60, connect=5)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    for frame in relay.feed(json.loads(line)):
+                        await emit(frame)
+                    if relay.done:
+                        break
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            await emit(relay.fail(flask_app.ollama_connection_error(ollama_base), 503))
+        except httpx.TimeoutException:
+            await emit(relay.fail('Request to Ollama timed out', 504))
+        except httpx.HTTPError as e:
+            await emit(relay.fail(f'Ollama API error: {str(e)}', 500))
+
+        if not relay.failed:
+            await emit(await asyncio.to_thread(relay.finish))
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await agate.release(acquired_at)
+
+
+async def chat_test(scope, receive, send):
+    """GET /api/chat/test"""
+    ollama_base = None
+    try:
+        ollama_base = await aollama.base_url()
+        await aollama.probe(timeout=5)
+        await send_json(send, {
+            'success': True,
+            'message': 'Ollama connection successful',
+            'ollama_url': ollama_base,
+            'status': 'connected'
+        })
+    except (httpx.ConnectError, httpx.ConnectTimeout):
+        await send_json(send, {
+            'success': False,
+            'message': 'Cannot connect to Ollama',
+            'ollama_url': ollama_base,
+            'status': 'disconnected',
+            'suggestions': flask_app.OLLAMA_SETUP_SUGGESTIONS
+        }, 503)
+    except Exception as e:
+        await send_json(send, {
+            'success': False,
+            'message': f'Error testing connection: {str(e)}',
+            'ollama_url': ollama_base,
+            'status': 'error'
+        }, 500)
+
+
+async def chat_models(scope, receive, send):
+    """GET /api/chat/models"""
+    ollama_base = None
+    try:
+        ollama_base = await aollama.base_url()
+        response = await aollama.get('/api/tags', timeout=10)
+        response.raise_for_status()
+        models = [model.get('name', '') for model in response.json().get('models', [])]
+        await send_json(send, {'success': True, 'models': models, **flask_app.model_residency_payload()})
+    except (httpx.ConnectError, httpx.ConnectTimeout):
+        await send_json(send, {
+            'success': False,
+            'error': flask_app.models_connection_error(ollama_base),
+            'models': [],
+            'ollama_url': ollama_base
+        }, 503)
+    except Exception as e:
+        await send_json(send, {'success': False, 'error': str(e), 'models': []}, 500)
+
+
+async def chat_stats(scope, receive, send):
+    """GET /api/chat/stats (reports the async admission gate)"""
+    await send_json(send, await asyncio.to_thread(flask_app.chat_stats_payload, agate.stats()))
+
+
+ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/chat/stream'): chat_stream,
+    ('GET', '/api/chat/test'): chat_test,
+    ('GET', '/api/chat/models'): chat_models,
+    ('GET', '/api/chat/stats'): chat_stats,
+}
+
+
+def wants_profile(scope):
+    headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+    args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+    return profiling.wants_profile(headers, args)
+
+
+async def timed(handler, scope, receive, send):
+    """Run an event-loop route, recording it in /metrics like the Flask routes."""
+    if not metrics.ENABLED:
+        return await handler(scope, receive, send)
+    started = asyncio.get_running_loop().time()
+    status = [500]
+
+    async def send_with_status(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+        await send(message)
+
+    try:
+        await handler(scope, receive, send_with_status)
+    finally:
+        labels = {'pid': metrics.pid(), 'route': scope['path'], 'method': scope['method']}
+        metrics.http_request_duration.observe(asyncio.get_running_loop().time() - started, **labels)
+        metrics.http_requests.inc(status=str(status[0]), **labels)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Under gunicorn the master already warmed the app before forking
+            # (gunicorn.conf.py); read at startup, as this module loads first
+            if os.environ.get('HYFLUX_PRELOADED') != '1':
+                # Standalone uvicorn: preload the template off the loop before taking traffic
+                await asyncio.to_thread(flask_app.warm_up)
+            residency.start()
+            flask_app.retention.start()
+            flask_app.memory_tracker.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await aollama.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        handler = ROUTES.get((scope['method'], scope['path']))
+        if handler is not None and wants_profile(scope):
+            # cProfile follows one thread, so profiled chats run through the Flask route
+            handler = None
+        if handler is not None:
+            return await timed(handler, scope, receive, send)
+    return await wsgi(scope, receive, send)
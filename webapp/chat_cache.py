@@ -0,0 +1,189 @@
+"""
+Persistent response cache for /api/chat.
+
+Responses are stored in SQLite so every gunicorn worker (and restarts) share
+them. Entries are keyed by model, prompt-template version and the
+normalized user message, expire after a TTL, and are evicted least recently
+used first once the entry or size limits are exceeded.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_TTL = float(os.environ.get('HYFLUX_CHAT_CACHE_TTL', 7 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('HYFLUX_CHAT_CACHE_MAX_ENTRIES', 1000))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('HYFLUX_CHAT_CACHE_MAX_MB', 50)) * 1024 * 1024)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_message(message):
+    """Collapse whitespace so trivially different prompts share an entry."""
+    return ' '.join(message.split())
+
+
+class ChatResponseCache:
+    """Disk-backed LRU/TTL cache of chat responses."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _db(self):
+        """One connection per thread (and per process after fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(model, prompt_version, message):
+        raw = '\0'.join([model, prompt_version, normalize_message(message)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _bump(self, db, name, amount=1):
+        db.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, amount)
+        )
+
+    def get(self, key):
+        """Return the cached payload dict, or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            return self._get(key)
+        except sqlite3.Error as e:
+            # A broken cache must never break chat
+            print(f"Chat cache lookup failed: {e}")
+            return None
+
+    def _get(self, key):
+        db = self._db()
+        now = time.time()
+        row = db.execute('SELECT payload, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._bump(db, 'expired')
+            self._bump(db, 'misses')
+            return None
+        db.execute('UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?', (now, key))
+        self._bump(db, 'hits')
+        return json.loads(row[0])
+
+    def record_bypass(self):
+        if not self.enabled:
+            return
+        try:
+            self._bump(self._db(), 'bypassed')
+        except sqlite3.Error as e:
+            print(f"Chat cache update failed: {e}")
+
+    def put(self, key, model, payload):
+        """Store a payload (raw response, extracted YAML, validation) and evict."""
+        if not self.enabled:
+            return
+        try:
+            self._put(key, model, payload)
+        except sqlite3.Error as e:
+            print(f"Chat cache store failed: {e}")
+
+    def _put(self, key, model, payload):
+        data = json.dumps(payload)
+        now = time.time()
+        db = self._db()
+        db.execute(
+            'INSERT OR REPLACE INTO responses (key, model, payload, size, created_at, last_access, hits) '
+            'VALUES (?, ?, ?, ?, ?, ?, 0)',
+            (key, model, data, len(data), now, now)
+        )
+        self._bump(db, 'stores')
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones over the limits."""
+        db = self._db()
+        evicted = db.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,)).rowcount
+
+        count, total = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            for key, size in db.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                count -= 1
+                total -= size
+                evicted += 1
+
+        if evicted:
+            self._bump(db, 'evictions', evicted)
+        return evicted
+
+    def clear(self):
+        db = self._db()
+        db.execute('DELETE FROM responses')
+        db.execute('DELETE FROM counters')
+
+    def stats(self):
+        """Entry counts, size and hit-rate counters (shared across workers), or None if unreadable."""
+        if not self.enabled:
+            return {'enabled': False}
+        try:
+            return self._stats()
+        except sqlite3.Error as e:
+            print(f"Chat cache stats failed: {e}")
+            return None
+
+    def _stats(self):
+        db = self._db()
+        count, total = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        counters = dict(db.execute('SELECT name, value FROM counters').fetchall())
+        hits = counters.get('hits', 0)
+        lookups = hits + counters.get('misses', 0)
+        return {
+            'enabled': True,
+            'entries': count,
+            'bytes': total,
+            'hits': hits,
+            'misses': counters.get('misses', 0),
+            'bypassed': counters.get('bypassed', 0),
+            'stores': counters.get('stores', 0),
+            'evictions': counters.get('evictions', 0),
+            'expired': counters.get('expired', 0),
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,137 @@
+"""
+Server-side chat sessions for the Ollama assistant.
+
+A session holds the conversation history for one chat. The HyFlux rules are
+sent once as the system message and every later turn resends the same
+prefix, so a resident model reuses its cached prompt evaluation instead of
+re-reading the rules each turn. Sessions live in SQLite so any gunicorn
+worker can continue any conversation. A locked or corrupt database never
+breaks chat: the turn is answered without history and is not remembered.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_TTL = float(os.environ.get('HYFLUX_CHAT_SESSION_TTL', 2 * 3600))
+# User/assistant turns kept per session; older turns are dropped from the prompt
+DEFAULT_MAX_TURNS = int(os.environ.get('HYFLUX_CHAT_HISTORY_TURNS', 10))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    system TEXT NOT NULL,
+    messages TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+"""
+
+
+class ChatSessionStore:
+    """SQLite-backed chat histories with idle expiry."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_turns=DEFAULT_MAX_TURNS):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._local = threading.local()
+
+    def _db(self):
+        """One connection per thread (and per process after fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, model, system):
+        """Start a session with its system prompt; returns the session dict."""
+        session = {'id': uuid.uuid4().hex, 'model': model, 'system': system, 'messages': []}
+        try:
+            self._create(session)
+        except sqlite3.Error as e:
+            # Still answer this turn, just without a stored history
+            print(f"Chat session store failed: {e}")
+        return session
+
+    def _create(self, session):
+        now = time.time()
+        model, system = session['model'], session['system']
+        db = self._db()
+        db.execute(
+            'INSERT INTO sessions (id, model, system, messages, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (session['id'], model, system, '[]', now, now)
+        )
+        # Opportunistic cleanup of idle sessions
+        db.execute('DELETE FROM sessions WHERE updated_at < ?', (now - self.ttl,))
+
+    def get(self, session_id):
+        """Return the session dict, or None if unknown, expired or unreadable."""
+        if not session_id:
+            return None
+        try:
+            return self._get(session_id)
+        except sqlite3.Error as e:
+            print(f"Chat session lookup failed: {e}")
+            return None
+
+    def _get(self, session_id):
+        row = self._db().execute(
+            'SELECT model, system, messages, updated_at FROM sessions WHERE id = ?', (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[3] > self.ttl:
+            return None
+        return {'id': session_id, 'model': row[0], 'system': row[1], 'messages': json.loads(row[2])}
+
+    def messages(self, session, message):
+        """Ollama /api/chat messages for the next turn."""
+        return (
+            [{'role': 'system', 'content': session['system']}]
+            + session['messages']
+            + [{'role': 'user', 'content': message}]
+        )
+
+    def append(self, session, message, reply):
+        """Record a completed turn, keeping only the newest max_turns."""
+        history = session['messages'] + [
+            {'role': 'user', 'content': message},
+            {'role': 'assistant', 'content': reply},
+        ]
+        history = history[-self.max_turns * 2:]
+        session['messages'] = history
+        try:
+            self._db().execute(
+                'UPDATE sessions SET messages = ?, updated_at = ? WHERE id = ?',
+                (json.dumps(history), time.time(), session['id'])
+            )
+        except sqlite3.Error as e:
+            print(f"Chat session update failed: {e}")
+
+    def delete(self, session_id):
+        try:
+            self._db().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        except sqlite3.Error as e:
+            print(f"Chat session delete failed: {e}")
+
+    def count(self):
+        """Live sessions, or None if the database can't be read."""
+        cutoff = time.time() - self.ttl
+        try:
+            return self._db().execute(
+                'SELECT COUNT(*) FROM sessions WHERE updated_at >= ?', (cutoff,)
+            ).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Chat session count failed: {e}")
+            return None
@@ -0,0 +1,248 @@
+"""
+Two-phase drafting for large decks.
+
+A long deck requested in one chat turn is a single sequential generation
+that easily runs past the Ollama timeout. The drafter splits it up:
+
+1. Outline: one schema-constrained call returns the slide types and titles.
+2. Slides: every slide body is drafted concurrently (up to `parallelism`
+   calls at once), constrained to its type's schema and checked on its own.
+   Slides that fail are retried individually. With an admission gate each
+   slide call takes its own slot, so a draft never runs more generations
+   than the gate allows.
+
+draft() yields (event, data) pairs as it goes so the route can stream
+progress for both phases.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import requests
+
+from ollama_client import OllamaOverloaded
+from slide_schema import VALID_SLIDE_TYPES, REQUIRED_FIELDS, ALLOWED_FIELDS, FIELD_ORDER, slide_json_schema
+
+DECK_PARALLELISM = int(os.environ.get('HYFLUX_DECK_PARALLELISM', 4))
+DECK_RETRIES = int(os.environ.get('HYFLUX_DECK_RETRIES', 2))
+DECK_MAX_SLIDES = int(os.environ.get('HYFLUX_DECK_MAX_SLIDES', 60))
+
+OUTLINE_SYSTEM_PROMPT = f"""You plan PowerPoint decks for the HyFlux template.
+
+Answer with a JSON object: 'presentation' (title, author, date as YYYY-MM-DD) and
+'outline', the ordered list of slides, each with only a 'type' and a 'title'.
+
+Slide types: {', '.join(sorted(VALID_SLIDE_TYPES))}
+- Start with title_white and finish with end_slide
+- Use divider slides between sections
+- Use text_only for bullet content, two_column/three_column for comparisons, quote for quotes
+- Give every slide a short, specific title
+- Plan as many slides as the user asks for"""
+
+SLIDE_SYSTEM_PROMPT = """You write one slide of a HyFlux PowerPoint deck at a time.
+
+Answer with a JSON object for the requested slide only, using exactly the fields of its type.
+- Body fields (content, left_content, middle_content, right_content) are bullet lists:
+  one bullet per line, every line starts with "• ", no blank lines
+- Section labels are bullets too (e.g. "• Core pack:")
+- Keep the title from the outline unless it is clearly wrong
+- Keep the slide consistent with the rest of the outline"""
+
+
+def outline_json_schema(max_slides=DECK_MAX_SLIDES):
+    return {
+        'type': 'object',
+        'properties': {
+            'presentation': {
+                'type': 'object',
+                'properties': {
+                    'title': {'type': 'string'},
+                    'author': {'type': 'string'},
+                    'date': {'type': 'string'},
+                },
+                'required': ['title', 'author', 'date'],
+            },
+            'outline': {
+                'type': 'array',
+                'minItems': 1,
+                'maxItems': max_slides,
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'type': {'type': 'string', 'enum': sorted(VALID_SLIDE_TYPES)},
+                        'title': {'type': 'string'},
+                    },
+                    'required': ['type', 'title'],
+                },
+            },
+        },
+        'required': ['presentation', 'outline'],
+    }
+
+
+def check_slide(slide, slide_type):
+    """Problems with one drafted slide (empty list when it is usable)."""
+    if not isinstance(slide, dict):
+        return ['slide must be a JSON object']
+    problems = []
+    if slide.get('type') != slide_type:
+        problems.append(f"type must be '{slide_type}'")
+    for field in sorted(REQUIRED_FIELDS[slide_type]):
+        value = slide.get(field)
+        if not isinstance(value, str) or not value.strip():
+            problems.append(f"'{field}' must be non-empty text")
+    extra = set(slide) - ALLOWED_FIELDS[slide_type]
+    if extra:
+        problems.append(f"unexpected fields: {', '.join(sorted(extra))}")
+    return problems
+
+
+def placeholder_slide(item):
+    """Stand-in for a slide that failed every attempt, so the deck still assembles."""
+    slide = {'type': item['type']}
+    for field in sorted(REQUIRED_FIELDS[item['type']], key=FIELD_ORDER.index):
+        slide[field] = item['title'] if field == 'title' else '• Draft failed - please write this slide'
+    return slide
+
+
+class DeckDrafter:
+    """Outline-then-slides drafting against Ollama /api/chat."""
+
+    def __init__(self, client, model, keep_alive, parallelism=DECK_PARALLELISM, retries=DECK_RETRIES, gate=None):
+        self.client = client
+        self.model = model
+        self.keep_alive = keep_alive
+        self.parallelism = max(1, parallelism)
+        self.retries = max(0, retries)
+        self.gate = gate
+
+    def _payload(self, system, user, schema, stream):
+        return {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': system},
+                {'role': 'user', 'content': user},
+            ],
+            'format': schema,
+            'stream': stream,
+            'keep_alive': self.keep_alive,
+        }
+
+    def _outline(self, request):
+        """Stream the outline call, yielding progress and finally ('outline', data)."""
+        text = []
+        seen = 0
+        with self.client.post(
+            '/api/chat',
+            json=self._payload(OUTLINE_SYSTEM_PROMPT, request, outline_json_schema(), stream=True),
+            stream=True,
+            timeout=(5, 60)
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise ValueError(chunk['error'])
+                text.append(chunk.get('message', {}).get('content', ''))
+                # Each planned slide carries one "title"; count them as they arrive
+                planned = max(0, ''.join(text).count('"title"') - 1)
+                if planned > seen:
+                    seen = planned
+                    yield 'progress', {'phase': 'outline', 'planned': planned}
+                if chunk.get('done'):
+                    break
+
+        data = json.loads(''.join(text))
+        outline = [
+            {'type': item['type'], 'title': str(item.get('title', '')).strip()}
+            for item in data.get('outline', [])
+            if isinstance(item, dict) and item.get('type') in VALID_SLIDE_TYPES
+        ][:DECK_MAX_SLIDES]
+        if not outline:
+            raise ValueError('The model returned an empty outline')
+        yield 'outline', {'presentation': data.get('presentation', {}), 'outline': outline}
+
+    def _slide_prompt(self, request, deck, index, problems):
+        outline = '\n'.join(f"{i + 1}. {item['type']} - {item['title']}" for i, item in enumerate(deck['outline']))
+        item = deck['outline'][index]
+        prompt = (
+            f"Deck: {deck['presentation'].get('title', '')}\n"
+            f"Request: {request}\n\n"
+            f"Outline:\n{outline}\n\n"
+            f"Write slide {index + 1} ({item['type']}): \"{item['title']}\""
+        )
+        if problems:
+            prompt += '\n\nYour previous answer for this slide was rejected: ' + '; '.join(problems)
+        return prompt
+
+    def _draft_slide(self, request, deck, index):
+        """Draft one slide, retrying on its own until it checks out."""
+        item = deck['outline'][index]
+        started = time.perf_counter()
+        problems = []
+        for attempt in range(1, self.retries + 2):
+            try:
+                with self.gate.slot() if self.gate is not None else nullcontext():
+                    response = self.client.post(
+                        '/api/chat',
+                        json=self._payload(
+                            SLIDE_SYSTEM_PROMPT, self._slide_prompt(request, deck, index, problems),
+                            slide_json_schema(item['type']), stream=False
+                        ),
+                        timeout=60
+                    )
+                response.raise_for_status()
+                slide = json.loads(response.json().get('message', {}).get('content') or 'null')
+                problems = check_slide(slide, item['type'])
+            except (requests.exceptions.RequestException, ValueError, OllamaOverloaded) as e:
+                slide, problems = None, [str(e)]
+            if not problems:
+                return index, slide, attempt, [], round((time.perf_counter() - started) * 1000)
+        return index, placeholder_slide(item), attempt, problems, round((time.perf_counter() - started) * 1000)
+
+    def draft(self, request):
+        """Yield progress events; the last one is ('assembled', {...})."""
+        started = time.perf_counter()
+        deck = None
+        for event, data in self._outline(request):
+            if event == 'outline':
+                deck = data
+            yield event, data
+        outline_ms = round((time.perf_counter() - started) * 1000)
+
+        total = len(deck['outline'])
+        slides = [None] * total
+        failed = []
+        with ThreadPoolExecutor(max_workers=min(self.parallelism, total), thread_name_prefix='deck-slide') as pool:
+            futures = [pool.submit(self._draft_slide, request, deck, i) for i in range(total)]
+            for completed, future in enumerate(as_completed(futures), 1):
+                index, slide, attempts, problems, ms = future.result()
+                slides[index] = slide
+                if problems:
+                    failed.append(index + 1)
+                yield 'slide', {
+                    'index': index,
+                    'slide': slide,
+                    'attempts': attempts,
+                    'valid': not problems,
+                    'problems': problems,
+                    'ms': ms,
+                    'completed': completed,
+                    'total': total,
+                }
+
+        yield 'assembled', {
+            'spec': {'presentation': deck['presentation'], 'slides': slides},
+            'failed': sorted(failed),
+            'timings': {
+                'outline_ms': outline_ms,
+                'slides_ms': round((time.perf_counter() - started) * 1000) - outline_ms,
+                'total_ms': round((time.perf_counter() - started) * 1000),
+                'parallelism': min(self.parallelism, total),
+            },
+        }
@@ -0,0 +1,65 @@
+"""
+Gunicorn configuration for the HyFlux PPT Generator web application.
+
+Production serving mode: a preforking WSGI server whose master imports the
+app, preloads the PowerPoint template and warms caches *before* forking, so
+every worker shares that memory copy-on-write and serves its first request
+warm.
+
+Setting HYFLUX_ASYNC=1 serves the ASGI app (asgi.py) with uvicorn workers
+instead: chat routes run on an event loop and only deck generation and the
+other Flask routes use threads.
+
+Environment:
+    HYFLUX_ASYNC      1 to serve asgi:application with uvicorn workers (default: 0)
+    HYFLUX_WORKERS    number of worker processes (default: 2 x CPU, max 8)
+    HYFLUX_THREADS    threads per worker for I/O-bound chat calls (default: 4)
+    HYFLUX_TIMEOUT    worker timeout in seconds (default: 120)
+    HYFLUX_BIND       bind address (default: 0.0.0.0:5000)
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('HYFLUX_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('HYFLUX_WORKERS', min(multiprocessing.cpu_count() * 2, 8)))
+threads = int(os.environ.get('HYFLUX_THREADS', 4))
+if os.environ.get('HYFLUX_ASYNC', '0') == '1':
+    wsgi_app = 'asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+    worker_class = 'gthread'
+timeout = int(os.environ.get('HYFLUX_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app in the master so the fork shares it
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('HYFLUX_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """Warm the preloaded app in the master, then freeze it for copy-on-write."""
+    from app import warm_up
+
+    warm_up()
+    # Workers inherit this, so the ASGI lifespan skips a second warm-up in each
+    os.environ['HYFLUX_PRELOADED'] = '1'
+    # Move everything allocated so far out of the GC's reach so collections
+    # in workers don't touch (and copy) the shared pages.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """Start this worker's background threads: keep-warm pings, retention sweeper, RSS watchdog."""
+    from app import memory_tracker, retention
+    from model_residency import residency
+
+    residency.start()
+    retention.start()
+    memory_tracker.start()
@@ -0,0 +1,125 @@
+"""
+HTTP validators, range requests and compression for the web application.
+
+Downloads get a strong ETag derived from the file's content (SHA-256, cached
+per inode, size and mtime so each file is hashed once), Last-Modified, and
+Werkzeug's conditional handling: If-None-Match / If-Modified-Since answer
+304 and Range / If-Range serve partial content so interrupted downloads
+resume. The file body goes out through the server's wsgi.file_wrapper, which
+gunicorn sends with sendfile(2); with HYFLUX_X_SENDFILE=1 a fronting proxy
+(nginx X-Accel, Apache mod_xsendfile) sends it instead.
+
+JSON responses of any status are gzip-compressed above a size threshold
+when the client accepts it, and successful GET JSON responses get a content ETag so unchanged listings
+revalidate with a 304.
+
+Environment:
+    HYFLUX_GZIP_MIN_SIZE   smallest JSON body (bytes) worth compressing (default: 1024)
+    HYFLUX_GZIP_LEVEL      gzip level 1-9 (default: 6)
+    HYFLUX_X_SENDFILE      1 to hand file bodies to the proxy via X-Sendfile (default: 0)
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import request, send_file
+
+GZIP_MIN_SIZE = int(os.environ.get('HYFLUX_GZIP_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('HYFLUX_GZIP_LEVEL', 6))
+X_SENDFILE = os.environ.get('HYFLUX_X_SENDFILE', '0') == '1'
+
+# Content hashes of recently served files, keyed by (path, inode, size, mtime)
+_HASH_CACHE_SIZE = 512
+_hash_cache = OrderedDict()
+_hash_lock = threading.Lock()
+
+
+def file_etag(path, stat=None):
+    """Strong ETag value for a file: the SHA-256 of its content."""
+    stat = stat or os.stat(path)
+    key = (str(path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        etag = _hash_cache.get(key)
+        if etag is not None:
+            _hash_cache.move_to_end(key)
+            return etag
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()[:32]
+
+    with _hash_lock:
+        _hash_cache[key] = etag
+        while len(_hash_cache) > _HASH_CACHE_SIZE:
+            _hash_cache.popitem(last=False)
+    return etag
+
+
+def send_file_cached(path, **kwargs):
+    """send_file with a content ETag, conditional requests and byte ranges."""
+    stat = os.stat(path)
+    return send_file(
+        str(path),
+        etag=file_etag(path, stat),
+        last_modified=stat.st_mtime,
+        conditional=True,
+        max_age=0,  # always revalidate; the ETag makes that a cheap 304
+        **kwargs
+    )
+
+
+def _qvalue(params):
+    """The q parameter of an Accept-Encoding entry (1 if absent, 0 if malformed)."""
+    for param in params.split(';'):
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value.strip())
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header value allows gzip (an explicit gzip entry overrides *)."""
+    qvalues = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        qvalues[coding.strip().lower()] = _qvalue(params)
+    q = qvalues.get('gzip', qvalues.get('*', 0.0))
+    return q > 0
+
+
+def gzip_body(body, level=GZIP_LEVEL):
+    # mtime=0 keeps the output identical for identical input, so ETags stay stable
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def finish_json_response(response):
+    """after_request hook: compress large JSON bodies and validate GET ones."""
+    if (response.mimetype != 'application/json' or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    # Any status: large error and partial-failure payloads compress as well as successes
+    if len(response.get_data()) >= GZIP_MIN_SIZE and accepts_gzip(request.headers.get('Accept-Encoding')):
+        response.set_data(gzip_body(response.get_data()))
+        response.headers['Content-Encoding'] = 'gzip'
+
+    if request.method in ('GET', 'HEAD') and response.status_code == 200:
+        # Hash of the bytes actually sent, so gzip and identity get different tags
+        response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+    return response
+
+
+def init_app(app):
+    app.config['USE_X_SENDFILE'] = X_SENDFILE
+    app.after_request(finish_json_response)
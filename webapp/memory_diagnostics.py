@@ -0,0 +1,363 @@
+"""
+Memory accounting and leak diagnostics for long-running workers.
+
+Per-request memory: /api/generate and /api/validate record how far the
+worker's resident set rose above its starting point at the request's peak
+(`peak_rss_growth`), how much of that was still resident when it finished
+(`rss_growth`) and, when tracemalloc is on, the peak of Python-heap
+allocations during the request. python-pptx keeps its XML in lxml (libxml2
+allocates outside Python's allocator), so the RSS numbers are the ones that
+follow the Presentation object; the tracemalloc peak covers the Python side
+(YAML, repair strings). On Linux the kernel's RSS high-water mark is reset
+through /proc/self/clear_refs when a request starts, so the peak is the
+request's own even in a warm worker; elsewhere only a request that pushes
+the process past its previous maximum registers a peak beyond its retained
+growth. Both peaks are process wide, so a request that overlapped another
+one reports an upper bound and is flagged `overlapped`.
+
+Snapshots: admin endpoints take tracemalloc snapshots and diff them, so a
+slow leak shows up as the allocation sites that keep growing between two
+snapshots taken hours apart.
+
+Watchdog: a thread per worker checks RSS every HYFLUX_RSS_CHECK_INTERVAL
+seconds. Above HYFLUX_RSS_LIMIT_MB it logs the worker's top allocation
+sites and, with HYFLUX_RSS_ACTION=recycle, asks the worker to exit after
+its in-flight requests so the process manager starts a fresh one.
+
+Environment:
+    HYFLUX_TRACEMALLOC          1 to trace Python allocations from startup (default: 0)
+    HYFLUX_TRACEMALLOC_FRAMES   traceback depth kept per allocation (default: 1)
+    HYFLUX_RSS_LIMIT_MB         RSS per worker that trips the watchdog, 0 disables (default: 0)
+    HYFLUX_RSS_ACTION           log or recycle (default: log)
+    HYFLUX_RSS_CHECK_INTERVAL   seconds between watchdog checks (default: 30)
+"""
+
+import gc
+import os
+import resource
+import signal
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import metrics
+
+TRACEMALLOC = os.environ.get('HYFLUX_TRACEMALLOC', '0') == '1'
+TRACEMALLOC_FRAMES = int(os.environ.get('HYFLUX_TRACEMALLOC_FRAMES', 1))
+RSS_LIMIT_MB = float(os.environ.get('HYFLUX_RSS_LIMIT_MB', 0))
+RSS_ACTION = os.environ.get('HYFLUX_RSS_ACTION', 'log')
+RSS_CHECK_INTERVAL = float(os.environ.get('HYFLUX_RSS_CHECK_INTERVAL', 30))
+
+# Endpoints whose memory use is recorded per request
+TRACKED_ENDPOINTS = ('/api/generate', '/api/validate')
+
+# Snapshots kept per worker (each holds every live traced allocation)
+MAX_SNAPSHOTS = 5
+
+# Allocation noise from the diagnostics themselves
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+memory_peak = metrics.Histogram(
+    'hyflux_request_memory_peak_bytes', 'Peak traced Python allocations during a request (tracemalloc on)',
+    ['pid', 'route'], buckets=tuple(2 ** n * 1024 * 1024 for n in range(0, 11))
+)
+rss_peak = metrics.Histogram(
+    'hyflux_request_rss_peak_bytes', 'Peak resident set growth of the worker while a request ran',
+    ['pid', 'route'], buckets=(0,) + tuple(2 ** n * 1024 * 1024 for n in range(0, 11))
+)
+rss_growth = metrics.Histogram(
+    'hyflux_request_rss_growth_bytes', 'Resident set growth of the worker while a request ran',
+    ['pid', 'route'], buckets=(0,) + tuple(2 ** n * 1024 * 1024 for n in range(0, 11))
+)
+rss_bytes = metrics.Gauge(
+    'hyflux_worker_rss_bytes', 'Resident set size of this worker', ['pid'],
+    function=lambda: {metrics.pid(): rss()}
+)
+
+
+def rss():
+    """Current resident set size in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # Not Linux: the peak is the closest thing available (KiB on Linux/BSD, bytes on macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+
+
+def peak_rss():
+    """Resident set high-water mark in bytes (since the last reset_peak_rss())."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+
+
+def reset_peak_rss():
+    """Reset the high-water mark to the current RSS (Linux); returns False if unsupported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def top_allocations(snapshot, limit=10, key='lineno'):
+    return [
+        {'site': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+        for stat in snapshot.statistics(key)[:limit]
+    ]
+
+
+class MemoryTracker:
+    """Per-request memory use, tracemalloc snapshots and the RSS watchdog (this process)."""
+
+    def __init__(self, trace=TRACEMALLOC, frames=TRACEMALLOC_FRAMES, rss_limit_mb=RSS_LIMIT_MB,
+                 action=RSS_ACTION, interval=RSS_CHECK_INTERVAL):
+        self.trace = trace
+        self.frames = frames
+        self.rss_limit = int(rss_limit_mb * 1024 * 1024)
+        self.action = action
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._active = 0
+        self._epoch = 0
+        self._snapshots = deque(maxlen=MAX_SNAPSHOTS)
+        self._snapshot_seq = 0
+        self._routes = {}
+        self.peak_resettable = None
+        self.watchdog = {'checks': 0, 'tripped': 0, 'last_rss': None, 'recycling': False}
+
+    def start(self):
+        """Start tracing and the watchdog for this process (idempotent)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._snapshots.clear()
+            if self.trace and not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            if self.rss_limit > 0 and self.interval > 0:
+                threading.Thread(target=self._watchdog_loop, name='rss-watchdog', daemon=True).start()
+
+    # --- Per request --------------------------------------------------------
+
+    def begin(self):
+        """Start accounting a request; returns the token for end()."""
+        with self._lock:
+            if self._active == 0:
+                if tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+                if self.peak_resettable is not False:
+                    self.peak_resettable = reset_peak_rss()
+            self._active += 1
+            self._epoch += 1
+            traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+            return {'epoch': self._epoch, 'active': self._active, 'rss': rss(), 'hwm': peak_rss(),
+                    'traced': traced}
+
+    def end(self, token, route):
+        """Finish accounting a request; returns {peak_rss_growth, rss_growth, peak_traced, overlapped}."""
+        tracing = tracemalloc.is_tracing() and token['traced'] is not None
+        peak = tracemalloc.get_traced_memory()[1] - token['traced'] if tracing else None
+        growth = max(0, rss() - token['rss'])
+        hwm = peak_rss()
+        # An unmoved high-water mark means the peak stayed below one reached
+        # earlier (no reset available): the retained growth is all we know
+        peak_growth = max(growth, hwm - token['rss']) if hwm > token['hwm'] else growth
+        with self._lock:
+            self._active -= 1
+            # Anyone else started or was running while we were: the peak is shared
+            overlapped = token['active'] > 1 or self._epoch != token['epoch']
+            stats = self._routes.setdefault(route, {
+                'requests': 0, 'max_peak_rss_growth': 0, 'max_rss_growth': 0, 'total_rss_growth': 0,
+                'max_peak_traced': None, 'overlapped': 0, 'recent': deque(maxlen=20),
+            })
+            stats['requests'] += 1
+            stats['overlapped'] += overlapped
+            stats['total_rss_growth'] += growth
+            stats['max_peak_rss_growth'] = max(stats['max_peak_rss_growth'], peak_growth)
+            stats['max_rss_growth'] = max(stats['max_rss_growth'], growth)
+            if peak is not None:
+                stats['max_peak_traced'] = max(stats['max_peak_traced'] or 0, peak)
+            usage = {'peak_rss_growth': peak_growth, 'rss_growth': growth, 'peak_traced': peak,
+                     'overlapped': overlapped}
+            stats['recent'].append({'at': time.time(), **usage})
+        rss_peak.observe(peak_growth, pid=metrics.pid(), route=route)
+        rss_growth.observe(growth, pid=metrics.pid(), route=route)
+        if peak is not None:
+            memory_peak.observe(peak, pid=metrics.pid(), route=route)
+        return usage
+
+    # --- Snapshots ----------------------------------------------------------
+
+    def snapshot(self, label=''):
+        """Take a tracemalloc snapshot (starting tracing if needed)."""
+        self.start()
+        started_tracing = False
+        if not tracemalloc.is_tracing():
+            # Only allocations made from now on are visible; diff a later snapshot against this one
+            tracemalloc.start(self.frames)
+            started_tracing = True
+        snap = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        traced, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self._snapshot_seq += 1
+            snapshot_id = str(self._snapshot_seq)
+        entry = {
+            'id': snapshot_id,
+            'label': label,
+            'at': time.time(),
+            'rss': rss(),
+            'traced': traced,
+            'traced_peak': peak,
+            'started_tracing': started_tracing,
+            'snapshot': snap,
+        }
+        with self._lock:
+            self._snapshots.append(entry)
+        return self._describe(entry)
+
+    def _describe(self, entry):
+        return {k: v for k, v in entry.items() if k != 'snapshot'}
+
+    def snapshots(self):
+        with self._lock:
+            return [self._describe(entry) for entry in self._snapshots]
+
+    def _find(self, snapshot_id):
+        with self._lock:
+            for entry in self._snapshots:
+                if entry['id'] == snapshot_id:
+                    return entry
+        return None
+
+    def diff(self, old_id=None, new_id=None, limit=25, key='lineno'):
+        """Top allocation sites that grew between two snapshots (default: oldest vs newest)."""
+        with self._lock:
+            entries = list(self._snapshots)
+        if len(entries) < 2 and not (old_id and new_id):
+            raise LookupError('Take at least two snapshots first')
+        old = self._find(old_id) if old_id else entries[0]
+        new = self._find(new_id) if new_id else entries[-1]
+        if old is None or new is None:
+            raise LookupError('Unknown snapshot id')
+        stats = new['snapshot'].compare_to(old['snapshot'], key)
+        return {
+            'from': self._describe(old),
+            'to': self._describe(new),
+            'rss_change': new['rss'] - old['rss'],
+            'traced_change': new['traced'] - old['traced'],
+            'top': [
+                {
+                    'site': str(stat.traceback),
+                    'size': stat.size,
+                    'size_diff': stat.size_diff,
+                    'count': stat.count,
+                    'count_diff': stat.count_diff,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+    def clear_snapshots(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    # --- Watchdog -----------------------------------------------------------
+
+    def check(self):
+        """One watchdog check; returns True if the limit was exceeded."""
+        current = rss()
+        self.watchdog['checks'] += 1
+        self.watchdog['last_rss'] = current
+        if current <= self.rss_limit or self.watchdog['recycling']:
+            return False
+        self.watchdog['tripped'] += 1
+        print(f"Memory watchdog: worker {os.getpid()} RSS {current / 2 ** 20:.0f} MB "
+              f"is over the {self.rss_limit / 2 ** 20:.0f} MB limit")
+        if tracemalloc.is_tracing():
+            snap = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            for site in top_allocations(snap, limit=5):
+                print(f"  {site['size'] / 2 ** 20:8.1f} MB in {site['count']} blocks  {site['site']}")
+        if self.action == 'recycle':
+            self.watchdog['recycling'] = True
+            print(f"Memory watchdog: recycling worker {os.getpid()} after in-flight requests")
+            # Gunicorn and uvicorn workers treat SIGTERM as a graceful shutdown
+            # and the master replaces them
+            os.kill(os.getpid(), signal.SIGTERM)
+        return True
+
+    def _watchdog_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:  # keep watching even if one check fails
+                print(f"Memory watchdog: check failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            routes = {
+                route: {**{k: v for k, v in stats.items() if k != 'recent'}, 'recent': list(stats['recent'])}
+                for route, stats in self._routes.items()
+            }
+        traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+        return {
+            'pid': os.getpid(),
+            'rss': rss(),
+            'peak_rss': peak_rss(),
+            # None until the first request; False means peaks are high-water-mark deltas only
+            'peak_rss_resettable': self.peak_resettable,
+            'tracemalloc': {
+                'tracing': tracemalloc.is_tracing(),
+                'frames': tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else None,
+                'traced': traced[0] if traced else None,
+                'peak': traced[1] if traced else None,
+            },
+            'gc': {'counts': gc.get_count(), 'frozen': gc.get_freeze_count(), 'objects': len(gc.get_objects())},
+            'routes': routes,  # this worker only
+            'snapshots': self.snapshots(),
+            'watchdog': {
+                'limit': self.rss_limit,
+                'action': self.action,
+                'interval': self.interval,
+                **self.watchdog,
+            },
+        }
+
+
+def init_app(app, tracker):
+    """Account memory for the tracked endpoints."""
+    from flask import g, request
+
+    @app.before_request
+    def _begin_memory():
+        if request.path in TRACKED_ENDPOINTS:
+            tracker.start()
+            g.memory_token = tracker.begin()
+
+    @app.teardown_request
+    def _end_memory(exc):
+        token = g.pop('memory_token', None)
+        if token is not None:
+            tracker.end(token, request.path)
@@ -0,0 +1,313 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A small registry of counters, gauges and histograms kept in this process and
+rendered by GET /metrics, so request latency, generation stages and Ollama
+calls can be scraped without running a separate metrics service or
+installing a client library.
+
+Metrics are per process: with several gunicorn workers each scrape is
+answered by one of them. Values read from shared state at scrape time (chat
+cache counters, output volume size) are the same whichever worker answers;
+the rest are labelled with the worker's pid so a scraper can tell workers
+apart.
+
+Environment:
+    HYFLUX_METRICS   0 to disable the /metrics endpoint and request timing (default: 1)
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('HYFLUX_METRICS', '1') == '1'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers cached JSON replies up to a long Ollama generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """Base class: a named family of samples keyed by label values."""
+
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), function=None, registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def collect_from(self, function):
+        """Read the metric's value(s) from function() at scrape time instead."""
+        self.function = function
+        return self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """{label values: value}; a function metric is read at collect time."""
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.function()
+        if value is None:
+            return {}
+        if not isinstance(value, dict):
+            return {(): value}
+        return {(key,) if isinstance(key, str) else tuple(key): v for key, v in value.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for values, value in sorted(self._samples().items()):
+            if value is not None:
+                lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry=registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            states = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._values.items())
+        for values, (counts, total, count) in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = (('le', _format_value(float(bound))),)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(round(total, 6))}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """All metrics in the text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:  # one failing collector must not hide the rest
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- HTTP ------------------------------------------------------------------
+
+http_requests = Counter(
+    'hyflux_http_requests_total', 'HTTP requests by route, method and status',
+    ['pid', 'route', 'method', 'status']
+)
+http_request_duration = Histogram(
+    'hyflux_http_request_duration_seconds', 'Time from request start to the last byte sent, by route',
+    ['pid', 'route', 'method']
+)
+
+# --- Deck generation -------------------------------------------------------
+
+generation_stage_duration = Histogram(
+    'hyflux_generation_stage_duration_seconds',
+    'Time spent per deck generation stage (template_acquire, parse, normalize, spec_reload, slide_build, save)',
+    ['pid', 'stage']
+)
+slide_build_duration = Histogram(
+    'hyflux_slide_build_duration_seconds', 'Time to build one slide, by layout type',
+    ['pid', 'layout'], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+generations = Counter(
+    'hyflux_generations_total', 'Deck generations by result (success, invalid, error)',
+    ['pid', 'result']
+)
+generated_slides = Counter(
+    'hyflux_generated_slides_total', 'Slides written to generated decks', ['pid']
+)
+
+# --- Ollama ----------------------------------------------------------------
+
+ollama_request_duration = Histogram(
+    'hyflux_ollama_request_duration_seconds', 'Ollama chat turn duration by model',
+    ['pid', 'model']
+)
+ollama_errors = Counter(
+    'hyflux_ollama_errors_total', 'Failed Ollama chat calls by model', ['pid', 'model']
+)
+
+# Read at scrape time from the admission gates registered with track_gate()
+_gates = {}
+
+
+def track_gate(name, gate):
+    _gates[name] = gate
+
+
+def tracked_gates():
+    return dict(_gates)
+
+
+ollama_queue_depth = Gauge(
+    'hyflux_ollama_queue_depth', 'Chat requests holding (active) or waiting for (queued) an Ollama slot',
+    ['pid', 'gate', 'state'],
+    function=lambda: {
+        (pid(), name, state): stats[state]
+        for name, stats in ((name, gate.stats()) for name, gate in _gates.items())
+        for state in ('active', 'queued')
+    }
+)
+ollama_admissions = Counter(
+    'hyflux_ollama_admissions_total', 'Admission gate outcomes (admitted, rejected, timed_out, coalesced)',
+    ['pid', 'gate', 'outcome'],
+    function=lambda: {
+        (pid(), name, outcome): stats[outcome]
+        for name, stats in ((name, gate.stats()) for name, gate in _gates.items())
+        for outcome in ('admitted', 'rejected', 'timed_out', 'coalesced')
+    }
+)
+
+# --- Caches and storage (bound by the app with collect_from) ---------------
+
+chat_cache_requests = Counter(
+    'hyflux_chat_cache_requests_total', 'Chat response cache lookups by result, all workers', ['result']
+)
+chat_cache_hit_ratio = Gauge(
+    'hyflux_chat_cache_hit_ratio', 'Chat response cache hits / (hits + misses), all workers'
+)
+chat_cache_entries = Gauge(
+    'hyflux_chat_cache_entries', 'Answers held in the chat response cache'
+)
+storage_bytes = Gauge(
+    'hyflux_storage_bytes', 'Bytes held in a managed output directory', ['directory']
+)
+storage_files = Gauge(
+    'hyflux_storage_files', 'Files held in a managed output directory', ['directory']
+)
+storage_free_bytes = Gauge(
+    'hyflux_storage_free_bytes', 'Free space on the volume of a managed output directory', ['directory']
+)
+retention_evictions = Counter(
+    'hyflux_retention_evictions_total', 'Files removed by the retention sweeper by reason',
+    ['pid', 'reason']
+)
+
+
+def pid():
+    return str(os.getpid())
+
+
+def render():
+    return REGISTRY.render()
+
+
+def init_app(app):
+    """Time every request by route; the clock stops when the last byte is sent."""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        # The rule, not the path, so /api/download/<filename> stays one series
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        method, status = request.method, str(response.status_code)
+
+        def record():
+            labels = {'pid': pid(), 'route': route, 'method': method}
+            http_request_duration.observe(time.perf_counter() - started, **labels)
+            http_requests.inc(status=status, **labels)
+
+        # Streamed responses (SSE chat) finish when the body is closed, not here
+        response.call_on_close(record)
+        return response
@@ -0,0 +1,249 @@
+"""
+Model residency and latency-aware model routing for the chat assistant.
+
+Ollama loads a model into memory on first use and unloads it once its
+keep-alive runs out, so a request for a model that isn't resident pays a
+cold load before the first token. ModelResidency tracks which models are
+loaded (Ollama's /api/ps), keeps per-model latency statistics from the
+timings of every chat turn, and keeps the preferred model warm with a
+background keep-alive ping shortly before it would be unloaded.
+
+ModelRouter picks a model for requests sent with model "auto": small edits
+go to the fast model (or whichever candidate is already resident, to skip a
+cold load), whole-deck requests go to the strong model.
+
+Environment:
+    HYFLUX_PREFERRED_MODEL     model kept warm and used when nothing else fits (default: llama3.2)
+    HYFLUX_KEEPWARM_INTERVAL   seconds between residency checks, 0 disables pings (default: 120)
+    HYFLUX_MODEL_ROUTING       1 to route requests without a model automatically (default: 0)
+    HYFLUX_FAST_MODEL          model for small edits (default: preferred model)
+    HYFLUX_STRONG_MODEL        model for whole decks (default: preferred model)
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+import metrics
+import prompt_builder
+from ollama_client import ollama
+
+PREFERRED_MODEL = os.environ.get('HYFLUX_PREFERRED_MODEL', 'llama3.2')
+KEEPWARM_INTERVAL = float(os.environ.get('HYFLUX_KEEPWARM_INTERVAL', 120))
+KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+ROUTING_ENABLED = os.environ.get('HYFLUX_MODEL_ROUTING', '0') == '1'
+FAST_MODEL = os.environ.get('HYFLUX_FAST_MODEL', '') or PREFERRED_MODEL
+STRONG_MODEL = os.environ.get('HYFLUX_STRONG_MODEL', '') or PREFERRED_MODEL
+
+# A turn whose load took longer than this had to bring the model in cold
+COLD_LOAD_MS = 500
+
+
+def model_key(name):
+    """Ollama treats "llama3.2" and "llama3.2:latest" as the same model."""
+    return name[:-len(':latest')] if name.endswith(':latest') else name
+
+
+def _parse_expiry(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+class ModelResidency:
+    """Loaded models and per-model latency statistics (this process).
+
+    The keep-warm thread is started per process on first use, like the
+    Ollama client's health probe, so preforked workers each run their own.
+    """
+
+    def __init__(self, client, preferred=PREFERRED_MODEL, interval=KEEPWARM_INTERVAL, keep_alive=KEEP_ALIVE):
+        self.client = client
+        self.preferred = preferred
+        self.interval = interval
+        self.keep_alive = keep_alive
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loaded = {}
+        self._checked_at = None
+        self._stats = {}
+        self.pings = 0
+        self.last_error = None
+
+    def start(self):
+        """Start the keep-warm thread for this process (idempotent)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if self.interval > 0:
+                threading.Thread(target=self._keep_warm_loop, name='ollama-keepwarm', daemon=True).start()
+
+    def refresh(self, timeout=5):
+        """Read the loaded models from Ollama's /api/ps."""
+        try:
+            response = self.client.get('/api/ps', timeout=timeout)
+            response.raise_for_status()
+            loaded = {
+                model_key(m.get('name', '')): {
+                    'name': m.get('name', ''),
+                    'size_vram': m.get('size_vram'),
+                    'expires_at': _parse_expiry(m.get('expires_at')),
+                }
+                for m in response.json().get('models', [])
+            }
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.last_error = str(e)
+            raise
+        with self._lock:
+            self._loaded = loaded
+            self._checked_at = time.time()
+            self.last_error = None
+        return loaded
+
+    def is_loaded(self, model):
+        """Whether the model was resident at the last check (no network I/O)."""
+        with self._lock:
+            entry = self._loaded.get(model_key(model))
+        if entry is None:
+            return False
+        return entry['expires_at'] is None or entry['expires_at'] > time.time()
+
+    def loaded(self):
+        with self._lock:
+            return sorted(entry['name'] for entry in self._loaded.values())
+
+    def ping(self):
+        """Load the preferred model (or extend its keep-alive) without generating."""
+        response = self.client.post(
+            '/api/generate', json={'model': self.preferred, 'keep_alive': self.keep_alive}, timeout=(5, 300)
+        )
+        response.raise_for_status()
+        self.pings += 1
+
+    def _keep_warm_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                self.refresh(timeout=2)
+                with self._lock:
+                    entry = self._loaded.get(model_key(self.preferred))
+                expires_at = entry and entry['expires_at']
+                # Ping only when the model is gone or would expire before the next check
+                if entry is None or (expires_at is not None and expires_at - time.time() < 2 * self.interval):
+                    self.ping()
+                    self.refresh(timeout=2)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.last_error = str(e)
+            time.sleep(self.interval)
+
+    def record(self, model, timings):
+        """Fold one turn's Ollama timings into the model's statistics."""
+        self.start()
+        key = model_key(model)
+        load_ms = timings.get('load_ms') or 0
+        if timings.get('total_ms') is not None:
+            metrics.ollama_request_duration.observe(timings['total_ms'] / 1000, pid=metrics.pid(), model=key)
+        with self._lock:
+            stats = self._stats.setdefault(key, {
+                'turns': 0, 'errors': 0, 'cold_loads': 0,
+                'avg_total_ms': None, 'avg_first_token_ms': None, 'avg_load_ms': None,
+                'eval_tokens_per_s': None, 'last_used': None,
+            })
+            stats['turns'] += 1
+            stats['cold_loads'] += load_ms > COLD_LOAD_MS
+            stats['last_used'] = time.time()
+            eval_ms, eval_count = timings.get('eval_ms'), timings.get('eval_count')
+            samples = {
+                'avg_total_ms': timings.get('total_ms'),
+                'avg_first_token_ms': timings.get('first_token_ms'),
+                'avg_load_ms': load_ms,
+                'eval_tokens_per_s': round(eval_count * 1000 / eval_ms, 1) if eval_ms and eval_count else None,
+            }
+            for name, value in samples.items():
+                if value is None:
+                    continue
+                # Moving average so the numbers follow the model's current state
+                previous = stats[name]
+                stats[name] = value if previous is None else round(0.8 * previous + 0.2 * value, 1)
+            # It is resident now; don't wait for the next check to notice
+            self._loaded.setdefault(key, {'name': model, 'size_vram': None, 'expires_at': None})
+
+    def record_error(self, model):
+        metrics.ollama_errors.inc(pid=metrics.pid(), model=model_key(model))
+        with self._lock:
+            stats = self._stats.get(model_key(model))
+            if stats is not None:
+                stats['errors'] += 1
+
+    def model_stats(self, model):
+        with self._lock:
+            return dict(self._stats.get(model_key(model), {}))
+
+    def snapshot(self):
+        """Residency and latency state for the stats endpoints."""
+        with self._lock:
+            loaded = {
+                key: {**entry, 'expires_in_s': round(entry['expires_at'] - time.time()) if entry['expires_at'] else None}
+                for key, entry in self._loaded.items()
+            }
+            return {
+                'preferred': self.preferred,
+                'keep_warm_interval': self.interval,
+                'keep_alive': self.keep_alive,
+                'loaded': loaded,
+                'checked_at': self._checked_at,
+                'pings': self.pings,
+                'last_error': self.last_error,
+                'models': {key: dict(stats) for key, stats in self._stats.items()},
+            }
+
+
+class ModelRouter:
+    """Chooses a model for requests sent with model "auto"."""
+
+    def __init__(self, residency, fast=FAST_MODEL, strong=STRONG_MODEL, enabled=ROUTING_ENABLED):
+        self.residency = residency
+        self.fast = fast
+        self.strong = strong
+        self.enabled = enabled
+
+    def route(self, message, kind=None):
+        """(model, decision) for a request; decision explains the choice."""
+        self.residency.start()
+        kind = kind or ('deck' if prompt_builder.is_full_deck(message) else 'edit')
+        if kind == 'deck':
+            # Quality matters more than a one-off cold load for a whole deck
+            model = self.strong
+            reason = 'whole deck: strong model'
+        else:
+            candidates = list(dict.fromkeys([self.fast, self.residency.preferred, self.strong]))
+            resident = [m for m in candidates if self.residency.is_loaded(m)]
+            model = resident[0] if resident else self.fast
+            if model == self.fast:
+                reason = 'edit: fast model'
+            else:
+                reason = f'edit: {model} is already loaded, {self.fast} is not'
+        return model, {
+            'requested': 'auto',
+            'model': model,
+            'kind': kind,
+            'reason': reason,
+            'resident': self.residency.is_loaded(model),
+            'avg_total_ms': self.residency.model_stats(model).get('avg_total_ms'),
+        }
+
+    def config(self):
+        return {'enabled': self.enabled, 'fast': self.fast, 'strong': self.strong,
+                'preferred': self.residency.preferred}
+
+
+# Shared per-process residency tracker and router
+residency = ModelResidency(ollama)
+router = ModelRouter(residency)
@@ -0,0 +1,190 @@
+"""
+Async Ollama access for the ASGI serving mode (see asgi.py).
+
+Mirrors ollama_client.py for an event loop: one pooled httpx.AsyncClient per
+process and an asyncio admission gate, so a waiting chat costs a coroutine
+instead of a worker thread. Endpoint discovery and health state are shared
+with the synchronous client.
+"""
+
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+from ollama_client import ollama, OllamaOverloaded, MAX_CONCURRENT, MAX_QUEUE, QUEUE_TIMEOUT
+
+# Connections per process; one process holds many waiting chats
+ASYNC_POOL_SIZE = int(os.environ.get('OLLAMA_ASYNC_POOL_SIZE', 64))
+
+
+class AsyncOllamaClient:
+    """Non-blocking counterpart of OllamaClient (one instance per process)."""
+
+    def __init__(self, pool_size=ASYNC_POOL_SIZE):
+        self.pool_size = pool_size
+        self._client = None
+        self._pid = None
+
+    @property
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(60, connect=5)
+            )
+            self._pid = os.getpid()
+        return self._client
+
+    async def base_url(self):
+        # The first discovery may block on a socket connect, so run it off the loop
+        return ollama.cached_base_url() or await asyncio.to_thread(ollama.base_url)
+
+    async def get(self, path, **kwargs):
+        return await self.client.get(f'{await self.base_url()}{path}', **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.client.post(f'{await self.base_url()}{path}', **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method, path, **kwargs):
+        async with self.client.stream(method, f'{await self.base_url()}{path}', **kwargs) as response:
+            yield response
+
+    async def probe(self, timeout=5):
+        """Async OllamaClient.probe(); updates the shared health state."""
+        try:
+            response = await self.get('/api/tags', timeout=timeout)
+            response.raise_for_status()
+            ollama.healthy, ollama.last_error = True, None
+        except httpx.HTTPError as e:
+            ollama.healthy, ollama.last_error = False, str(e)
+            ollama.invalidate()
+            raise
+        finally:
+            ollama.last_check = time.time()
+        return response
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class AsyncAdmissionGate:
+    """asyncio version of AdmissionGate with the same limits and counters."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = None
+        self._flights = {}
+        self.active = 0
+        self.waiting = 0
+        self.counters = {'admitted': 0, 'rejected': 0, 'timed_out': 0, 'coalesced': 0}
+        self._avg_hold = 10.0
+
+    @property
+    def cond(self):
+        # Created lazily so it binds to the serving loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def retry_after(self):
+        ahead = self.waiting + self.active
+        return max(1, math.ceil(self._avg_hold * ahead / self.max_concurrent))
+
+    async def acquire(self):
+        async with self.cond:
+            if self.active < self.max_concurrent and self.waiting == 0:
+                self.active += 1
+                self.counters['admitted'] += 1
+                return time.monotonic()
+
+            if self.waiting >= self.max_queue:
+                self.counters['rejected'] += 1
+                raise OllamaOverloaded('Ollama is busy - too many requests queued', self.retry_after())
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(
+                    self.cond.wait_for(lambda: self.active < self.max_concurrent),
+                    self.queue_timeout
+                )
+            except asyncio.TimeoutError:
+                self.counters['timed_out'] += 1
+                raise OllamaOverloaded('Ollama is busy - timed out waiting in queue', self.retry_after())
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.counters['admitted'] += 1
+            return time.monotonic()
+
+    async def release(self, acquired_at=None):
+        async with self.cond:
+            self.active -= 1
+            if acquired_at is not None:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - acquired_at)
+            self.cond.notify()
+
+    @asynccontextmanager
+    async def slot(self):
+        acquired_at = await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release(acquired_at)
+
+    async def run(self, key, fn):
+        """Await fn() in a slot, sharing the result with identical in-flight calls.
+
+        If the leader is cancelled (its client disconnected), followers don't
+        inherit the cancellation: the first to wake up runs fn() itself and
+        the rest follow it.
+        """
+        while (flight := self._flights.get(key)) is not None:
+            self.counters['coalesced'] += 1
+            try:
+                # Shield so one impatient follower can't cancel the shared call
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled() or asyncio.current_task().cancelling():
+                    raise  # this follower was cancelled itself
+
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            async with self.slot():
+                result = await fn()
+            flight.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            # Mark retrieved so an unshared failure isn't logged as never retrieved
+            flight.exception()
+            raise
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self):
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'queued': self.waiting,
+            'in_flight_keys': len(self._flights),
+            **self.counters,
+        }
+
+
+# Shared per-process async client and admission gate
+aollama = AsyncOllamaClient()
+agate = AsyncAdmissionGate()
@@ -0,0 +1,345 @@
+"""
+Ollama client for the HyFlux PPT Generator web application.
+
+Resolves the Ollama endpoint once and caches it with a TTL. The background
+health probe rediscovers it before the TTL runs out, and a stale value is
+served while a background refresh runs, so requests never wait on
+discovery after the first one. All Ollama traffic goes through one
+pooled keep-alive HTTP session per process. Generations pass through an
+admission gate that bounds concurrency, queues a limited number of waiters
+and coalesces identical in-flight requests.
+"""
+
+import math
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OLLAMA_PORT = 11434
+
+# Explicit endpoint (skips discovery), e.g. http://ollama:11434
+OLLAMA_URL = os.environ.get('OLLAMA_URL', '').rstrip('/')
+DISCOVERY_TTL = float(os.environ.get('OLLAMA_DISCOVERY_TTL', 300))
+HEALTH_INTERVAL = float(os.environ.get('OLLAMA_HEALTH_INTERVAL', 30))
+POOL_SIZE = int(os.environ.get('OLLAMA_POOL_SIZE', 16))
+
+# Admission control (per worker process)
+MAX_CONCURRENT = int(os.environ.get('OLLAMA_MAX_CONCURRENT', 1))
+MAX_QUEUE = int(os.environ.get('OLLAMA_MAX_QUEUE', 4))
+QUEUE_TIMEOUT = float(os.environ.get('OLLAMA_QUEUE_TIMEOUT', 20))
+
+
+def discover_ollama_base_url():
+    """Work out the Ollama base URL for this environment (uncached)."""
+    if OLLAMA_URL:
+        return OLLAMA_URL
+
+    # Check if we're in Docker
+    if os.path.exists('/.dockerenv'):
+        # Try multiple methods to reach host
+        # host.docker.internal works on Docker Desktop (Mac/Windows)
+        # On Linux, we might need to use the host's IP or gateway
+        try:
+            # Try host.docker.internal first (Docker Desktop)
+            test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            test_socket.settimeout(1)
+            result = test_socket.connect_ex(('host.docker.internal', OLLAMA_PORT))
+            test_socket.close()
+            if result == 0:
+                return f'http://host.docker.internal:{OLLAMA_PORT}'
+        except OSError:
+            pass
+
+        # Fallback: try gateway IP (Linux Docker)
+        try:
+            with open('/etc/hosts', 'r') as f:
+                for line in f:
+                    if 'gateway' in line.lower():
+                        gateway_ip = line.split()[0]
+                        return f'http://{gateway_ip}:{OLLAMA_PORT}'
+        except OSError:
+            pass
+
+        # Last resort: try host.docker.internal anyway
+        return f'http://host.docker.internal:{OLLAMA_PORT}'
+
+    # Not in Docker, use localhost
+    return f'http://localhost:{OLLAMA_PORT}'
+
+
+class OllamaOverloaded(Exception):
+    """Raised when the admission gate can't take another generation."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Flight:
+    """One upstream generation that identical requests can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class AdmissionGate:
+    """Bounded concurrency in front of Ollama with a wait queue and timeouts.
+
+    At most max_concurrent generations run at once; up to max_queue more
+    wait up to queue_timeout seconds for a slot. Anything beyond that is
+    rejected immediately with OllamaOverloaded so the caller can answer 429
+    instead of hanging until the upstream timeout.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._flights = {}
+        self.active = 0
+        self.waiting = 0
+        self.counters = {'admitted': 0, 'rejected': 0, 'timed_out': 0, 'coalesced': 0}
+        # Moving average of how long a generation holds its slot
+        self._avg_hold = 10.0
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up (for Retry-After)."""
+        ahead = self.waiting + self.active
+        return max(1, math.ceil(self._avg_hold * ahead / self.max_concurrent))
+
+    def acquire(self):
+        """Wait for a slot; raises OllamaOverloaded if the queue is full or times out."""
+        with self._cond:
+            if self.active < self.max_concurrent and self.waiting == 0:
+                self.active += 1
+                self.counters['admitted'] += 1
+                return time.monotonic()
+
+            if self.waiting >= self.max_queue:
+                self.counters['rejected'] += 1
+                raise OllamaOverloaded('Ollama is busy - too many requests queued', self.retry_after())
+
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timed_out'] += 1
+                        raise OllamaOverloaded('Ollama is busy - timed out waiting in queue', self.retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.counters['admitted'] += 1
+            return time.monotonic()
+
+    def release(self, acquired_at=None):
+        with self._cond:
+            self.active -= 1
+            if acquired_at is not None:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - acquired_at)
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        acquired_at = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    def run(self, key, fn):
+        """Run fn() in a slot, sharing the result with identical in-flight calls.
+
+        Callers passing the same key while a generation is running wait for
+        that generation instead of starting their own.
+        """
+        with self._cond:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.counters['coalesced'] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            with self.slot():
+                flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._cond:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'queued': self.waiting,
+                'in_flight_keys': len(self._flights),
+                **self.counters,
+            }
+
+
+class OllamaClient:
+    """Cached endpoint discovery plus a pooled keep-alive session.
+
+    State is per process: after a fork (gunicorn preload) the session and
+    probe thread are recreated lazily on first use in the child.
+    """
+
+    def __init__(self, ttl=DISCOVERY_TTL, health_interval=HEALTH_INTERVAL, pool_size=POOL_SIZE):
+        self.ttl = ttl
+        self.health_interval = health_interval
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._base_url = None
+        self._resolved_at = 0.0
+        self._refreshing = None  # pid running a background rediscovery
+        self.healthy = None
+        self.last_check = None
+        self.last_error = None
+
+    def _ensure_process(self):
+        """(Re)create per-process state: pooled session and health probe."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+            self._pid = os.getpid()
+            if self.health_interval > 0:
+                threading.Thread(target=self._probe_loop, name='ollama-health', daemon=True).start()
+
+    @property
+    def session(self):
+        self._ensure_process()
+        return self._session
+
+    def base_url(self):
+        """Return the cached Ollama base URL; only the first call discovers it inline."""
+        base = self.cached_base_url()
+        if base:
+            return base
+        with self._lock:
+            if not self._base_url:
+                self._base_url = discover_ollama_base_url()
+                self._resolved_at = time.monotonic()
+            return self._base_url
+
+    def cached_base_url(self):
+        """The cached base URL, None before the first discovery (never blocks).
+
+        Past the TTL the stale value is returned while a background thread
+        rediscovers the endpoint.
+        """
+        if self._base_url and time.monotonic() - self._resolved_at >= self.ttl:
+            self._refresh_in_background()
+        return self._base_url
+
+    def refresh(self):
+        """Rediscover the endpoint now and cache it."""
+        base = discover_ollama_base_url()
+        with self._lock:
+            self._base_url = base
+            self._resolved_at = time.monotonic()
+        return base
+
+    def _refresh_in_background(self):
+        pid = os.getpid()
+        with self._lock:
+            # Compare pids: a fork mid-refresh must not leave the child waiting on a missing thread
+            if self._refreshing == pid:
+                return
+            self._refreshing = pid
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = None
+
+        threading.Thread(target=run, name='ollama-discovery', daemon=True).start()
+
+    def invalidate(self):
+        """Mark the cached endpoint stale so it is rediscovered in the background."""
+        with self._lock:
+            self._resolved_at = 0.0
+
+    def probe(self, timeout=5):
+        """Check Ollama is answering; updates the cached health state."""
+        base = self.base_url()
+        try:
+            response = self.session.get(f'{base}/api/tags', timeout=timeout)
+            response.raise_for_status()
+            self.healthy, self.last_error = True, None
+        except requests.exceptions.RequestException as e:
+            self.healthy, self.last_error = False, str(e)
+            # The endpoint may have moved (e.g. Docker network change)
+            self.invalidate()
+            raise
+        finally:
+            self.last_check = time.time()
+        return response
+
+    def _probe_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.health_interval)
+            try:
+                # Rediscover here if the TTL would run out before the next probe
+                if time.monotonic() - self._resolved_at >= self.ttl - self.health_interval:
+                    self.refresh()
+                self.probe(timeout=2)
+            except requests.exceptions.RequestException:
+                pass
+
+    def status(self):
+        """Cached endpoint and health state (no network I/O)."""
+        return {
+            'ollama_url': self._base_url,
+            'healthy': self.healthy,
+            'last_check': self.last_check,
+            'last_error': self.last_error,
+        }
+
+    def get(self, path, **kwargs):
+        return self.session.get(f'{self.base_url()}{path}', **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.session.post(f'{self.base_url()}{path}', **kwargs)
+
+
+# Shared per-process client and admission gate
+ollama = OllamaClient()
+gate = AdmissionGate()
@@ -0,0 +1,347 @@
+"""
+CPU profiling for single requests and a low-overhead background sampler.
+
+Per-request profiling: an admin request to /api/generate, /api/validate or
+/api/chat sent with `X-Profile: 1` (or `?profile=1`) runs under cProfile
+while a stack sampler watches the request's thread. The JSON answer gets a
+`profile` object with the top functions by cumulative time, and two files
+are written to the profile directory:
+
+    <id>.txt         pstats summary (calls, tottime, cumtime per function)
+    <id>.collapsed   sampled stacks in the collapsed format read by
+                     flamegraph.pl, speedscope and inferno
+
+Background sampling: with HYFLUX_SAMPLER_HZ > 0 each worker samples the
+stacks of the threads currently serving a request a few times a second
+(sys._current_frames, no tracing, so it can stay on in production) and
+every HYFLUX_SAMPLER_DUMP_INTERVAL seconds writes the window's collapsed
+stacks to the profile directory and logs the hottest ones.
+
+Environment:
+    HYFLUX_PROFILE_DIR             where profiles are written (default: <cache>/profiles)
+    HYFLUX_PROFILE_KEEP            profile files kept, oldest removed first (default: 100)
+    HYFLUX_PROFILE_SAMPLE_MS       stack sampling period of a profiled request (default: 1)
+    HYFLUX_SAMPLER_HZ              background samples per second, 0 disables (default: 0)
+    HYFLUX_SAMPLER_DUMP_INTERVAL   seconds between background dumps (default: 300)
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+PROFILE_KEEP = int(os.environ.get('HYFLUX_PROFILE_KEEP', 100))
+PROFILE_SAMPLE_MS = float(os.environ.get('HYFLUX_PROFILE_SAMPLE_MS', 1))
+SAMPLER_HZ = float(os.environ.get('HYFLUX_SAMPLER_HZ', 0))
+SAMPLER_DUMP_INTERVAL = float(os.environ.get('HYFLUX_SAMPLER_DUMP_INTERVAL', 300))
+
+# Endpoints that honour X-Profile
+PROFILED_ENDPOINTS = ('/api/generate', '/api/validate', '/api/chat')
+
+# Functions listed in a request's inline summary
+SUMMARY_TOP = 25
+
+
+def wants_profile(headers, args=None):
+    return headers.get('X-Profile', '') == '1' or (args is not None and args.get('profile') == '1')
+
+
+def frame_label(code):
+    # ';' separates frames in the collapsed format
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+def collapse(frame):
+    """Root-first ';'-joined stack of a frame."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def format_collapsed(counts):
+    return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+
+class ProfileStore:
+    """Profile files in one directory, pruned to the newest `keep`."""
+
+    def __init__(self, directory, keep=PROFILE_KEEP):
+        self.directory = Path(directory)
+        self.keep = keep
+
+    def write(self, name, text):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / name
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(text)
+        os.replace(tmp, path)
+        self.prune()
+        return path
+
+    def prune(self):
+        files = sorted(self.list(), key=lambda f: f['modified'])
+        for f in files[:max(0, len(files) - self.keep)]:
+            try:
+                (self.directory / f['name']).unlink()
+            except FileNotFoundError:
+                pass
+
+    def list(self):
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        files = []
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(('.txt', '.collapsed')):
+                stat = entry.stat()
+                files.append({'name': entry.name, 'size': stat.st_size, 'modified': stat.st_mtime})
+        return sorted(files, key=lambda f: f['modified'], reverse=True)
+
+    def path(self, name):
+        """Path of a stored profile, or None for unknown names."""
+        if name != os.path.basename(name) or not name.endswith(('.txt', '.collapsed')):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+class StackSampler:
+    """Counts collapsed stacks of selected threads from a daemon thread."""
+
+    def __init__(self, interval, thread_ids):
+        self.interval = interval
+        self.thread_ids = thread_ids  # a set (may change while running) or a callable
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def sample(self):
+        targets = self.thread_ids() if callable(self.thread_ids) else self.thread_ids
+        if not targets:
+            return
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in targets:
+                self.counts[collapse(frame)] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+class RequestProfile:
+    """cProfile plus a stack sampler around one request on the current thread."""
+
+    def __init__(self, endpoint, sample_interval=PROFILE_SAMPLE_MS / 1000):
+        self.id = f"{time.strftime('%Y%m%d_%H%M%S')}_{endpoint.strip('/').replace('/', '_')}_{uuid.uuid4().hex[:6]}"
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(sample_interval, {threading.get_ident()})
+        self.wall_ms = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def stop(self):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.wall_ms = round((time.perf_counter() - self._started) * 1000, 1)
+
+    def summary(self, limit=None, sort='cumulative'):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def top_functions(self, limit=SUMMARY_TOP):
+        """[{function, calls, tottime_ms, cumtime_ms}] by cumulative time."""
+        stats = pstats.Stats(self.profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [
+            {
+                'function': f'{name} ({os.path.basename(filename)}:{line})',
+                'calls': calls,
+                'tottime_ms': round(tottime * 1000, 2),
+                'cumtime_ms': round(cumtime * 1000, 2),
+            }
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+        ]
+
+    def save(self, store):
+        """Write the summary and collapsed stacks; returns the report for the response."""
+        store.write(f'{self.id}.txt', self.summary())
+        store.write(f'{self.id}.collapsed', format_collapsed(self.sampler.counts))
+        return {
+            'id': self.id,
+            'wall_ms': self.wall_ms,
+            'samples': self.sampler.samples,
+            'top': self.top_functions(),
+            'files': {
+                'summary': f'/api/admin/profiles/{self.id}.txt',
+                'collapsed': f'/api/admin/profiles/{self.id}.collapsed',
+            },
+        }
+
+
+class BackgroundSampler:
+    """Always-on sampler over the threads serving requests (this process).
+
+    The sampling thread is started per process on first use, like the
+    retention sweeper, so preforked workers each run their own.
+    """
+
+    def __init__(self, store, hz=SAMPLER_HZ, dump_interval=SAMPLER_DUMP_INTERVAL):
+        self.store = store
+        self.hz = hz
+        self.dump_interval = dump_interval
+        self.active = set()  # thread ids currently inside a request
+        self._lock = threading.Lock()
+        self._pid = None
+        self._sampler = None
+        self._window_started = None
+        self.dumps = 0
+
+    @property
+    def enabled(self):
+        return self.hz > 0
+
+    def start(self):
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.active = set()
+            self._window_started = time.time()
+            self._sampler = StackSampler(1 / self.hz, lambda: self.active).start()
+            threading.Thread(target=self._dump_loop, name='sampler-dump', daemon=True).start()
+
+    def enter(self):
+        if self.enabled:
+            self.start()
+            self.active.add(threading.get_ident())
+
+    def exit(self):
+        self.active.discard(threading.get_ident())
+
+    def hottest(self, limit=10):
+        sampler = self._sampler
+        if sampler is None:
+            return []
+        return [{'stack': stack, 'samples': count} for stack, count in sampler.counts.most_common(limit)]
+
+    def dump(self):
+        """Write the current window's stacks and start a new window."""
+        sampler = self._sampler
+        if sampler is None:
+            return None
+        counts, sampler.counts = sampler.counts, Counter()
+        started, self._window_started = self._window_started, time.time()
+        if not counts:
+            return None
+        name = f"sampler_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.collapsed"
+        self.store.write(name, format_collapsed(counts))
+        self.dumps += 1
+        total = sum(counts.values())
+        print(f"Sampler: {total} samples over {round(time.time() - started)} s written to {name}")
+        for stack, count in counts.most_common(3):
+            print(f"  {count * 100 / total:5.1f}%  ... {' > '.join(stack.split(';')[-3:])}")
+        return name
+
+    def _dump_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.dump_interval)
+            try:
+                self.dump()
+            except OSError as e:
+                print(f"Sampler: dump failed: {e}")
+
+    def stats(self):
+        sampler = self._sampler
+        return {
+            'enabled': self.enabled,
+            'hz': self.hz,
+            'dump_interval': self.dump_interval,
+            'window_started': self._window_started,
+            'samples': sampler.samples if sampler else 0,
+            'dumps': self.dumps,
+            'hottest': self.hottest(5),
+        }
+
+
+def init_app(app, store, sampler):
+    """Profile admin requests that ask for it; track request threads for the sampler."""
+    from flask import g, jsonify, request
+
+    import admin
+
+    profile_lock = threading.Lock()
+
+    @app.before_request
+    def _start_profile():
+        sampler.enter()
+        if request.path not in PROFILED_ENDPOINTS or not wants_profile(request.headers, request.args):
+            return None
+        if not admin.is_admin():
+            return jsonify({'success': False, 'error': 'Profiling requires the admin token'}), 403
+        # One profiled request at a time per worker keeps the numbers readable
+        if not profile_lock.acquire(blocking=False):
+            g.profile_busy = True
+            return None
+        g.request_profile = RequestProfile(request.path).start()
+        return None
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            if g.pop('profile_busy', False):
+                response.headers['X-Profile'] = 'busy'
+            return response
+        try:
+            profile.stop()
+        finally:
+            profile_lock.release()
+        report = profile.save(store)
+        response.headers['X-Profile-Id'] = profile.id
+        payload = response.get_json(silent=True) if response.mimetype == 'application/json' else None
+        if isinstance(payload, dict):
+            payload['profile'] = report
+            response.set_data(json.dumps(payload))
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        sampler.exit()
+        # after_request is skipped if the response could not be built
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            profile.stop()
+            profile_lock.release()
@@ -0,0 +1,279 @@
+"""
+Relevance-trimmed, token-budgeted system prompts for the chat assistant.
+
+The prompt is assembled from the slide schema: a preamble with the rules
+every answer needs, one section per slide type (required fields, render
+notes, example), and general sections (field-name rules, normalization,
+a complete example, the checklist). Only the slide types a request is
+about are included, and lower-priority general sections are dropped until
+the prompt fits the model's token budget.
+
+A session keeps the system prompt it started with, so the model can keep
+reusing its evaluated prefix. A later turn that touches a slide type the
+session's prompt doesn't cover carries just that type's section in the user
+message.
+"""
+
+import hashlib
+import os
+import re
+
+from slide_schema import VALID_SLIDE_TYPES, REQUIRED_FIELDS, FIELD_ORDER
+
+# Token budget for the system prompt, per model name (prefix match) and default
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('HYFLUX_PROMPT_BUDGET', 2000))
+MODEL_TOKEN_BUDGETS = {
+    name.strip(): int(budget)
+    for name, _, budget in (
+        item.partition('=') for item in os.environ.get('HYFLUX_PROMPT_BUDGETS', '').split(',') if '=' in item
+    )
+}
+
+# Rough tokens-per-character ratio for English prose and YAML (no tokenizer needed)
+CHARS_PER_TOKEN = 3.6
+
+# Sections are joined with this, so a prompt can be split back into sections
+SECTION_SEPARATOR = '\n\n\n'
+
+SLIDE_TYPE_ORDER = ('title_white', 'divider', 'text_only', 'two_column',
+                    'three_column', 'quote', 'title_only', 'end_slide')
+
+PREAMBLE = f"""You are an AI assistant helping users create PowerPoint presentations using YAML specifications for the HyFlux template.
+
+You must follow STRICT YAML→PPT validation rules. Your output will be validated against these rules:
+
+STRICT VALIDATION RULES (render-safe):
+1. Top-level keys MUST be exactly: 'presentation' and 'slides' (nothing else)
+2. Slides must be under 'slides:' and indented with 2 spaces (NO TABS)
+3. Supported slide types ONLY: {', '.join(SLIDE_TYPE_ORDER)}
+4. Each slide has exactly the fields listed for its type
+5. Block scalars (|) must have correctly indented content (2+ spaces)
+6. All YAML must be valid and parseable
+
+CRITICAL YAML REQUIREMENTS:
+1. Output ONLY a SINGLE YAML document - NO document separators (---)
+2. Always start with 'presentation:' section at the top with title, author, date
+3. Use proper indentation (2 spaces, no tabs)
+4. Use double quotes for strings with special characters
+5. Put the YAML in a ```yaml code block"""
+
+TYPE_NOTES = {
+    'title_white': 'Title slide',
+    'divider': 'Section divider slide. Title-only, no content field.',
+    'text_only': 'Text content slide. Content is a multi-line string (|) of bullets.',
+    'two_column': "Two-column layout. Use 'left_content'/'right_content', NOT nested content.left/right.",
+    'three_column': "Three-column layout. Use 'left_content', 'middle_content', 'right_content'.",
+    'quote': 'Quote slide',
+    'title_only': 'Title only (for charts/images). Should not be used for body text; use text_only for content.',
+    'end_slide': ("Closing slide. Template-only: text in 'content' or 'contact' will NOT render. "
+                  "Use 'title' ONLY."),
+}
+
+TYPE_EXAMPLES = {
+    'title_white': '''- type: title_white
+  title: "Main Title"
+  subtitle: "Subtitle text (can include \\\\n for line breaks)"''',
+    'divider': '''- type: divider
+  title: "Section Name"''',
+    'text_only': '''- type: text_only
+  title: "Slide Title"
+  content: |
+    • Bullet point 1
+    • Bullet point 2
+    • Section label: (headings must be bullets)
+    • More content''',
+    'two_column': '''- type: two_column
+  title: "Slide Title"
+  left_content: |
+    • Item 1
+    • Item 2
+  right_content: |
+    • Item 1
+    • Item 2''',
+    'three_column': '''- type: three_column
+  title: "Slide Title"
+  left_content: |
+    • Item 1
+  middle_content: |
+    • Item 1
+  right_content: |
+    • Item 1''',
+    'quote': '''- type: quote
+  quote: "The quote text here"
+  attribution: "Author Name"''',
+    'title_only': '''- type: title_only
+  title: "Chart Title"''',
+    'end_slide': '''- type: end_slide
+  title: "Thank You"''',
+}
+
+# Words in a request that point at a slide type
+TYPE_KEYWORDS = {
+    'title_white': ('title slide', 'cover', 'opening slide', 'subtitle'),
+    'divider': ('divider', 'section'),
+    'text_only': ('text slide', 'bullet', 'agenda'),
+    'two_column': ('two column', 'two-column', '2 column', '2-column', 'compare', 'comparison', 'versus', ' vs'),
+    'three_column': ('three column', 'three-column', '3 column', '3-column'),
+    'quote': ('quote', 'testimonial', 'attribution'),
+    'title_only': ('title only', 'title-only', 'chart', 'image', 'picture'),
+    'end_slide': ('end slide', 'closing', 'thank you', 'final slide', 'last slide'),
+}
+
+# Requests for a whole new deck need every type; edits to one only need what they touch
+FULL_DECK_RE = re.compile(r'\b(presentation|deck)\b|\b\d+[\s-]*slides?\b')
+EDIT_RE = re.compile(r'\b(add|change|edit|fix|insert|remove|replace|rewrite|turn|update)\b')
+TYPE_FIELD_RE = re.compile(r'type:\s*["\']?(\w+)')
+
+
+def type_section(slide_type):
+    fields = sorted(REQUIRED_FIELDS[slide_type], key=FIELD_ORDER.index)
+    return (
+        f"{slide_type.upper()} slides (type: {slide_type}): MUST have {', '.join(repr(f) for f in fields)}"
+        f"{' only' if len(fields) == 1 else ''}. {TYPE_NOTES[slide_type]}\n"
+        f"```yaml\n{TYPE_EXAMPLES[slide_type]}\n```"
+    )
+
+
+FIELD_RULES = """CRITICAL FIELD NAME RULES:
+- Always use the exact field names shown above
+- Do NOT use nested content structures like content.left/right
+- Use multi-line strings (|) for content that spans multiple lines
+- Use 2 spaces for indentation (NO TABS)"""
+
+NORMALIZATION_RULES = """CONTENT NORMALIZATION RULES (applied automatically before PPT generation):
+1. Every bullet line MUST start with • (convert -, *, numbered lists to •)
+2. No headings without bullets inside text_only - convert headings to bullets (e.g. "Core pack:" → "• Core pack:")
+3. No blank lines inside bullet blocks (blank lines break bullet formatting)
+4. Section labels MUST be written as bullet text (e.g. "• Core pack:" not "Core pack:")
+5. No reliance on formatting semantics the renderer doesn't support"""
+
+FULL_EXAMPLE = """COMPLETE WORKING EXAMPLE:
+```yaml
+presentation:
+  title: "Presentation Title"
+  author: "Author Name"
+  date: "2025-12-25"
+
+slides:
+  - type: title_white
+    title: "Main Title"
+    subtitle: "Subtitle here"
+
+  - type: divider
+    title: "Section 1"
+
+  - type: text_only
+    title: "Agenda"
+    content: |
+      • First item
+      • Second item
+
+  - type: two_column
+    title: "Two Column Slide"
+    left_content: |
+      • Point 1
+    right_content: |
+      • Point 1
+
+  - type: end_slide
+    title: "Thank You"
+```"""
+
+CHECKLIST = """VALIDATION CHECKLIST BEFORE OUTPUTTING:
+✓ Top-level has only 'presentation' and 'slides'
+✓ All slides have correct 'type' from supported list
+✓ Each slide has ALL required fields for its type and no others
+✓ All bullet points start with • (not -, *, or numbers)
+✓ No headings without bullets in text content
+✓ No blank lines inside bullet blocks
+✓ Section labels are bullet text (e.g. • Section:)
+✓ Indentation uses 2 spaces (no tabs)
+✓ Block scalars are properly indented
+✓ YAML is valid and parseable"""
+
+# General sections in the order they are dropped to meet the budget (last first)
+GENERAL_SECTIONS = (
+    ('field_rules', FIELD_RULES),
+    ('normalization', NORMALIZATION_RULES),
+    ('full_example', FULL_EXAMPLE),
+    ('checklist', CHECKLIST),
+)
+
+TYPE_SECTIONS = {slide_type: type_section(slide_type) for slide_type in SLIDE_TYPE_ORDER}
+assert set(TYPE_SECTIONS) == VALID_SLIDE_TYPES
+
+ALL_SECTIONS = frozenset([PREAMBLE, *TYPE_SECTIONS.values(), *(text for _, text in GENERAL_SECTIONS)])
+
+# Changes whenever any section changes, so stale cached answers are never served
+PROMPT_VERSION = hashlib.sha256(SECTION_SEPARATOR.join(sorted(ALL_SECTIONS)).encode('utf-8')).hexdigest()[:12]
+
+
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def token_budget(model):
+    """Budget for a model: the longest configured name prefix, else the default."""
+    matches = [name for name in MODEL_TOKEN_BUDGETS if model.startswith(name)]
+    return MODEL_TOKEN_BUDGETS[max(matches, key=len)] if matches else DEFAULT_TOKEN_BUDGET
+
+
+def is_full_deck(message):
+    """Whether a request asks for a whole new deck rather than an edit."""
+    text = message.lower()
+    return bool(FULL_DECK_RE.search(text)) and not EDIT_RE.search(text)
+
+
+def relevant_types(message):
+    """Slide types a request is about; every type for whole-deck requests."""
+    text = message.lower()
+    types = {t for t in TYPE_FIELD_RE.findall(text) if t in VALID_SLIDE_TYPES}
+    types |= {t for t, words in TYPE_KEYWORDS.items() if t in text or any(w in text for w in words)}
+    if not types or is_full_deck(message):
+        return set(VALID_SLIDE_TYPES)
+    return types
+
+
+def build_system_prompt(message, model):
+    """(system prompt, report) trimmed to the request and the model's budget."""
+    types = [t for t in SLIDE_TYPE_ORDER if t in relevant_types(message)]
+    budget = token_budget(model)
+    required = [PREAMBLE] + [TYPE_SECTIONS[t] for t in types]
+    general = list(GENERAL_SECTIONS)
+    if len(types) < len(SLIDE_TYPE_ORDER):
+        # The complete example only helps when building a whole deck
+        general = [(name, text) for name, text in general if name != 'full_example']
+
+    dropped = []
+    while True:
+        prompt = SECTION_SEPARATOR.join(required + [text for _, text in general])
+        tokens = estimate_tokens(prompt)
+        if tokens <= budget or not general:
+            break
+        dropped.append(general.pop()[0])
+
+    return prompt, {
+        'types': types,
+        'sections': [name for name, _ in general],
+        'dropped': dropped,
+        'estimated_tokens': tokens,
+        'budget': budget,
+        'over_budget': tokens > budget,
+    }
+
+
+def is_current(system):
+    """Whether a session's system prompt was built from the current sections."""
+    return all(section in ALL_SECTIONS for section in system.split(SECTION_SEPARATOR))
+
+
+def followup_message(system, history, message):
+    """The user message for a later turn, with sections the session still lacks."""
+    covered = system + ''.join(turn['content'] for turn in history if turn['role'] == 'user')
+    missing = [
+        TYPE_SECTIONS[t] for t in SLIDE_TYPE_ORDER
+        if t in relevant_types(message) and TYPE_SECTIONS[t] not in covered
+    ]
+    if not missing or len(missing) == len(SLIDE_TYPE_ORDER):
+        return message
+    return 'Slide rules for this request:\n\n' + '\n\n'.join(missing) + '\n\n---\n\n' + message
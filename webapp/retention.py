@@ -0,0 +1,224 @@
+"""
+Retention policy for generated decks and uploads.
+
+Every Generate click writes another deck to /app/output and nothing used to
+delete them, so the volume grew without bound. The sweeper enforces, in
+order:
+
+1. max age: files created more than `max_age` seconds ago are removed
+2. keep-last-N per title: only the newest `keep_per_title` decks generated
+   for the same presentation title are kept
+3. max total bytes: while the managed directories hold more than
+   `max_bytes`, the least recently used file goes first
+
+"Used" means downloaded: the download route stamps the file's access time,
+so LRU order follows the last download (or creation, if never downloaded).
+Files younger than `min_age` are never removed, so a fresh deck survives
+until the user has had a chance to download it.
+
+The sweeper runs in a background thread per worker; a lock file makes sure
+only one process sweeps at a time.
+
+Environment:
+    HYFLUX_RETENTION_MAX_AGE         seconds, 0 disables (default: 7 days)
+    HYFLUX_RETENTION_MAX_BYTES       bytes across managed dirs, 0 disables (default: 2 GiB)
+    HYFLUX_RETENTION_KEEP_PER_TITLE  decks kept per title, 0 disables (default: 5)
+    HYFLUX_RETENTION_MIN_AGE         seconds a new file is protected (default: 600)
+    HYFLUX_RETENTION_INTERVAL        seconds between sweeps, 0 disables the sweeper (default: 300)
+"""
+
+import fcntl
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+MAX_AGE = float(os.environ.get('HYFLUX_RETENTION_MAX_AGE', 7 * 24 * 3600))
+MAX_BYTES = int(os.environ.get('HYFLUX_RETENTION_MAX_BYTES', 2 * 1024 ** 3))
+KEEP_PER_TITLE = int(os.environ.get('HYFLUX_RETENTION_KEEP_PER_TITLE', 5))
+MIN_AGE = float(os.environ.get('HYFLUX_RETENTION_MIN_AGE', 600))
+SWEEP_INTERVAL = float(os.environ.get('HYFLUX_RETENTION_INTERVAL', 300))
+
+# Generated decks are named "<YYYYmmdd_HHMMSS>_<title>.pptx"
+DECK_NAME_RE = re.compile(r'^\d{8}_\d{6}_(?P<title>.*)\.pptx$')
+
+
+class RetentionPolicy:
+    """Sweeps managed directories down to the configured limits."""
+
+    def __init__(self, directories, lock_path, max_age=MAX_AGE, max_bytes=MAX_BYTES,
+                 keep_per_title=KEEP_PER_TITLE, min_age=MIN_AGE, interval=SWEEP_INTERVAL):
+        self.directories = [Path(d) for d in directories]
+        self.lock_path = Path(lock_path)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.keep_per_title = keep_per_title
+        self.min_age = min_age
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self.counters = {'sweeps': 0, 'skipped_locked': 0, 'errors': 0}
+        self.evicted = {'age': 0, 'per_title': 0, 'bytes': 0}
+        self.evicted_bytes = 0
+        self.last_sweep = None
+
+    def start(self):
+        """Start the sweeper thread for this process (idempotent)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if self.interval > 0:
+                threading.Thread(target=self._sweep_loop, name='retention-sweeper', daemon=True).start()
+
+    def notify(self):
+        """Ask the sweeper to run soon (e.g. after writing a new deck)."""
+        self._wake.set()
+
+    @staticmethod
+    def touch(path):
+        """Record a download: stamp the access time, keep the modification time."""
+        try:
+            stat = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            pass
+
+    def _files(self):
+        files = []
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                        match = DECK_NAME_RE.match(entry.name)
+                        files.append({
+                            'path': entry.path,
+                            'size': stat.st_size,
+                            'created': stat.st_mtime,
+                            'last_used': max(stat.st_atime, stat.st_mtime),
+                            'title': (str(directory), match.group('title')) if match else None,
+                        })
+            except FileNotFoundError:
+                continue
+        return files
+
+    def usage(self):
+        """Files and bytes per managed directory."""
+        usage = {}
+        for directory in self.directories:
+            files = total = 0
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            files += 1
+                            total += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                pass
+            usage[str(directory)] = {'files': files, 'bytes': total}
+        return usage
+
+    def plan(self, files, now=None):
+        """[(file, reason)] to evict; files younger than min_age are never picked."""
+        now = now or time.time()
+        evictable = [f for f in files if now - f['created'] >= self.min_age]
+        doomed = {}
+
+        if self.max_age > 0:
+            for f in evictable:
+                if now - f['created'] > self.max_age:
+                    doomed[f['path']] = (f, 'age')
+
+        if self.keep_per_title > 0:
+            by_title = {}
+            for f in files:
+                if f['title'] is not None and f['path'] not in doomed:
+                    by_title.setdefault(f['title'], []).append(f)
+            for group in by_title.values():
+                group.sort(key=lambda f: f['created'], reverse=True)
+                for f in group[self.keep_per_title:]:
+                    if now - f['created'] >= self.min_age:
+                        doomed[f['path']] = (f, 'per_title')
+
+        if self.max_bytes > 0:
+            total = sum(f['size'] for f in files if f['path'] not in doomed)
+            for f in sorted(evictable, key=lambda f: f['last_used']):
+                if total <= self.max_bytes:
+                    break
+                if f['path'] not in doomed:
+                    doomed[f['path']] = (f, 'bytes')
+                    total -= f['size']
+
+        return list(doomed.values())
+
+    def sweep(self):
+        """Run one sweep if no other process is; returns the evictions made."""
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.counters['skipped_locked'] += 1
+                return []
+            try:
+                started = time.perf_counter()
+                evicted = []
+                for f, reason in self.plan(self._files()):
+                    try:
+                        os.unlink(f['path'])
+                    except FileNotFoundError:
+                        continue
+                    except OSError:
+                        self.counters['errors'] += 1
+                        continue
+                    with self._lock:
+                        self.evicted[reason] += 1
+                        self.evicted_bytes += f['size']
+                    evicted.append((f['path'], reason))
+                with self._lock:
+                    self.counters['sweeps'] += 1
+                    self.last_sweep = {
+                        'at': time.time(),
+                        'ms': round((time.perf_counter() - started) * 1000, 1),
+                        'evicted': len(evicted),
+                    }
+                if evicted:
+                    print(f"Retention: removed {len(evicted)} files "
+                          f"({', '.join(sorted({reason for _, reason in evicted}))})")
+                return evicted
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sweep_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                self.sweep()
+            except OSError:
+                self.counters['errors'] += 1
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'policy': {
+                    'max_age': self.max_age,
+                    'max_bytes': self.max_bytes,
+                    'keep_per_title': self.keep_per_title,
+                    'min_age': self.min_age,
+                    'interval': self.interval,
+                },
+                'usage': self.usage(),
+                'evicted': dict(self.evicted),  # this worker only
+                'evicted_bytes': self.evicted_bytes,
+                'last_sweep': self.last_sweep,
+                **self.counters,
+            }
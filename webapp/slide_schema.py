@@ -0,0 +1,307 @@
+"""
+Slide-spec schema shared by strict validation, YAML repair and structured
+output.
+
+The same per-type field tables drive validate_yaml_strict and the JSON
+schema handed to Ollama's `format` parameter, so a constrained response can
+only contain slide types and fields the renderer supports. Importing this
+module has no side effects, so command-line tools can validate specs
+without loading the web app.
+"""
+
+import re
+import threading
+
+import yaml
+
+# Line number in a PyYAML error message
+LINE_NUMBER_RE = re.compile(r'line (\d+)')
+
+# Slide schema used by strict validation
+VALID_SLIDE_TYPES = frozenset({
+    'title_white', 'divider', 'text_only', 'two_column',
+    'three_column', 'quote', 'title_only', 'end_slide'
+})
+
+# Required fields per type
+REQUIRED_FIELDS = {
+    'title_white': {'title', 'subtitle'},
+    'divider': {'title'},
+    'text_only': {'title', 'content'},
+    'two_column': {'title', 'left_content', 'right_content'},
+    'three_column': {'title', 'left_content', 'middle_content', 'right_content'},
+    'quote': {'quote', 'attribution'},
+    'title_only': {'title'},
+    'end_slide': {'title'}  # end_slide MUST have title only
+}
+
+# Allowed fields per type (required + optional)
+ALLOWED_FIELDS = {
+    'title_white': {'type', 'title', 'subtitle'},
+    'divider': {'type', 'title'},
+    'text_only': {'type', 'title', 'content'},
+    'two_column': {'type', 'title', 'left_content', 'right_content'},
+    'three_column': {'type', 'title', 'left_content', 'middle_content', 'right_content'},
+    'quote': {'type', 'quote', 'attribution'},
+    'title_only': {'type', 'title'},
+    'end_slide': {'type', 'title'}  # end_slide: title ONLY, no content/contact
+}
+
+# Field order used when writing a spec back out as YAML
+FIELD_ORDER = ('type', 'title', 'subtitle', 'content', 'left_content', 'middle_content',
+               'right_content', 'quote', 'attribution')
+
+
+def slide_json_schema(slide_type):
+    """JSON schema for one slide of the given type (required fields only)."""
+    fields = sorted(REQUIRED_FIELDS[slide_type], key=FIELD_ORDER.index)
+    return {
+        'type': 'object',
+        'properties': {
+            'type': {'type': 'string', 'enum': [slide_type]},
+            **{field: {'type': 'string'} for field in fields},
+        },
+        'required': ['type', *fields],
+        'additionalProperties': False,
+    }
+
+
+def spec_json_schema():
+    """JSON schema for a whole spec, for Ollama's structured output `format`."""
+    return {
+        'type': 'object',
+        'properties': {
+            'presentation': {
+                'type': 'object',
+                'properties': {
+                    'title': {'type': 'string'},
+                    'author': {'type': 'string'},
+                    'date': {'type': 'string'},
+                },
+                'required': ['title', 'author', 'date'],
+                'additionalProperties': False,
+            },
+            'slides': {
+                'type': 'array',
+                'minItems': 1,
+                'items': {'anyOf': [slide_json_schema(t) for t in sorted(VALID_SLIDE_TYPES)]},
+            },
+        },
+        'required': ['presentation', 'slides'],
+        'additionalProperties': False,
+    }
+
+
+def validate_yaml_strict(yaml_content):
+    """Strict YAML→PPT validation according to HyFlux render-safe rules."""
+    errors = []
+    warnings = []
+    lines = yaml_content.split('\n')
+    patch_suggestions = []
+    
+    try:
+        spec = yaml.safe_load(yaml_content)
+        
+        # Check top-level keys
+        if not isinstance(spec, dict):
+            errors.append("Line 1: YAML must be a dictionary/object")
+            return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
+        
+        top_level_keys = set(spec.keys())
+        required_keys = {'presentation', 'slides'}
+        if not required_keys.issubset(top_level_keys):
+            missing = required_keys - top_level_keys
+            errors.append(f"Line 1: Missing required top-level keys: {', '.join(missing)}")
+        if len(top_level_keys) > len(required_keys):
+            extra = top_level_keys - required_keys
+            errors.append(f"Line 1: Unexpected top-level keys: {', '.join(extra)}. Must be exactly 'presentation' and 'slides'.")
+        
+        # Check presentation section
+        if 'presentation' in spec:
+            if not isinstance(spec['presentation'], dict):
+                errors.append("Line 2: 'presentation' must be a dictionary")
+        
+        # Check slides
+        if 'slides' not in spec:
+            errors.append("Missing 'slides' section")
+            return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
+        
+        if not isinstance(spec['slides'], list):
+            errors.append("'slides' must be a list")
+            return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
+        
+        # Validate each slide
+        for i, slide in enumerate(spec['slides']):
+            slide_num = i + 1
+            line_num = None
+            
+            # Find line number for this slide
+            for line_idx, line in enumerate(lines, 1):
+                if f'- type: {slide.get("type", "")}' in line:
+                    line_num = line_idx
+                    break
+                elif line.strip().startswith('-') and i == 0:
+                    line_num = line_idx
+                    break
+            
+            if not isinstance(slide, dict):
+                errors.append(f"Slide {slide_num} (line ~{line_num or '?'}): must be an object")
+                continue
+            
+            slide_type = slide.get('type', '')
+            if not slide_type:
+                errors.append(f"Slide {slide_num} (line ~{line_num or '?'}): missing 'type' field")
+                continue
+            
+            if slide_type not in VALID_SLIDE_TYPES:
+                errors.append(f"Slide {slide_num} (line ~{line_num or '?'}): invalid type '{slide_type}'. Must be one of: {', '.join(sorted(VALID_SLIDE_TYPES))}")
+                continue
+            
+            # Check required fields
+            required = REQUIRED_FIELDS.get(slide_type, set())
+            slide_keys = set(slide.keys())
+            missing = required - slide_keys
+            if missing:
+                errors.append(f"Slide {slide_num} (type: {slide_type}, line ~{line_num or '?'}): missing required fields: {', '.join(missing)}")
+            
+            # Check for forbidden fields (render-blocking)
+            allowed = ALLOWED_FIELDS.get(slide_type, set())
+            forbidden = slide_keys - allowed
+            
+            # Special handling for end_slide and title_only
+            if slide_type == 'end_slide':
+                if 'content' in slide or 'contact' in slide:
+                    errors.append(f"Slide {slide_num} (end_slide, line ~{line_num or '?'}): MUST NOT contain 'content' or 'contact' - text will not render. Use 'title' only.")
+                    patch_suggestions.append(f"Slide {slide_num}: Remove 'content'/'contact' from end_slide (only 'title' renders)")
+            
+            if slide_type == 'title_only':
+                if 'content' in slide:
+                    warnings.append(f"Slide {slide_num} (title_only, line ~{line_num or '?'}): 'content' field present but will not render. title_only is for title only.")
+                    patch_suggestions.append(f"Slide {slide_num}: Remove 'content' from title_only or change to text_only")
+            
+            if slide_type == 'divider':
+                if 'content' in slide:
+                    warnings.append(f"Slide {slide_num} (divider, line ~{line_num or '?'}): 'content' field present but divider is title-only.")
+                    patch_suggestions.append(f"Slide {slide_num}: Remove 'content' from divider or change to text_only")
+            
+            # Check for other unexpected fields
+            if forbidden:
+                # Filter out the special cases we already handled
+                forbidden_filtered = forbidden - {'content', 'contact'}
+                if forbidden_filtered:
+                    warnings.append(f"Slide {slide_num} (type: {slide_type}, line ~{line_num or '?'}): unexpected fields (may not render): {', '.join(forbidden_filtered)}")
+        
+        # Check indentation (tabs are errors)
+        for line_idx, line in enumerate(lines, 1):
+            if '\t' in line:
+                errors.append(f"Line {line_idx}: Tabs detected. Use 2 spaces for indentation.")
+        
+        # Check block scalar indentation
+        in_block_scalar = False
+        scalar_start_line = None
+        for line_idx, line in enumerate(lines, 1):
+            if '|' in line and ':' in line:
+                in_block_scalar = True
+                scalar_start_line = line_idx
+                continue
+            if in_block_scalar:
+                if line.strip() and ':' in line and not line.strip().startswith('-') and not line.startswith(' '):
+                    in_block_scalar = False
+                elif in_block_scalar and line.strip():
+                    # Check if content is properly indented (at least 2 spaces after the key)
+                    if not (line.startswith('      ') or line.startswith('        ') or not line.strip()):
+                        if line.startswith('    ') and ':' in lines[scalar_start_line-1]:
+                            # This might be okay if it's the first content line
+                            pass
+                        else:
+                            warnings.append(f"Line {line_idx}: Block scalar content may have incorrect indentation (should be 2+ spaces)")
+        
+        # Generate minimal patch if there are errors
+        patch = ""
+        if errors:
+            patch = "Minimal patch suggestions:\n"
+            for suggestion in patch_suggestions:
+                patch += f"  - {suggestion}\n"
+            if not patch_suggestions:
+                patch += "  - Fix the errors listed above\n"
+        
+        valid = len(errors) == 0
+        return {
+            'valid': valid,
+            'errors': errors,
+            'warnings': warnings,
+            'slide_count': len(spec.get('slides', [])),
+            'patch': patch
+        }
+        
+    except yaml.YAMLError as e:
+        # Try to extract line number from error
+        error_str = str(e)
+        line_match = LINE_NUMBER_RE.search(error_str)
+        line_num = line_match.group(1) if line_match else '?'
+        errors.append(f"Line {line_num}: Invalid YAML syntax - {error_str}")
+        return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
+    except Exception as e:
+        errors.append(f"Validation error: {str(e)}")
+        return {'errors': errors, 'warnings': warnings, 'valid': False, 'patch': ''}
+
+
+class _SpecDumper(yaml.SafeDumper):
+    def increase_indent(self, flow=False, indentless=False):
+        # Indent list items under their key ("slides:\n  - type: ...")
+        return super().increase_indent(flow, False)
+
+
+def _represent_str(dumper, value):
+    # Multi-line text (bullet blocks) as | block scalars, like hand-written specs
+    style = '|' if '\n' in value else None
+    return dumper.represent_scalar('tag:yaml.org,2002:str', value, style=style)
+
+
+_SpecDumper.add_representer(str, _represent_str)
+
+
+def _block_text(value):
+    value = '\n'.join(line.rstrip() for line in value.rstrip().split('\n'))
+    return value + '\n' if '\n' in value else value
+
+
+def spec_to_yaml(spec):
+    """Editor YAML for a decoded spec dict."""
+    slides = []
+    for slide in spec.get('slides', []):
+        if isinstance(slide, dict):
+            # Trailing whitespace would force a quoted scalar instead of a block;
+            # multi-line text keeps one final newline, as a hand-written | block has
+            slide = {key: _block_text(value) if isinstance(value, str) else value for key, value in slide.items()}
+            order = {field: i for i, field in enumerate(FIELD_ORDER)}
+            slide = dict(sorted(slide.items(), key=lambda item: order.get(item[0], len(order))))
+        slides.append(slide)
+    doc = {'presentation': spec.get('presentation', {}), 'slides': slides}
+    return yaml.dump(doc, Dumper=_SpecDumper, default_flow_style=False, sort_keys=False,
+                     allow_unicode=True, width=1000)
+
+
+class ValidityStats:
+    """First-try validity of generated specs, per output mode (this process).
+
+    A spec counts as valid on the first try when the model's own answer
+    passed strict validation without another round trip.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode, valid):
+        with self._lock:
+            counts = self._modes.setdefault(mode, {'specs': 0, 'valid': 0})
+            counts['specs'] += 1
+            counts['valid'] += bool(valid)
+
+    def stats(self):
+        with self._lock:
+            return {
+                mode: {**counts, 'first_try_valid_rate': round(counts['valid'] / counts['specs'], 4)}
+                for mode, counts in self._modes.items()
+            }
@@ -0,0 +1,212 @@
+"""
+Indexed library of saved YAML specs.
+
+Listing saved specs used to glob /app/input and stat every file on each
+page load. The library keeps an SQLite index instead (file name, size,
+mtime, presentation title, slide count and content hash), so a listing is
+one indexed query, paginated, sorted and filtered in SQL.
+
+The index is refreshed incrementally: saves update their own row, and the
+directory is rescanned only when its mtime changes (a file was added,
+removed or renamed) or every `rescan_interval` seconds to pick up edits made
+outside the app. A rescan only re-reads files whose size or mtime changed.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SpecLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as SpecLoader
+
+RESCAN_INTERVAL = float(os.environ.get('HYFLUX_LIBRARY_RESCAN', 60))
+
+SPEC_SUFFIXES = ('.yaml', '.yml')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS specs (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    title TEXT,
+    slide_count INTEGER,
+    sha256 TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS specs_mtime ON specs (mtime_ns);
+CREATE INDEX IF NOT EXISTS specs_title ON specs (title COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# API sort names -> indexed columns
+SORT_COLUMNS = {
+    'modified': 'mtime_ns',
+    'name': 'filename COLLATE NOCASE',
+    'title': 'title COLLATE NOCASE',
+    'size': 'size',
+    'slides': 'slide_count',
+}
+
+
+def read_spec_summary(path):
+    """(size, mtime_ns, title, slide_count, sha256) for one spec file."""
+    stat = path.stat()
+    data = path.read_bytes()
+    title, slide_count = None, None
+    try:
+        spec = yaml.load(data, Loader=SpecLoader)
+    except yaml.YAMLError:
+        spec = None
+    if isinstance(spec, dict):
+        presentation = spec.get('presentation')
+        if isinstance(presentation, dict) and presentation.get('title') is not None:
+            title = str(presentation['title'])
+        if isinstance(spec.get('slides'), list):
+            slide_count = len(spec['slides'])
+    return stat.st_size, stat.st_mtime_ns, title, slide_count, hashlib.sha256(data).hexdigest()
+
+
+class SpecLibrary:
+    """SQLite index over the saved-spec directory."""
+
+    def __init__(self, root, index_path, exclude=(), rescan_interval=RESCAN_INTERVAL):
+        self.root = Path(root)
+        self.index_path = Path(index_path)
+        self.exclude = set(exclude)
+        self.rescan_interval = rescan_interval
+        self._local = threading.local()
+        self._scan_lock = threading.Lock()
+        self._checked_at = 0.0
+
+    def _db(self):
+        """One connection per thread (and per process after fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.index_path), timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _is_spec(self, name):
+        return name.endswith(SPEC_SUFFIXES) and name not in self.exclude
+
+    def _meta(self, key):
+        row = self._db().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._db().execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def update(self, filename):
+        """Index (or re-index) one file, e.g. right after it was saved."""
+        path = self.root / filename
+        if not self._is_spec(filename) or not path.is_file():
+            return self.remove(filename)
+        size, mtime_ns, title, slide_count, sha256 = read_spec_summary(path)
+        self._db().execute(
+            'INSERT OR REPLACE INTO specs (filename, size, mtime_ns, title, slide_count, sha256, indexed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (filename, size, mtime_ns, title, slide_count, sha256, time.time())
+        )
+
+    def remove(self, filename):
+        self._db().execute('DELETE FROM specs WHERE filename = ?', (filename,))
+
+    def refresh(self, force=False):
+        """Bring the index up to date if the directory may have changed.
+
+        Returns the number of rows added, updated or removed (0 when the
+        check was skipped).
+        """
+        try:
+            dir_mtime = self.root.stat().st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+        due = time.monotonic() - self._checked_at >= self.rescan_interval
+        if not force and not due and self._meta('dir_mtime_ns') == str(dir_mtime):
+            return 0
+
+        with self._scan_lock:
+            changed = self._scan() if dir_mtime is not None else self._clear()
+            self._set_meta('dir_mtime_ns', dir_mtime)
+            self._checked_at = time.monotonic()
+        return changed
+
+    def _clear(self):
+        return self._db().execute('DELETE FROM specs').rowcount
+
+    def _scan(self):
+        db = self._db()
+        indexed = {
+            row[0]: (row[1], row[2])
+            for row in db.execute('SELECT filename, size, mtime_ns FROM specs')
+        }
+        seen = set()
+        changed = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not self._is_spec(entry.name) or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                if indexed.get(entry.name) != (stat.st_size, stat.st_mtime_ns):
+                    try:
+                        self.update(entry.name)
+                    except OSError:
+                        # Deleted or unreadable since the directory listing
+                        seen.discard(entry.name)
+                        continue
+                    changed += 1
+        for filename in indexed.keys() - seen:
+            self.remove(filename)
+            changed += 1
+        return changed
+
+    def list(self, page=1, per_page=20, sort='modified', order='desc', query=''):
+        """One page of indexed specs; returns (files, total)."""
+        self.refresh()
+        column = SORT_COLUMNS.get(sort, SORT_COLUMNS['modified'])
+        direction = 'ASC' if order == 'asc' else 'DESC'
+        where, params = '', []
+        if query:
+            like = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            where = "WHERE title LIKE ? ESCAPE '\\' OR filename LIKE ? ESCAPE '\\'"
+            params = [like, like]
+        db = self._db()
+        total = db.execute(f'SELECT COUNT(*) FROM specs {where}', params).fetchone()[0]
+        rows = db.execute(
+            f'SELECT filename, size, mtime_ns, title, slide_count, sha256 FROM specs {where} '
+            f'ORDER BY {column} {direction}, filename LIMIT ? OFFSET ?',
+            params + [per_page, (page - 1) * per_page]
+        ).fetchall()
+        files = [
+            {
+                'filename': filename,
+                'size': size,
+                'modified': datetime.fromtimestamp(mtime_ns / 1e9).isoformat(),
+                'title': title,
+                'slides': slide_count,
+                'hash': sha256,
+            }
+            for filename, size, mtime_ns, title, slide_count, sha256 in rows
+        ]
+        return files, total
+
+    def stats(self):
+        count, size = self._db().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM specs').fetchone()
+        return {'specs': count, 'bytes': size}
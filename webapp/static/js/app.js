@@ -1,6 +1,7 @@
 // HyFlux PPT Generator - Frontend JavaScript
 
 let currentFilename = null;
+let chatSessionId = null;
 
 // DOM Elements
 const yamlEditor = document.getElementById('yamlEditor');
@@ -112,6 +113,7 @@ async function saveYAML() {
         
         if (data.success) {
             showStatus(`✓ ${data.message}`, 'success');
+            loadSavedFiles(1);
             
             // Also offer to download
             const download = confirm('YAML saved to server. Download a copy?');
@@ -258,7 +260,7 @@ window.addEventListener('load', function() {
     testOllamaConnection();
     
     // Load saved files list
-    loadSavedFiles();
+    loadSavedFiles(1);
 });
 
 // Test Ollama connection
@@ -297,26 +299,41 @@ async function testOllamaConnection() {
     }
 }
 
+// Saved files list: one page at a time, filtered by the search box
+const SAVED_FILES_PER_PAGE = 5;
+const savedFilesSearch = document.getElementById('savedFilesSearch');
+let savedFilesPage = 1;
+let savedFilesSearchTimer = null;
+
+savedFilesSearch.addEventListener('input', function() {
+    clearTimeout(savedFilesSearchTimer);
+    savedFilesSearchTimer = setTimeout(() => loadSavedFiles(1), 250);
+});
+
 // Load saved files list
-async function loadSavedFiles() {
+async function loadSavedFiles(page = savedFilesPage) {
     try {
-        const response = await fetch('/api/saved-files');
+        const query = savedFilesSearch.value.trim();
+        const params = new URLSearchParams({page: page, per_page: SAVED_FILES_PER_PAGE, q: query});
+        const response = await fetch(`/api/saved-files?${params}`);
         const data = await response.json();
         
-        if (data.success && data.files && data.files.length > 0) {
+        if (data.success && (data.total > 0 || query)) {
             const savedFilesCard = document.getElementById('savedFilesCard');
             const savedFilesList = document.getElementById('savedFilesList');
+            savedFilesPage = data.page;
             
             savedFilesCard.style.display = 'block';
             savedFilesList.innerHTML = '';
             
-            data.files.slice(0, 5).forEach(file => {
+            data.files.forEach(file => {
+                const slides = file.slides !== null ? ` • ${file.slides} slides` : '';
                 const fileDiv = document.createElement('div');
                 fileDiv.className = 'saved-file-item';
                 fileDiv.innerHTML = `
                     <div class="file-info">
-                        <strong>${file.filename}</strong>
-                        <span class="file-meta">${formatFileSize(file.size)} • ${formatDate(file.modified)}</span>
+                        <strong>${escapeHtml(file.title || file.filename)}</strong>
+                        <span class="file-meta">${file.title ? escapeHtml(file.filename) + ' • ' : ''}${formatFileSize(file.size)}${slides} • ${formatDate(file.modified)}</span>
                     </div>
                     <div class="file-actions">
                         <button class="btn-small btn-primary" onclick="loadSavedFile('${file.filename}')">
@@ -330,18 +347,43 @@ async function loadSavedFiles() {
                 savedFilesList.appendChild(fileDiv);
             });
             
-            if (data.files.length > 5) {
-                const moreDiv = document.createElement('div');
-                moreDiv.className = 'more-files';
-                moreDiv.textContent = `... and ${data.files.length - 5} more files`;
-                savedFilesList.appendChild(moreDiv);
+            if (data.total === 0) {
+                const emptyDiv = document.createElement('div');
+                emptyDiv.className = 'more-files';
+                emptyDiv.textContent = 'No saved files match your search';
+                savedFilesList.appendChild(emptyDiv);
             }
+            renderSavedFilesPager(data);
         }
     } catch (error) {
         console.log('Could not load saved files:', error);
     }
 }
 
+function renderSavedFilesPager(data) {
+    const pager = document.getElementById('savedFilesPager');
+    pager.innerHTML = '';
+    if (data.pages <= 1) return;
+    
+    const prev = document.createElement('button');
+    prev.className = 'btn-small btn-secondary';
+    prev.innerHTML = '<i class="fas fa-chevron-left"></i>';
+    prev.disabled = data.page <= 1;
+    prev.addEventListener('click', () => loadSavedFiles(data.page - 1));
+    
+    const label = document.createElement('span');
+    label.className = 'file-meta';
+    label.textContent = `Page ${data.page} of ${data.pages} (${data.total} files)`;
+    
+    const next = document.createElement('button');
+    next.className = 'btn-small btn-secondary';
+    next.innerHTML = '<i class="fas fa-chevron-right"></i>';
+    next.disabled = data.page >= data.pages;
+    next.addEventListener('click', () => loadSavedFiles(data.page + 1));
+    
+    pager.append(prev, label, next);
+}
+
 // Load a saved file
 async function loadSavedFile(filename) {
     try {
@@ -384,12 +426,23 @@ function formatDate(isoString) {
 // Chat functionality
 const chatInput = document.getElementById('chatInput');
 const sendChatBtn = document.getElementById('sendChatBtn');
+const draftDeckBtn = document.getElementById('draftDeckBtn');
 const chatMessages = document.getElementById('chatMessages');
 const chatStatus = document.getElementById('chatStatus');
 const modelSelect = document.getElementById('modelSelect');
+const structuredToggle = document.getElementById('structuredToggle');
 
 // Send chat message
 sendChatBtn.addEventListener('click', sendChatMessage);
+draftDeckBtn.addEventListener('click', draftDeck);
+
+// A different model or output mode starts a fresh conversation
+modelSelect.addEventListener('change', function() {
+    chatSessionId = null;
+});
+structuredToggle.addEventListener('change', function() {
+    chatSessionId = null;
+});
 chatInput.addEventListener('keypress', function(e) {
     if (e.key === 'Enter' && !e.shiftKey) {
         e.preventDefault();
@@ -409,49 +462,188 @@ async function sendChatMessage() {
     setChatStatus('Thinking...', 'loading');
     
     try {
-        const response = await fetch('/api/chat', {
+        const response = await fetch('/api/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
                 message: message,
-                model: modelSelect.value
+                model: modelSelect.value,
+                session_id: chatSessionId,
+                structured: structuredToggle.checked
             })
         });
         
-        const data = await response.json();
+        if (!response.ok || !response.body) {
+            const data = await response.json();
+            throw new Error(data.error || response.statusText);
+        }
         
-        if (data.success) {
-            // Render markdown in chat
-            addChatMessage(data.response, 'bot', true); // true = render markdown
-            
-            // If YAML was extracted, auto-populate the editor
-            if (data.yaml_content) {
-                yamlEditor.value = data.yaml_content;
-                showStatus('✓ YAML extracted and loaded into editor', 'success');
-                
-                // Auto-validate
-                setTimeout(() => {
-                    validateYAML();
-                }, 500);
+        // Render tokens into one bot message as they arrive
+        const messageDiv = addChatMessage('', 'bot');
+        const messageText = messageDiv.querySelector('.message-text');
+        let streamedText = '';
+        let yamlLoaded = false;
+        
+        await readEventStream(response, (event, data) => {
+            if (event === 'token') {
+                if (!streamedText) setChatStatus('Receiving...', 'loading');
+                streamedText += data.text;
+                messageText.innerHTML = escapeHtml(streamedText);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (event === 'yaml') {
+                // YAML block closed mid-stream - load it without waiting for the rest
+                if (data.yaml_content) {
+                    yamlLoaded = true;
+                    loadChatYAML(data.yaml_content);
+                }
+            } else if (event === 'done') {
+                chatSessionId = data.session_id;
+                messageText.innerHTML = renderSimpleMarkdown(data.response);
+                if (data.yaml_content && !yamlLoaded) {
+                    loadChatYAML(data.yaml_content);
+                }
+                if (data.timings && data.timings.first_token_ms !== null) {
+                    console.log(`Chat timings (${data.model}):`, data.timings);
+                }
+                if (data.routing) {
+                    console.log(`Chat routed to ${data.model}: ${data.routing.reason}`);
+                }
+                setChatStatus('', '');
+            } else if (event === 'error') {
+                messageText.innerHTML = escapeHtml('Error: ' + data.error);
+                setChatStatus('Error: ' + data.error, 'error');
             }
-            
-            setChatStatus('', '');
-        } else {
-            addChatMessage('Error: ' + data.error, 'bot');
-            setChatStatus('Error: ' + data.error, 'error');
+        });
+    } catch (error) {
+        addChatMessage('Error connecting to Ollama: ' + error.message, 'bot');
+        setChatStatus('Connection error', 'error');
+    } finally {
+        chatInput.disabled = false;
+        sendChatBtn.disabled = false;
+        chatInput.focus();
+    }
+}
+
+// Draft a large deck: outline first, then every slide in parallel
+async function draftDeck() {
+    const message = chatInput.value.trim();
+    if (!message) return;
+    
+    addChatMessage(message, 'user');
+    chatInput.value = '';
+    chatInput.disabled = true;
+    sendChatBtn.disabled = true;
+    draftDeckBtn.disabled = true;
+    setChatStatus('Planning outline...', 'loading');
+    
+    try {
+        const response = await fetch('/api/chat/deck', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                message: message,
+                model: modelSelect.value
+            })
+        });
+        
+        if (!response.ok || !response.body) {
+            const data = await response.json();
+            throw new Error(data.error || response.statusText);
         }
+        
+        const messageDiv = addChatMessage('', 'bot');
+        const messageText = messageDiv.querySelector('.message-text');
+        let outline = [];
+        const drafted = {};
+        
+        const renderProgress = () => {
+            messageText.innerHTML = outline.map((item, i) => {
+                const mark = i in drafted ? (drafted[i] ? '✓' : '⚠️') : '…';
+                return `${mark} ${i + 1}. ${escapeHtml(item.title)} <small>(${item.type})</small>`;
+            }).join('<br>');
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        };
+        
+        await readEventStream(response, (event, data) => {
+            if (event === 'progress') {
+                setChatStatus(`Planning outline... ${data.planned} slides`, 'loading');
+            } else if (event === 'outline') {
+                outline = data.outline;
+                renderProgress();
+                setChatStatus(`Drafting 0/${outline.length} slides...`, 'loading');
+            } else if (event === 'slide') {
+                drafted[data.index] = data.valid;
+                renderProgress();
+                setChatStatus(`Drafting ${data.completed}/${data.total} slides...`, 'loading');
+            } else if (event === 'done') {
+                messageText.innerHTML = renderSimpleMarkdown(data.response);
+                if (data.yaml_content) {
+                    loadChatYAML(data.yaml_content);
+                }
+                console.log(`Deck draft timings (${data.model}):`, data.timings);
+                setChatStatus(data.failed.length ? `Slides needing attention: ${data.failed.join(', ')}` : '', data.failed.length ? 'error' : '');
+            } else if (event === 'error') {
+                messageText.innerHTML = escapeHtml('Error: ' + data.error);
+                setChatStatus('Error: ' + data.error, 'error');
+            }
+        });
     } catch (error) {
         addChatMessage('Error connecting to Ollama: ' + error.message, 'bot');
         setChatStatus('Connection error', 'error');
     } finally {
         chatInput.disabled = false;
         sendChatBtn.disabled = false;
+        draftDeckBtn.disabled = false;
         chatInput.focus();
     }
 }
 
+// Read a text/event-stream response body, calling onEvent(event, data) per frame
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+// Load YAML produced by the assistant into the editor and validate it
+function loadChatYAML(yamlContent) {
+    yamlEditor.value = yamlContent;
+    showStatus('✓ YAML extracted and loaded into editor', 'success');
+    
+    // Auto-validate
+    setTimeout(() => {
+        validateYAML();
+    }, 500);
+}
+
+function escapeHtml(text) {
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/\n/g, '<br>');
+}
+
 function addChatMessage(text, type, renderMarkdown = false) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `chat-message ${type}-message`;
@@ -464,7 +656,7 @@ function addChatMessage(text, type, renderMarkdown = false) {
         content = renderSimpleMarkdown(text);
     } else {
         // Escape HTML and preserve line breaks
-        content = text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/\n/g, '<br>');
+        content = escapeHtml(text);
     }
     
     messageDiv.innerHTML = `
@@ -476,6 +668,7 @@ function addChatMessage(text, type, renderMarkdown = false) {
     
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
 }
 
 function renderSimpleMarkdown(text) {
@@ -542,17 +735,30 @@ async function loadOllamaModels() {
             // Clear existing options
             modelSelect.innerHTML = '';
             
-            // Add available models
+            // Automatic routing picks a fast or strong model per request
+            const routing = data.routing || {};
+            if (routing.enabled) {
+                const option = document.createElement('option');
+                option.value = 'auto';
+                option.textContent = `auto (${routing.fast} / ${routing.strong})`;
+                modelSelect.appendChild(option);
+            }
+            
+            // Add available models, marking those already loaded in memory
+            const loaded = (data.loaded || []).map(name => name.replace(/:latest$/, ''));
+            const isLoaded = model => loaded.includes(model.replace(/:latest$/, ''));
             data.models.forEach(model => {
                 const option = document.createElement('option');
                 option.value = model;
-                option.textContent = model;
+                option.textContent = isLoaded(model) ? `${model} (loaded)` : model;
                 modelSelect.appendChild(option);
             });
             
-            // Set default to first model if available
-            if (data.models.length > 0) {
-                modelSelect.value = data.models[0];
+            // Default to routing, else a loaded model (no cold start), else the first one
+            if (routing.enabled) {
+                modelSelect.value = 'auto';
+            } else {
+                modelSelect.value = data.models.find(isLoaded) || data.models[0];
             }
         }
     } catch (error) {
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Staged repair pipeline for YAML specs in model output.
+
+Model answers wrap the spec in Markdown, split it into several documents,
+forget the presentation header, mis-indent block text or use the wrong value
+shapes. Each of those is handled by one ordered stage:
+
+    extract_fence      pull the ```yaml block (or a YAML-looking plain block)
+    strip_separators   drop --- / ... and keep the document holding the spec
+    inject_header      add a presentation header / slides key when missing
+    fix_indentation    tabs and unindented block-scalar lines (only if parsing fails)
+    quote_values       quote plain values containing ': ' (only if parsing fails)
+    coerce_schema      normalize slide types and field value shapes
+
+The text is parsed lazily and the result is cached per text version, so no
+stage parses more than once and valid YAML is parsed exactly once overall.
+Text is only re-serialized when coerce_schema actually changed the data.
+
+Run as a script to replay a corpus of saved model outputs:
+    python yaml_repair.py corpus_dir/ [chat_responses.sqlite3 ...]
+
+repair_corpus/ holds model outputs covering each stage, with the expected
+outcome of every sample in repair_corpus/expected.json; check them with
+    python yaml_repair.py repair_corpus/ --check
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+# Expected outcome per sample, next to a corpus directory's samples
+EXPECTED_FILE = 'expected.json'
+
+YAML_FENCE_RE = re.compile(r'```yaml\s*\n(.*?)```', re.DOTALL)
+PLAIN_FENCE_RE = re.compile(r'```\s*\n(.*?)```', re.DOTALL)
+TOP_PRESENTATION_RE = re.compile(r'^presentation\s*:', re.MULTILINE)
+TOP_SLIDES_RE = re.compile(r'^slides\s*:', re.MULTILINE)
+BLOCK_SCALAR_RE = re.compile(r'^(\s*)(?:-\s+)?[\w-]+\s*:\s*[|>][-+]?\s*$')
+KEY_LINE_RE = re.compile(r'^\s*(?:-\s+)?[\w-]+\s*:(?:\s|$)')
+PLAIN_VALUE_RE = re.compile(r'^(\s*(?:-\s+)?[\w-]+\s*:\s+)(.+)$')
+
+# Slide fields holding bullet text vs. single-line text
+BULLET_FIELDS = ('content', 'left_content', 'middle_content', 'right_content')
+TEXT_FIELDS = ('title', 'subtitle', 'quote', 'attribution')
+
+
+def dump_yaml(data):
+    return yaml.dump(data, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+
+def default_header():
+    return {
+        'title': 'Generated Presentation',
+        'author': 'User',
+        'date': datetime.now().strftime('%Y-%m-%d'),
+    }
+
+
+def clean_yaml_content(yaml_content):
+    """The spec's YAML documents as one, without --- / ... separator lines.
+
+    Documents holding a top-level presentation or slides key are kept (and
+    joined, for a header and slides split in two); others, such as a
+    metadata preamble, are dropped. Separators only count at column 0, so
+    a --- rule inside block text stays.
+    """
+    if not yaml_content:
+        return None
+
+    documents, current = [], []
+    for line in yaml_content.split('\n'):
+        marker = line.rstrip()
+        if marker == '...' or (3 <= len(marker) <= 5 and marker == '-' * len(marker)):
+            documents.append('\n'.join(current).strip())
+            current = []
+        else:
+            current.append(line)
+    documents.append('\n'.join(current).strip())
+    documents = [document for document in documents if document]
+    if not documents:
+        return ''
+
+    spec_documents = [
+        document for document in documents
+        if TOP_PRESENTATION_RE.search(document) or TOP_SLIDES_RE.search(document)
+    ] or [
+        document for document in documents
+        if 'presentation:' in document or 'slides:' in document
+    ]
+    return '\n\n'.join(spec_documents) if spec_documents else documents[0]
+
+
+class RepairState:
+    """Text being repaired plus its (cached) parse."""
+
+    def __init__(self, text, slide_types):
+        self.text = text
+        self.slide_types = slide_types
+        self.data = None
+        self.modified = False  # data changed since the text was parsed
+        self.parses = 0
+        self._parsed_text = None
+        self._error = None
+
+    def parse(self):
+        """(data, error) for the current text; parses once per text version."""
+        if self._parsed_text is not self.text:
+            self.parses += 1
+            try:
+                self.data, self._error = yaml.safe_load(self.text), None
+            except yaml.YAMLError as e:
+                self.data, self._error = None, e
+            self._parsed_text = self.text
+            self.modified = False
+        return self.data, self._error
+
+    def set_text(self, text):
+        if text != self.text:
+            self.text = text
+            return True
+        return False
+
+
+def extract_fence(state):
+    blocks = YAML_FENCE_RE.findall(state.text)
+    if not blocks:
+        # Try without language tag but check if it looks like YAML
+        for block in PLAIN_FENCE_RE.findall(state.text):
+            if 'slides:' in block or 'presentation:' in block or 'type:' in block:
+                blocks = [block]
+                break
+    if not blocks:
+        state.text = None
+        return False
+    state.text = blocks[0].strip()
+    return True
+
+
+def strip_separators(state):
+    return state.set_text(clean_yaml_content(state.text))
+
+
+def inject_header(state):
+    text = state.text
+    if TOP_PRESENTATION_RE.search(text):
+        return False
+    if not TOP_SLIDES_RE.search(text):
+        if not text.lstrip().startswith('- ') or 'type:' not in text:
+            return False
+        # A bare list of slides
+        text = 'slides:\n' + '\n'.join(f'  {line}' if line.strip() else line for line in text.split('\n'))
+    header = default_header()
+    return state.set_text(
+        f'presentation:\n  title: "{header["title"]}"\n  author: "{header["author"]}"\n'
+        f'  date: "{header["date"]}"\n\n{text}'
+    )
+
+
+def fix_indentation(state):
+    _, error = state.parse()
+    if error is None:
+        return False
+
+    lines = state.text.replace('\t', '  ').split('\n')
+    block_indent = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        indent = len(line) - len(line.lstrip())
+        if block_indent is not None and stripped:
+            if indent > block_indent:
+                pass
+            elif KEY_LINE_RE.match(line):
+                block_indent = None
+            else:
+                # Text that belongs to the block scalar above but lost its indent
+                lines[i] = ' ' * (block_indent + 2) + stripped
+        match = BLOCK_SCALAR_RE.match(line)
+        if match:
+            block_indent = len(match.group(1)) + (2 if line.lstrip().startswith('- ') else 0)
+    return state.set_text('\n'.join(lines))
+
+
+def quote_values(state):
+    _, error = state.parse()
+    if error is None:
+        return False
+
+    lines = state.text.split('\n')
+    for i, line in enumerate(lines):
+        match = PLAIN_VALUE_RE.match(line)
+        if not match:
+            continue
+        value = match.group(2).rstrip()
+        if ': ' in value and value[0] not in '"\'|>[{&*!#':
+            lines[i] = match.group(1) + json.dumps(value, ensure_ascii=False)
+    return state.set_text('\n'.join(lines))
+
+
+def _bullet_text(item):
+    # "- Vans: 40 units" parses as a one-entry mapping
+    if isinstance(item, dict):
+        return ', '.join(f'{key}: {value}' for key, value in item.items())
+    return str(item).strip()
+
+
+def _as_bullets(value):
+    items = [text for text in (_bullet_text(item) for item in value if item is not None) if text]
+    return '\n'.join(item if item.startswith('•') else f'• {item}' for item in items)
+
+
+def coerce_schema(state):
+    data, error = state.parse()
+    if error is not None or not isinstance(data, dict):
+        return False
+
+    changed = False
+    if 'slides' in data and 'presentation' not in data:
+        data['presentation'] = default_header()
+        data = {'presentation': data.pop('presentation'), **data}
+        state.data = data
+        changed = True
+
+    slides = data.get('slides')
+    # Anything but a list (slides: 5, a mapping) is left for the validator to report
+    for slide in slides if isinstance(slides, list) else ():
+        if not isinstance(slide, dict):
+            continue
+        slide_type = slide.get('type')
+        if isinstance(slide_type, str) and slide_type not in state.slide_types:
+            normalized = re.sub(r'[\s-]+', '_', slide_type.strip().lower())
+            if normalized in state.slide_types:
+                slide['type'] = normalized
+                changed = True
+        for field in BULLET_FIELDS:
+            if isinstance(slide.get(field), list):
+                slide[field] = _as_bullets(slide[field])
+                changed = True
+        for field in TEXT_FIELDS:
+            value = slide.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                slide[field] = str(value)
+                changed = True
+
+    if changed:
+        state.modified = True
+    return changed
+
+
+DEFAULT_STAGES = [
+    ('extract_fence', extract_fence),
+    ('strip_separators', strip_separators),
+    ('inject_header', inject_header),
+    ('fix_indentation', fix_indentation),
+    ('quote_values', quote_values),
+    ('coerce_schema', coerce_schema),
+]
+
+
+class RepairPipeline:
+    """Ordered, pluggable repair stages with per-stage cost accounting.
+
+    A stage is fn(state) -> bool (whether it changed anything). Stages edit
+    state.text, or state.data after setting state.modified.
+    """
+
+    def __init__(self, slide_types, stages=None):
+        self.slide_types = frozenset(slide_types)
+        self.stages = list(stages or DEFAULT_STAGES)
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'extracted': 0, 'stages': {}}
+
+    def add_stage(self, name, fn, before=None):
+        """Register a stage, at the end or before the named one."""
+        index = len(self.stages)
+        if before is not None:
+            index = [stage_name for stage_name, _ in self.stages].index(before)
+        self.stages.insert(index, (name, fn))
+
+    def run(self, response):
+        """Return (yaml_text or None, report) for a model response."""
+        started = time.perf_counter()
+        state = RepairState(response, self.slide_types)
+        report = []
+        for name, fn in self.stages:
+            if state.text is None:
+                break
+            stage_started = time.perf_counter()
+            parses = state.parses
+            fired = bool(fn(state))
+            report.append({
+                'stage': name,
+                'fired': fired,
+                'ms': round((time.perf_counter() - stage_started) * 1000, 3),
+                'parses': state.parses - parses,
+            })
+
+        result = None
+        if state.text is not None:
+            if state.modified:
+                # Only re-serialize when a stage changed the structure
+                result = dump_yaml(state.data)
+            else:
+                data, error = state.parse()
+                if error is None and isinstance(data, dict):
+                    result = state.text
+
+        summary = {
+            'ok': result is not None,
+            'fired': [entry['stage'] for entry in report if entry['fired']],
+            'parses': state.parses,
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+            'stages': report,
+        }
+        self._record(summary)
+        return result, summary
+
+    def _record(self, summary):
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['extracted'] += summary['ok']
+            for entry in summary['stages']:
+                stage = self._stats['stages'].setdefault(entry['stage'], {'runs': 0, 'fired': 0, 'ms': 0.0})
+                stage['runs'] += 1
+                stage['fired'] += entry['fired']
+                stage['ms'] = round(stage['ms'] + entry['ms'], 3)
+
+    def stats(self):
+        """Per-stage run/fire counts and cumulative cost (this process)."""
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+
+def load_corpus(paths):
+    """Yield (name, text) for corpus files, directories and chat cache databases."""
+    for path in map(Path, paths):
+        if path.is_dir():
+            for file in sorted(path.iterdir()):
+                if file.suffix in ('.txt', '.md'):
+                    yield file.name, file.read_text(encoding='utf-8')
+        elif path.suffix in ('.sqlite3', '.db'):
+            # Raw model outputs recorded by the chat response cache
+            conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            for key, payload in conn.execute('SELECT key, payload FROM responses ORDER BY created_at'):
+                yield key[:12], json.loads(payload)['raw_response']
+            conn.close()
+        else:
+            yield path.name, path.read_text(encoding='utf-8')
+
+
+def load_expectations(paths):
+    """{sample name: expected outcome} from expected.json in corpus directories."""
+    expected = {}
+    for path in map(Path, paths):
+        if path.is_dir() and (path / EXPECTED_FILE).exists():
+            expected.update(json.loads((path / EXPECTED_FILE).read_text(encoding='utf-8')))
+    return expected
+
+
+def outcome(result, summary, validate):
+    """What --check compares: fired stages, extraction, strict validity, slide types."""
+    slides = yaml.safe_load(result).get('slides') if result else None
+    return {
+        'fired': summary['fired'],
+        'ok': summary['ok'],
+        'valid': bool(result) and validate(result)['valid'],
+        'slide_types': [slide.get('type') if isinstance(slide, dict) else None for slide in slides]
+        if isinstance(slides, list) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay saved model outputs through the YAML repair pipeline."
+    )
+    parser.add_argument('paths', nargs='+',
+                        help="Corpus files, directories of .txt/.md files, or chat_responses.sqlite3")
+    parser.add_argument('--export', metavar='DIR',
+                        help="Also write every sample to DIR as <name>.txt (to freeze a corpus)")
+    parser.add_argument('--check', action='store_true',
+                        help=f"Compare each sample with the corpus' {EXPECTED_FILE}; exit 1 on any difference")
+    args = parser.parse_args()
+
+    from slide_schema import VALID_SLIDE_TYPES, validate_yaml_strict
+
+    pipeline = RepairPipeline(VALID_SLIDE_TYPES)
+    export_dir = Path(args.export) if args.export else None
+    if export_dir:
+        export_dir.mkdir(parents=True, exist_ok=True)
+
+    expected = load_expectations(args.paths) if args.check else {}
+    mismatches = []
+    total = valid = 0
+    for name, text in load_corpus(args.paths):
+        total += 1
+        if export_dir:
+            (export_dir / f'{Path(name).stem}.txt').write_text(text, encoding='utf-8')
+        result, summary = pipeline.run(text)
+        got = outcome(result, summary, validate_yaml_strict)
+        valid += got['valid']
+        status = 'valid' if got['valid'] else ('extracted' if result else 'FAILED')
+        print(f"{name:<40} {status:<10} parses={summary['parses']} {summary['ms']:>8.2f} ms  "
+              f"{', '.join(summary['fired'])}")
+        if args.check:
+            want = expected.pop(name, None)
+            if want is None:
+                mismatches.append(f"{name}: no expected outcome in {EXPECTED_FILE}")
+            elif got != want:
+                mismatches.append(f"{name}: expected {want}, got {got}")
+    mismatches += [f"{name}: expected sample not found" for name in expected]
+
+    print(f"\n{valid}/{total} samples produced valid YAML\n")
+    print(f"{'Stage':<18} {'Fired':>7} {'Runs':>7} {'Total ms':>10}")
+    for name, stage in pipeline.stats()['stages'].items():
+        print(f"{name:<18} {stage['fired']:>7} {stage['runs']:>7} {stage['ms']:>10.2f}")
+
+    if args.check:
+        print()
+        for mismatch in mismatches:
+            print(f"MISMATCH {mismatch}")
+        print(f"Check: {total - len(mismatches)}/{total} samples as expected" if not mismatches
+              else f"Check failed: {len(mismatches)} mismatch(es)")
+        return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())